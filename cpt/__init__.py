@@ -8,3 +8,16 @@ def get_client_version():
     from os import getenv
     # It is a mess comparing dev versions, lets assume that the -dev is the further release
     return Version(client_version.replace("-dev", ""))
+
+
+# Imported on first access, "import cpt" doesn't import the Conan API
+_lazy_attributes = {"ConanMultiPackager": "cpt.packager"}
+
+
+def __getattr__(name):
+    # Module __getattr__ needs Python >= 3.7, use "from cpt.packager import ..." otherwise
+    module_name = _lazy_attributes.get(name)
+    if module_name is None:
+        raise AttributeError("module 'cpt' has no attribute '%s'" % name)
+    import importlib
+    return getattr(importlib.import_module(module_name), name)
@@ -0,0 +1,93 @@
+import hashlib
+import os
+
+from conans.errors import ConanException, ConanInvalidConfiguration
+
+from cpt.compat import get_compat
+from cpt.profiles import get_profiles, patch_default_base_profile, save_profile_to_tmp
+
+INVALID_PACKAGE_ID = "INVALID"
+
+# Shared by all the analyzers of the process, several packagers can build the same recipe
+_package_ids = {}
+_recipe_hashes = {}
+
+
+def get_recipe_hash(conanfile_path):
+    if not os.path.exists(conanfile_path):
+        return None
+    with open(conanfile_path, "rb") as conanfile:
+        return hashlib.sha1(conanfile.read()).hexdigest()
+
+
+class BuildAnalyzer(object):
+    """ Computes in-process, loading the dependency graph of the recipe without building
+    anything, the package ID of the configurations. Evaluating the graph runs the configure()
+    and validate() methods of the recipe, so the configurations it rejects are detected too.
+    The results are memoized by recipe hash and profile"""
+
+    def __init__(self, conan_api, conanfile_path, printer, client_cache=None,
+                 base_profile_name=None):
+        self._conan_api = conan_api
+        self._conanfile_path = conanfile_path
+        self._printer = printer
+        self._client_cache = client_cache
+        self._base_profile_name = base_profile_name
+        self._recipe_hash = get_recipe_hash(conanfile_path)
+
+    def _get_profiles(self, build):
+        # The recipe may take its name from the reference, so the options of the package being
+        # built are passed unscoped, they are applied to the consumer conanfile
+        name = build.reference.name if build.reference else None
+        options = {}
+        for option, value in build.options.items():
+            scope, _, unscoped = option.partition(":")
+            options[unscoped if unscoped and scope == name else option] = value
+        profile_text, base_profile_text = get_profiles(self._client_cache,
+                                                       build._replace(options=options),
+                                                       self._base_profile_name)
+        return profile_text, base_profile_text
+
+    def package_id(self, build):
+        """ Package ID of the configuration, INVALID_PACKAGE_ID when the recipe rejects it and
+        None when it can't be computed"""
+        profile_text, base_profile_text = self._get_profiles(build)
+        key = (self._conanfile_path, self._recipe_hash, profile_text, base_profile_text)
+        if key not in _package_ids:
+            _package_ids[key] = self._compute_package_id(profile_text)
+        return _package_ids[key]
+
+    def exported_recipe_hash(self, reference):
+        """ Manifest hash of the recipe exported to the local cache as 'reference', the packages
+        in a remote are built from it only if the recipe there has the same hash. None when it
+        can't be exported"""
+        key = (self._conanfile_path, self._recipe_hash, str(reference))
+        if key not in _recipe_hashes:
+            _recipe_hashes[key] = self._export(reference)
+        return _recipe_hashes[key]
+
+    def _export(self, reference):
+        try:
+            self._conan_api.export(self._conanfile_path, reference.name, reference.version,
+                                   reference.user, reference.channel)
+            return get_compat().recipe_hash(self._conan_api, reference)
+        except ConanException as exc:
+            self._printer.print_message("Can't export the recipe '%s': %s" % (reference, exc))
+            return None
+
+    def is_valid(self, build):
+        return self.package_id(build) != INVALID_PACKAGE_ID
+
+    def _compute_package_id(self, profile_text):
+        profile_abs_path = save_profile_to_tmp(profile_text)
+        patch_default_base_profile(self._conan_api, profile_abs_path)
+        try:
+            graph, _ = self._conan_api.info(self._conanfile_path,
+                                            profile_names=[profile_abs_path])
+        except ConanInvalidConfiguration:
+            return INVALID_PACKAGE_ID
+        except ConanException as exc:
+            self._printer.print_message("Can't compute the package ID of the configuration: %s"
+                                        % exc)
+            return None
+        return graph.root.package_id
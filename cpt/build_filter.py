@@ -0,0 +1,164 @@
+import fnmatch
+import re
+
+from conans.model.version import Version
+
+_token_pattern = re.compile(r"""\s*(?:
+    (?P<string>"[^"]*"|'[^']*')|
+    (?P<operator>==|!=|>=|<=|=|>|<|~|\(|\)|,)|
+    (?P<word>[^\s()=!<>~,"']+)
+)""", re.VERBOSE)
+
+_keywords = ("and", "or", "not", "in")
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _token_pattern.match(expression, position)
+        if not match or match.end() == position:
+            raise Exception("Invalid build filter '%s': unexpected '%s'"
+                            % (expression, expression[position:]))
+        position = match.end()
+        if match.group("string"):
+            tokens.append(("value", match.group("string")[1:-1]))
+        elif match.group("operator"):
+            tokens.append(("operator", match.group("operator")))
+        elif match.group("word").lower() in _keywords:
+            tokens.append(("keyword", match.group("word").lower()))
+        else:
+            tokens.append(("value", match.group("word")))
+    return tokens
+
+
+def _getter(name):
+    """ Function returning the value of a field of a build: 'reference', an option ('options.'
+    prefix or a 'pkg:option' name) or a setting (optional 'settings.' prefix)"""
+    if name == "reference":
+        return lambda build: str(build.reference) if build.reference else None
+    if name.startswith("options."):
+        name = name[len("options."):]
+        return lambda build: build.options.get(name)
+    if ":" in name:
+        return lambda build: build.options.get(name)
+    if name.startswith("settings."):
+        name = name[len("settings."):]
+    return lambda build: build.settings.get(name)
+
+
+def _compare(operator, value, expected):
+    if operator == "in":
+        return value is not None and str(value) in expected
+    if value is None:
+        return operator == "!="
+    value = str(value)
+    if operator in ("=", "=="):
+        return value == expected
+    if operator == "!=":
+        return value != expected
+    if operator == "~":
+        return fnmatch.fnmatchcase(value, expected)
+    value, expected = Version(value), Version(expected)
+    return {">": value > expected, ">=": value >= expected,
+            "<": value < expected, "<=": value <= expected}[operator]
+
+
+class _Parser(object):
+    """ Recursive descent parser of the filter expressions, it returns a predicate"""
+
+    def __init__(self, expression):
+        self._expression = expression
+        self._tokens = _tokenize(expression)
+        self._position = 0
+
+    def _error(self, message):
+        return Exception("Invalid build filter '%s': %s" % (self._expression, message))
+
+    def _peek(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+        return None, None
+
+    def _next(self, kind=None, value=None):
+        token = self._peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            raise self._error("expected %s, found %s" % (value or kind or "more",
+                                                         token[1] or "the end"))
+        self._position += 1
+        return token[1]
+
+    def parse(self):
+        predicate = self._or()
+        if self._peek()[0] is not None:
+            raise self._error("unexpected '%s'" % self._peek()[1])
+        return predicate
+
+    def _or(self):
+        predicates = [self._and()]
+        while self._peek() == ("keyword", "or"):
+            self._next()
+            predicates.append(self._and())
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda build: any(predicate(build) for predicate in predicates)
+
+    def _and(self):
+        predicates = [self._not()]
+        while self._peek() == ("keyword", "and"):
+            self._next()
+            predicates.append(self._not())
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda build: all(predicate(build) for predicate in predicates)
+
+    def _not(self):
+        if self._peek() == ("keyword", "not"):
+            self._next()
+            predicate = self._not()
+            return lambda build: not predicate(build)
+        if self._peek() == ("operator", "("):
+            self._next()
+            predicate = self._or()
+            self._next("operator", ")")
+            return predicate
+        return self._comparison()
+
+    def _comparison(self):
+        getter = _getter(self._next("value"))
+        kind, operator = self._peek()
+        if (kind, operator) == ("keyword", "in"):
+            self._next()
+            self._next("operator", "(")
+            expected = set([self._next("value")])
+            while self._peek() == ("operator", ","):
+                self._next()
+                expected.add(self._next("value"))
+            self._next("operator", ")")
+        elif kind == "operator" and operator not in ("(", ")", ","):
+            self._next()
+            expected = self._next("value")
+            if operator in (">", ">=", "<", "<="):
+                Version(expected)
+        else:
+            raise self._error("expected a comparison operator, found %s"
+                              % (operator or "the end"))
+        return lambda build: _compare(operator, getter(build), expected)
+
+
+_compiled = {}
+
+
+def compile_build_filter(expression):
+    """ Predicate of the builds matching the expression, e.g.
+    "compiler=gcc and compiler.version>=9 and (arch=x86_64 or lib:shared=True)"
+
+    The fields are the settings, the options ("pkg:option" or "options.pkg:option") and the
+    reference. Operators: = (or ==), !=, ~ (wildcards: compiler.version~1*), in (values, ...),
+    and >, >=, <, <= that compare versions. They are combined with and, or, not and
+    parentheses. The values can be quoted, a field that the build doesn't have only
+    matches != """
+    if expression not in _compiled:
+        _compiled[expression] = _Parser(expression).parse()
+    return _compiled[expression]
@@ -0,0 +1,213 @@
+from collections import OrderedDict
+
+import six
+
+from cpt.builds_generator import BuildConf, _shared_map
+
+
+def _axis(key):
+    """ ("options", name) for the option keys, "pkg:option" or "options.pkg:option", otherwise
+    ("settings", name)"""
+    if key.startswith("options."):
+        return "options", key[len("options."):]
+    if ":" in key:
+        return "options", key
+    return "settings", key
+
+
+def _normalize(value):
+    # Selectors can use strings or values, e.g. {"compiler.version": 9, "lib:shared": True}
+    return None if value is None else str(value)
+
+
+def _axis_value(build, axis):
+    kind, name = axis
+    return _normalize(getattr(build, kind).get(name))
+
+
+def _selector_values(value):
+    if isinstance(value, (list, tuple, set)):
+        return set(_normalize(item) for item in value)
+    return {_normalize(value)}
+
+
+def _merger(new_values):
+    """ Function adding the new values to a field of the builds. Equal fields are shared by the
+    builds, so every distinct field is merged only once"""
+    merged = {}
+
+    def merge(fields):
+        if not new_values:
+            return fields
+        result = merged.get(id(fields))
+        if result is None:
+            values = dict(fields)
+            values.update(new_values)
+            # The original fields are kept so their id can't be reused by another dict
+            result = merged[id(fields)] = (fields, _shared_map(values))
+        return result[1]
+    return merge
+
+
+def selector_predicate(selector):
+    """ Predicate equivalent to a selector, for the builds that are not in a BuildMatrix"""
+    conditions = [(_axis(key), _selector_values(value)) for key, value in selector.items()]
+
+    def predicate(build):
+        return all(_axis_value(build, axis) in values for axis, values in conditions)
+    return predicate
+
+
+class BuildMatrix(object):
+    """ Ordered collection of build configurations with an index per setting and option. A
+    selector like {"compiler": "gcc", "arch": ["x86", "armv8"]} is resolved intersecting the
+    indexes of its axes, and the matching builds are removed or updated without scanning the
+    rest. The index of an axis is built the first time a selector uses it"""
+
+    _kinds = ("settings", "options")
+
+    def __init__(self, builds=None):
+        self._builds = OrderedDict()
+        self._next_id = 0
+        # Equal settings and options dicts are shared by the builds, the ids are grouped by dict
+        # so the indexes are computed once per distinct dict and not once per build
+        self._groups = {kind: {} for kind in self._kinds}
+        self._indexes = {}
+        self._list = None
+        if builds:
+            self.extend(builds)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __len__(self):
+        return len(self._builds)
+
+    def __bool__(self):
+        return len(self._builds) > 0
+
+    __nonzero__ = __bool__
+
+    def to_list(self):
+        if self._list is None:
+            self._list = list(six.itervalues(self._builds))
+        return self._list
+
+    def append(self, build):
+        build_id = self._next_id
+        self._next_id += 1
+        self._builds[build_id] = build
+        for kind in self._kinds:
+            self._add_to_group(kind, getattr(build, kind), build_id)
+        for axis, index in self._indexes.items():
+            index.setdefault(_axis_value(build, axis), set()).add(build_id)
+        self._list = None
+
+    def extend(self, builds):
+        if self._indexes:
+            for build in builds:
+                self.append(build)
+            return
+        # Bulk path, without indexes only the groups have to be maintained
+        stored = self._builds
+        settings_groups, options_groups = self._groups["settings"], self._groups["options"]
+        build_id = self._next_id
+        for build in builds:
+            stored[build_id] = build
+            for groups, fields in ((settings_groups, build.settings),
+                                   (options_groups, build.options)):
+                group = groups.get(id(fields))
+                if group is None:
+                    groups[id(fields)] = group = (fields, set())
+                group[1].add(build_id)
+            build_id += 1
+        self._next_id = build_id
+        self._list = None
+
+    def _add_to_group(self, kind, fields, build_id):
+        groups = self._groups[kind]
+        group = groups.get(id(fields))
+        if group is None:
+            # The group keeps a reference to the dict, so its id can't be reused meanwhile
+            groups[id(fields)] = group = (fields, set())
+        group[1].add(build_id)
+
+    def _remove_from_group(self, kind, fields, build_id):
+        groups = self._groups[kind]
+        ids = groups[id(fields)][1]
+        ids.discard(build_id)
+        if not ids:
+            del groups[id(fields)]
+
+    def _index(self, axis):
+        index = self._indexes.get(axis)
+        if index is None:
+            kind, name = axis
+            index = {}
+            for fields, ids in six.itervalues(self._groups[kind]):
+                index.setdefault(_normalize(fields.get(name)), set()).update(ids)
+            self._indexes[axis] = index
+        return index
+
+    def _select(self, selector):
+        matches = []
+        for key, value in selector.items():
+            index = self._index(_axis(key))
+            values = _selector_values(value)
+            if len(values) == 1:
+                # Not copied, the intersection below creates a new set
+                matches.append(index.get(values.pop(), set()))
+            else:
+                matches.append(set().union(*[index.get(item, ()) for item in values]))
+        if not matches:
+            return list(self._builds)
+        matches.sort(key=len)
+        result = set(matches[0]).intersection(*matches[1:])
+        return sorted(result)
+
+    def select(self, selector):
+        """ Builds matching all the axes of the selector, in order"""
+        return [self._builds[build_id] for build_id in self._select(selector)]
+
+    def remove(self, selector):
+        """ Removes the builds matching the selector, returns how many"""
+        ids = self._select(selector)
+        for build_id in ids:
+            build = self._builds.pop(build_id)
+            for kind in self._kinds:
+                self._remove_from_group(kind, getattr(build, kind), build_id)
+            for axis, index in self._indexes.items():
+                index[_axis_value(build, axis)].discard(build_id)
+        if ids:
+            self._list = None
+        return len(ids)
+
+    def update(self, selector, settings=None, options=None, env_vars=None, build_requires=None,
+               reference=None):
+        """ Replaces the builds matching the selector with updated copies, returns how many"""
+        ids = self._select(selector)
+        merge_settings, merge_options = _merger(settings), _merger(options)
+        merge_env_vars, merge_build_requires = _merger(env_vars), _merger(build_requires)
+        for build_id in ids:
+            build = self._builds[build_id]
+            updated = BuildConf(merge_settings(build.settings), merge_options(build.options),
+                                merge_env_vars(build.env_vars),
+                                merge_build_requires(build.build_requires),
+                                reference or build.reference)
+            self._builds[build_id] = updated
+            for kind in self._kinds:
+                old_fields, new_fields = getattr(build, kind), getattr(updated, kind)
+                if old_fields is new_fields:
+                    continue
+                self._remove_from_group(kind, old_fields, build_id)
+                self._add_to_group(kind, new_fields, build_id)
+                for (index_kind, name), index in self._indexes.items():
+                    if index_kind != kind:
+                        continue
+                    old_value, new_value = old_fields.get(name), new_fields.get(name)
+                    if old_value != new_value:
+                        index[_normalize(old_value)].discard(build_id)
+                        index.setdefault(_normalize(new_value), set()).add(build_id)
+        if ids:
+            self._list = None
+        return len(ids)
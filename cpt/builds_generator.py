@@ -1,9 +1,15 @@
 import copy
+import hashlib
+import json
 import os
+import weakref
 from collections import namedtuple
+from itertools import islice, product
 
+from six.moves import intern
 from conans.model.ref import ConanFileReference
 from conans.model.version import Version
+from cpt.constraints import ConstraintMatrix, Exclude, MatrixChain, Require
 from cpt.tools import split_colon_env, transform_list_options_to_dict
 
 default_gcc_versions = ["4.9", "5", "6", "7", "8", "9", "10", "11"]
@@ -57,12 +63,14 @@ class BuildGenerator(object):
     def __init__(self, reference, os_name, gcc_versions, apple_clang_versions, clang_versions,
                  visual_versions, visual_runtimes, visual_toolsets, vs10_x86_64_enabled,
                  msvc_versions, msvc_runtimes, msvc_runtime_types,
-                 mingw_configurations, archs, allow_gcc_minors, build_types, options, cppstds):
+                 mingw_configurations, archs, allow_gcc_minors, build_types, options, cppstds,
+                 rules=None):
 
         self._visual_toolsets = visual_toolsets
         self._os_name = os_name
         self._reference = reference
         self._vs10_x86_64_enabled = vs10_x86_64_enabled
+        self._rules = rules or []
         self._allow_gcc_minors = allow_gcc_minors or os.getenv("CONAN_ALLOW_GCC_MINORS", False)
 
         self._clang_versions = clang_versions or split_colon_env("CONAN_CLANG_VERSIONS")
@@ -167,53 +175,214 @@ won't be able to use them.
 
     def get_builds(self, pure_c, shared_option_name, dll_with_static_runtime, reference=None,
                    build_all_options_values=None):
+        return list(self.iter_builds(pure_c, shared_option_name, dll_with_static_runtime,
+                                     reference, build_all_options_values))
 
+    def iter_builds(self, pure_c, shared_option_name, dll_with_static_runtime, reference=None,
+                    build_all_options_values=None):
+        """ Generates the configurations one by one, without materializing the full matrix"""
+        return iter(self.builds_matrix(pure_c, shared_option_name, dll_with_static_runtime,
+                                       reference, build_all_options_values))
+
+    def count_builds(self, pure_c, shared_option_name, dll_with_static_runtime, reference=None,
+                     build_all_options_values=None):
+        """ Number of configurations, counted without generating them"""
+        return self.builds_matrix(pure_c, shared_option_name, dll_with_static_runtime,
+                                  reference, build_all_options_values).count()
+
+    def ignored_rules(self, builds):
+        """ The rules of the generator that all the matrices of 'builds' ignore, because none of
+        them has all the settings and options of the rule"""
+        ignored = getattr(builds, "ignored_rules", None) or []
+        return [rule for rule in self._rules if rule in ignored]
+
+    def builds_matrix(self, pure_c, shared_option_name, dll_with_static_runtime, reference=None,
+                      build_all_options_values=None):
+        """ Sized and re-iterable matrix of the configurations, the combinations excluded by the
+        rules are pruned while they are enumerated"""
         ref = reference or self._reference
+        rules = self._rules
 
         if self._os_name == "Windows":
             if self._mingw_configurations:
-                builds = get_mingw_builds(self._mingw_configurations,
-                                          get_mingw_package_reference(), self._archs,
-                                          shared_option_name, self._build_types, self._cppstds,
-                                          self._options, ref, build_all_options_values)
+                builds = mingw_matrix(self._mingw_configurations, get_mingw_package_reference(),
+                                      self._archs, shared_option_name, self._build_types,
+                                      self._cppstds, self._options, ref,
+                                      build_all_options_values, rules)
             elif self._msvc_versions:
-                builds = get_msvc_builds(self._msvc_versions, self._archs,
-                                         self._msvc_runtimes, self._msvc_runtime_types,
-                                         shared_option_name, dll_with_static_runtime, self._build_types,
-                                         self._cppstds, self._options, ref,
-                                         build_all_options_values)
+                builds = msvc_matrix(self._msvc_versions, self._archs, self._msvc_runtimes,
+                                     self._msvc_runtime_types, shared_option_name,
+                                     dll_with_static_runtime, self._build_types, self._cppstds,
+                                     self._options, ref, build_all_options_values, rules)
             else:
                 builds = []
-            builds.extend(get_visual_builds(self._visual_versions, self._archs,
-                                            self._visual_runtimes, self._visual_toolsets,
-                                            shared_option_name, dll_with_static_runtime,
-                                            self._vs10_x86_64_enabled,
-                                            self._build_types, self._cppstds, self._options, ref,
-                                            build_all_options_values))
-            return builds
+            return MatrixChain(builds, visual_matrix(self._visual_versions, self._archs,
+                                                     self._visual_runtimes, self._visual_toolsets,
+                                                     shared_option_name, dll_with_static_runtime,
+                                                     self._vs10_x86_64_enabled,
+                                                     self._build_types, self._cppstds,
+                                                     self._options, ref,
+                                                     build_all_options_values, rules))
         elif self._os_name == "Linux":
-            builds = get_linux_gcc_builds(self._gcc_versions, self._archs, shared_option_name,
-                                          pure_c, self._build_types, self._cppstds, self._options, ref,
-                                          build_all_options_values)
-            builds.extend(get_linux_clang_builds(self._clang_versions, self._archs,
-                                                 shared_option_name, pure_c, self._build_types,
-                                                 self._cppstds, self._options, ref,
-                                                 build_all_options_values))
-            return builds
+            builds = linux_gcc_matrix(self._gcc_versions, self._archs, shared_option_name,
+                                      pure_c, self._build_types, self._cppstds, self._options, ref,
+                                      build_all_options_values, rules)
+            return MatrixChain(builds, linux_clang_matrix(self._clang_versions, self._archs,
+                                                          shared_option_name, pure_c,
+                                                          self._build_types, self._cppstds,
+                                                          self._options, ref,
+                                                          build_all_options_values, rules))
         elif self._os_name == "Darwin":
-            return get_osx_apple_clang_builds(self._apple_clang_versions, self._archs,
-                                              shared_option_name, pure_c, self._build_types,
-                                              self._cppstds,  self._options, ref,
-                                              build_all_options_values)
+            return osx_apple_clang_matrix(self._apple_clang_versions, self._archs,
+                                          shared_option_name, pure_c, self._build_types,
+                                          self._cppstds,  self._options, ref,
+                                          build_all_options_values, rules)
         elif self._os_name == "FreeBSD":
-            return get_linux_clang_builds(self._clang_versions, self._archs, shared_option_name,
-                                          pure_c, self._build_types, self._cppstds, self._options,
-                                          ref, build_all_options_values)
+            return linux_clang_matrix(self._clang_versions, self._archs, shared_option_name,
+                                      pure_c, self._build_types, self._cppstds, self._options,
+                                      ref, build_all_options_values, rules)
         else:
             raise Exception("Unknown operating system: %s" % self._os_name)
 
 
+class OptionsProduct(object):
+    """ All the combinations of the values of the options, {"name": [values]}. It can be
+    iterated many times, and the combinations are generated on every iteration"""
+
+    def __init__(self, options):
+        self._options = options
+
+    def __iter__(self):
+        for values in product(*self._options.values()):
+            yield dict(zip(self._options, values))
+
+    def __len__(self):
+        length = 1
+        for values in self._options.values():
+            length *= len(values)
+        return length
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+
+class LazyBuilds(object):
+    """ Configurations generated by 'function' every time they are iterated, so they are never
+    all in memory"""
+
+    def __init__(self, function, *args, **kwargs):
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+
+    def __iter__(self):
+        return iter(self._function(*self._args, **self._kwargs))
+
+
+def iter_updated_builds(builds, **values):
+    for build in builds:
+        yield build.updated(**values)
+
+
+def get_all_options_values(conanfile, name, shared_option_name, build_all_options_values):
+    """ All the combinations of the values of the recipe options in 'build_all_options_values'
+    (['foo:opt', 'foo:bar']), or the list itself without recipe. 'conanfile' is the recipe
+    class or its metadata"""
+    # filter only valid options
+    raw_options_for_building = [opt[opt.find(":") + 1:] for opt in build_all_options_values]
+    for raw_option in reversed(raw_options_for_building):
+        if hasattr(conanfile, "options") and conanfile.options and \
+           not isinstance(conanfile.options.get(raw_option), list):
+            raw_options_for_building.remove(raw_option)
+    if raw_options_for_building and conanfile:
+        # get option and its values
+        cloned_options = copy.copy(conanfile.options)
+        for key, value in conanfile.options.items():
+            if key == "shared" and shared_option_name:
+                continue
+            elif key not in raw_options_for_building:
+                del cloned_options[key]
+        cloned_options2 = {}
+        for key, value in cloned_options.items():
+            # add package reference to the option name
+            if not key.startswith("{}:".format(name)):
+                cloned_options2["{}:{}".format(name, key)] = value
+        # combine all options x values (cartesian product), generated when iterated
+        return OptionsProduct(cloned_options2)
+    return build_all_options_values
+
+
+def get_header_only_builds(conanfile, name, builds):
+    """ The builds added for the 'header_only' option of the recipe: the builds without it when
+    the recipe is header only by default, otherwise a single header only build. None if the
+    recipe has no 'header_only' option"""
+    if not (hasattr(conanfile, "options") and conanfile.options and
+            "header_only" in conanfile.options):
+        return None
+    header_only_option = "%s:header_only" % name
+    if conanfile.default_options.get("header_only"):
+        return LazyBuilds(iter_updated_builds, builds, options={header_only_option: False})
+    return LazyBuilds(iter_updated_builds, LazyBuilds(islice, builds, 1),
+                      options={header_only_option: True})
+
+
+class FrozenDict(dict):
+    """ Read-only and hashable dict used for the fields of BuildConf, the keys are interned"""
+
+    __slots__ = ("_hash", "__weakref__")
+
+    def __init__(self, *args, **kwargs):
+        items = dict(*args, **kwargs)
+        super(FrozenDict, self).__init__((intern(key) if isinstance(key, str) else key, value)
+                                         for key, value in items.items())
+        self._hash = None
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("The build configurations are immutable, use 'update_build_if()' or "
+                        "'BuildConf.updated()' to modify them")
+
+    __setitem__ = __delitem__ = update = pop = popitem = clear = setdefault = _immutable
+
+    def __hash__(self):
+        if self._hash is None:
+            # The build_requires values are lists
+            self._hash = hash(frozenset((key, tuple(value) if isinstance(value, list) else value)
+                                        for key, value in self.items()))
+        return self._hash
+
+    def __reduce__(self):
+        return self.__class__, (dict(self), )
+
+    def __copy__(self):
+        # Same as dict.copy(), a mutable copy to build new configurations
+        return dict(self)
+
+
+# Equal maps are shared by all the configurations, most of them have the same options, env_vars
+# and build_requires
+_shared_maps = weakref.WeakValueDictionary()
+
+
+def _shared_map(values):
+    frozen = values if isinstance(values, FrozenDict) else FrozenDict(values)
+    # Keyed with the types of the values, True == 1 and 9 == 9.0 but the profiles are different
+    key = frozenset((name, type(value),
+                     tuple((type(item), item) for item in value) if isinstance(value, list)
+                     else value)
+                    for name, value in frozen.items())
+    shared = _shared_maps.get(key)
+    if shared is None:
+        _shared_maps[key] = shared = frozen
+    return shared
+
+
 class BuildConf(namedtuple("BuildConf", "settings options env_vars build_requires reference")):
+    """ Immutable build configuration. The settings, options, env_vars and build_requires fields
+    are hashable read-only dicts, equal ones are shared between configurations"""
+
+    __slots__ = ()
 
     def __new__(cls, settings, options, env_vars, build_requires, reference):
         if not isinstance(settings, dict):
@@ -231,374 +400,309 @@ class BuildConf(namedtuple("BuildConf", "settings options env_vars build_require
         if isinstance(reference, str):
             reference = ConanFileReference.loads(reference)
 
-        return super(BuildConf, cls).__new__(cls, settings, options, env_vars, build_requires,
+        return super(BuildConf, cls).__new__(cls, _shared_map(settings), _shared_map(options),
+                                             _shared_map(env_vars), _shared_map(build_requires),
                                              reference)
 
+    @classmethod
+    def _make(cls, iterable):
+        return cls(*iterable)
+
+    def _replace(self, **kwargs):
+        values = self._asdict()
+        values.update(kwargs)
+        return BuildConf(**values)
+
+    def updated(self, settings=None, options=None, env_vars=None, build_requires=None,
+                reference=None):
+        """ New configuration with the given values added to the ones of this configuration"""
+        def merge(current, new_values):
+            if not new_values:
+                return current
+            merged = dict(current)
+            merged.update(new_values)
+            return merged
+
+        return BuildConf(merge(self.settings, settings), merge(self.options, options),
+                         merge(self.env_vars, env_vars),
+                         merge(self.build_requires, build_requires),
+                         reference or self.reference)
+
+    def content_hash(self):
+        """ Stable hash of the configuration contents, the same in every process and machine"""
+        # The build requires are references (named tuples, dumped as lists), or strings
+        build_requires = {pattern: [str(item) for item in items]
+                          for pattern, items in self.build_requires.items()}
+        content = json.dumps([self.settings, self.options, self.env_vars, build_requires,
+                              str(self.reference) if self.reference else None],
+                             sort_keys=True, default=str)
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def remove_duplicated_builds(builds):
+    """ The builds without the repeated configurations, keeping the first occurrence"""
+    seen = set()
+    unique = []
+    for build in builds:
+        if build not in seen:
+            seen.add(build)
+            unique.append(build)
+    return unique
+
+
+def _options_axes(shared_option_name, build_all_options_values):
+    if shared_option_name and not build_all_options_values:
+        return [(shared_option_name, [False, True])]
+    elif build_all_options_values:
+        return [("options", build_all_options_values)]
+    return []
+
+
+def _builds_maker(options, option_names, build_requires, reference):
+    """ Converts the values of the axes of a matrix into a BuildConf. The 'options' axis has
+    several option values, the None values are not assigned"""
+    def make(values):
+        settings = {}
+        build_options = dict(options)
+        build_options.update(values.get("options") or {})
+        for name, value in values.items():
+            if name in option_names:
+                if value is not None:
+                    build_options[name] = value
+            elif name != "options" and value:
+                settings[name] = value
+        return BuildConf(settings, build_options, {}, build_requires, reference)
+    return make
+
+
+def mingw_matrix(mingw_configurations, mingw_installer_reference, archs, shared_option_name,
+                 build_types, cppstds, options, reference=None, build_all_options_values=None,
+                 rules=None):
+    configurations = [(version[0:3], arch, exception, thread)
+                      for version, arch, exception, thread in mingw_configurations]
+    axes = [("compiler", ["gcc"]),
+            (("compiler.version", "arch", "compiler.exception", "compiler.threads"),
+             configurations)]
+    axes.extend(_options_axes(shared_option_name, build_all_options_values))
+    axes.extend([("build_type", build_types),
+                 ("compiler.cppstd", cppstds),
+                 ("compiler.libcxx", ["libstdc++"])])
+    mingw_rules = [Require({}, {"arch": archs})]
+    return ConstraintMatrix(axes, mingw_rules + list(rules or []),
+                            _builds_maker(options, [shared_option_name],
+                                          {"*": [mingw_installer_reference]}, reference))
+
+
+def iter_mingw_builds(*args, **kwargs):
+    return iter(mingw_matrix(*args, **kwargs))
+
+
+def _visual_matrix(visual_versions, archs, toolsets, visual_runtimes, shared_option_name,
+                   dll_with_static_runtime, build_types, cppstds, options, reference,
+                   build_all_options_values, rules):
+    debug_builds = ["Debug"]
+    release_builds = ["Release", "RelWithDebInfo", "MinSizeRel"]
+    static_runtimes = ["MT", "MTd"]
+    visual_rules = [Require({"compiler.runtime": ["MTd", "MDd"]}, {"build_type": debug_builds}),
+                    Require({"compiler.runtime": ["MT", "MD"]}, {"build_type": release_builds})]
+
+    axes = [("compiler", ["Visual Studio"]),
+            ("compiler.version", visual_versions),
+            ("arch", archs),
+            ("compiler.toolset", toolsets),
+            ("compiler.runtime", visual_runtimes),
+            ("compiler.cppstd", cppstds),
+            ("build_type", sorted(set(build_types)))]  # sorted so that it is deterministic
+    if shared_option_name and not build_all_options_values:
+        axes.append((shared_option_name, [False, True]))
+        if not dll_with_static_runtime:
+            visual_rules.append(Exclude({"compiler.runtime": static_runtimes,
+                                         shared_option_name: True}))
+    elif build_all_options_values:
+        axes.append(("options", build_all_options_values))
+        if shared_option_name and dll_with_static_runtime:
+            # The shared version of the static runtime configurations
+            axes.append((shared_option_name, [None, True]))
+            visual_rules.append(Require({shared_option_name: True},
+                                        {"compiler.runtime": static_runtimes}))
+    return ConstraintMatrix(axes, visual_rules + list(rules or []),
+                            _builds_maker(options, [shared_option_name], {}, reference))
+
+
+def visual_matrix(visual_versions, archs, visual_runtimes, visual_toolsets, shared_option_name,
+                  dll_with_static_runtime, vs10_x86_64_enabled, build_types, cppstds,
+                  options, reference=None, build_all_options_values=None, rules=None):
+    visual_toolsets = visual_toolsets or get_env_visual_toolsets() or {}
+    rules = list(rules or [])
+    if not vs10_x86_64_enabled:
+        rules.append(Exclude({"compiler.version": "10", "arch": "x86_64"}))
+
+    def toolsets(values):
+        return visual_toolsets.get(values["compiler.version"]) or [None]
+
+    return _visual_matrix([str(version) for version in visual_versions], archs, toolsets,
+                          visual_runtimes, shared_option_name, dll_with_static_runtime,
+                          build_types, cppstds, options, reference, build_all_options_values,
+                          rules)
+
+
+def iter_visual_builds(*args, **kwargs):
+    return iter(visual_matrix(*args, **kwargs))
+
+
+def iter_visual_builds_for_version(visual_runtimes, visual_version, arch, shared_option_name,
+                                   dll_with_static_runtime, build_types, cppstds, options,
+                                   reference=None, toolset=None, build_all_options_values=None,
+                                   rules=None):
+    return iter(_visual_matrix([visual_version], [arch], [toolset], visual_runtimes,
+                               shared_option_name, dll_with_static_runtime, build_types,
+                               cppstds, options, reference, build_all_options_values, rules))
+
+
+def _msvc_matrix(msvc_versions, archs, msvc_runtime_types, msvc_runtimes, shared_option_name,
+                 dll_with_static_runtime, build_types, cppstds, options, reference,
+                 build_all_options_values, rules):
+    debug_builds = ["Debug"]
+    release_builds = ["Release", "RelWithDebInfo", "MinSizeRel"]
+    msvc_rules = [Require({"compiler.runtime_type": lambda value: value.lower() == "debug"},
+                          {"build_type": debug_builds}),
+                  Require({"compiler.runtime_type": lambda value: value.lower() == "release"},
+                          {"build_type": release_builds})]
+
+    axes = [("compiler", ["msvc"]),
+            ("compiler.version", msvc_versions),
+            ("arch", archs),
+            ("compiler.runtime_type", msvc_runtime_types),
+            ("compiler.runtime", msvc_runtimes),
+            ("compiler.cppstd", cppstds),
+            ("build_type", sorted(set(build_types)))]
+    if shared_option_name and not build_all_options_values:
+        axes.append((shared_option_name, [False, True]))
+        shared_runtimes = ["dynamic", "static"] if dll_with_static_runtime else ["dynamic"]
+        msvc_rules.append(Require({shared_option_name: True},
+                                  {"compiler.runtime": shared_runtimes}))
+    elif build_all_options_values:
+        axes.append(("options", build_all_options_values))
+        if shared_option_name and dll_with_static_runtime:
+            # The shared version of the static runtime configurations
+            axes.append((shared_option_name, [None, True]))
+            msvc_rules.append(Require({shared_option_name: True}, {"compiler.runtime": "static"}))
+    return ConstraintMatrix(axes, msvc_rules + list(rules or []),
+                            _builds_maker(options, [shared_option_name], {}, reference))
+
+
+def msvc_matrix(msvc_versions, archs, msvc_runtimes, msvc_runtime_types, shared_option_name,
+                dll_with_static_runtime, build_types, cppstds, options, reference=None,
+                build_all_options_values=None, rules=None):
+    msvc_runtime_types = msvc_runtime_types or split_colon_env("CONAN_BUILD_TYPES") or default_build_types
+    return _msvc_matrix([str(version) for version in msvc_versions], archs, msvc_runtime_types,
+                        msvc_runtimes, shared_option_name, dll_with_static_runtime, build_types,
+                        cppstds, options, reference, build_all_options_values, rules)
 
-def get_mingw_builds(mingw_configurations, mingw_installer_reference,
-                     archs, shared_option_name, build_types, cppstds,
-                     options, reference=None, build_all_options_values=None):
-    builds = []
-    for config in mingw_configurations:
-        version, arch, exception, thread = config
-        if arch not in archs:
-            continue
-        settings = {"arch": arch, "compiler": "gcc",
-                    "compiler.version": version[0:3],
-                    "compiler.threads": thread,
-                    "compiler.exception": exception}
-        build_requires = {"*": [mingw_installer_reference]}
-
-        if shared_option_name and not build_all_options_values:
-            for shared in [False, True]:
-                opt = copy.copy(options)
-                opt[shared_option_name] = shared
-                builds += _make_mingw_builds(settings, opt, build_requires, build_types, cppstds, reference)
-        elif build_all_options_values:
-            for option_values in build_all_options_values:
-                opt = copy.copy(options)
-                opt.update(option_values)
-                builds += _make_mingw_builds(settings, opt, build_requires, build_types, cppstds, reference)
-        else:
-            builds += _make_mingw_builds(settings, copy.copy(options), build_requires, build_types, cppstds, reference)
 
-    return builds
+def iter_msvc_builds(*args, **kwargs):
+    return iter(msvc_matrix(*args, **kwargs))
 
 
-def _make_mingw_builds(settings, options, build_requires, build_types, cppstds, reference=None):
-    builds = []
+def iter_msvc_builds_for_version(msvc_runtimes, msvc_version, arch, shared_option_name, dll_with_static_runtime,
+                                 build_types, cppstds, options, reference=None,
+                                 runtime_type=None, build_all_options_values=None, rules=None):
+    return iter(_msvc_matrix([msvc_version], [arch], [runtime_type or "Release"], msvc_runtimes,
+                             shared_option_name, dll_with_static_runtime, build_types, cppstds,
+                             options, reference, build_all_options_values, rules))
 
-    for build_type_it in build_types:
-        for cppstd in cppstds:
-            s2 = copy.copy(settings)
-            s2.update({"build_type": build_type_it})
-            s2.update({"compiler.libcxx": "libstdc++"})
-            if cppstd:
-                s2.update({"compiler.cppstd": cppstd})
-            builds.append(BuildConf(s2, options, {}, build_requires, reference))
 
-    return builds
+def get_build(compiler, the_arch, the_build_type, the_compiler_version,
+              the_compiler_cppstd, the_libcxx, options, reference):
+    setts = {"arch": the_arch,
+             "build_type": the_build_type,
+             "compiler": compiler,
+             "compiler.version": the_compiler_version}
+    if the_compiler_cppstd:
+        setts["compiler.cppstd"] = the_compiler_cppstd
+    if the_libcxx:
+        setts["compiler.libcxx"] = the_libcxx
 
+    return BuildConf(setts, copy.copy(options), {}, {}, reference)
 
-def get_visual_builds(visual_versions, archs, visual_runtimes, visual_toolsets, shared_option_name,
-                      dll_with_static_runtime, vs10_x86_64_enabled, build_types, cppstds,
-                      options, reference=None, build_all_options_values=None):
 
-    visual_toolsets = visual_toolsets or get_env_visual_toolsets()
-    ret = []
-    for visual_version in visual_versions:
-        visual_version = str(visual_version)
-        for arch in archs:
-            if not vs10_x86_64_enabled and arch == "x86_64" and visual_version == "10":
-                continue
-            if not visual_toolsets or not visual_toolsets.get(visual_version):
-                toolsets = [None]
-            else:
-                toolsets = visual_toolsets.get(visual_version)
-            for toolset in toolsets:
-                visual_builds = get_visual_builds_for_version(visual_runtimes, visual_version, arch,
-                                                              shared_option_name,
-                                                              dll_with_static_runtime, build_types,
-                                                              cppstds, options, reference,
-                                                              toolset=toolset,
-                                                              build_all_options_values=build_all_options_values)
-                ret.extend(visual_builds)
-    return ret
+def _compiler_matrix(compiler, versions, libcxxs, archs, shared_option_name, pure_c,
+                     build_types, cppstds, options, reference, build_all_options_values, rules):
+    axes = [("compiler", [compiler]),
+            ("compiler.version", versions),
+            ("arch", archs),
+            ("compiler.cppstd", [None] if pure_c else cppstds)]
+    axes.extend(_options_axes(shared_option_name, build_all_options_values))
+    axes.extend([("build_type", build_types),
+                 ("compiler.libcxx", [None] if pure_c else libcxxs)])
+    return ConstraintMatrix(axes, rules,
+                            _builds_maker(options, [shared_option_name], {}, reference))
 
 
-def get_visual_builds_for_version(visual_runtimes, visual_version, arch, shared_option_name,
-                                  dll_with_static_runtime, build_types, cppstds, options,
-                                  reference=None, toolset=None, build_all_options_values=None):
-    base_set = {"compiler": "Visual Studio",
-                "compiler.version": visual_version,
-                "arch": arch}
-
-    if toolset:
-        base_set["compiler.toolset"] = toolset
-    sets = []
-
-    debug_builds = set(['Debug'])
-    release_builds = set(['Release', 'RelWithDebInfo', 'MinSizeRel'])
-
-    runtime_build_map = {
-        'MTd': debug_builds,
-        'MDd': debug_builds,
-        'MT': release_builds,
-        'MD': release_builds,
-    }
-
-    build_types_set = set(build_types)
-
-    for rt in visual_runtimes:
-        for cppstd in cppstds:
-            compatible_builds = list(build_types_set.intersection(runtime_build_map[rt]))
-            compatible_builds.sort() # so that it is deterministic.
-            for bld in compatible_builds:
-                partial_settings = {"build_type": bld, "compiler.runtime": rt}
-                if cppstd:
-                    partial_settings["compiler.cppstd"] = cppstd
-                if shared_option_name and not build_all_options_values:
-                    opt = copy.copy(options)
-                    opt[shared_option_name] = False
-                    sets.append((partial_settings, opt, {}, {}))
-                    if rt in ['MT', 'MTd']:
-                        if dll_with_static_runtime:
-                            opt = copy.copy(options)
-                            opt[shared_option_name] = True
-                            sets.append((partial_settings,
-                                        opt, {}, {}))
-                    else:
-                        opt = copy.copy(options)
-                        opt[shared_option_name] = True
-                        sets.append((partial_settings,
-                                    opt, {}, {}))
-                elif build_all_options_values:
-                    for option_values in build_all_options_values:
-                        opt = copy.copy(options)
-                        opt.update(option_values)
-                        sets.append((partial_settings, opt, {}, {}))
-                        if shared_option_name and rt in ['MT', 'MTd'] and dll_with_static_runtime:
-                            new_opt = copy.copy(opt)
-                            new_opt[shared_option_name] = True
-                            sets.append((partial_settings, opt, {}, {}))
-                else:
-                    sets.append((partial_settings, options, {}, {}))
+def osx_apple_clang_matrix(apple_clang_versions, archs, shared_option_name, pure_c, build_types,
+                           cppstds, options, reference=None, build_all_options_values=None,
+                           rules=None):
+    return _compiler_matrix("apple-clang", apple_clang_versions, ["libc++"], archs,
+                            shared_option_name, pure_c, build_types, cppstds, options, reference,
+                            build_all_options_values, rules)
 
-    ret = []
-    for setting, options, env_vars, build_requires in sets:
-        tmp = copy.copy(base_set)
-        tmp.update(setting)
-        ret.append(BuildConf(tmp, copy.copy(options), env_vars, build_requires, reference))
 
-    return ret
+def iter_osx_apple_clang_builds(*args, **kwargs):
+    return iter(osx_apple_clang_matrix(*args, **kwargs))
 
 
-def get_msvc_builds(msvc_versions, archs, msvc_runtimes, msvc_runtime_types, shared_option_name,
-                    dll_with_static_runtime, build_types, cppstds, options, reference=None,
-                    build_all_options_values=None):
+def linux_gcc_matrix(gcc_versions, archs, shared_option_name, pure_c, build_types, cppstds,
+                     options, reference=None, build_all_options_values=None, rules=None):
+    gcc_rules = [Exclude({"compiler.libcxx": "libstdc++11",
+                          "compiler.version": lambda version: float(version) < 5})]
+    return _compiler_matrix("gcc", gcc_versions, ["libstdc++", "libstdc++11"], archs,
+                            shared_option_name, pure_c, build_types, cppstds, options, reference,
+                            build_all_options_values, gcc_rules + list(rules or []))
 
-    msvc_runtime_types = msvc_runtime_types or split_colon_env("CONAN_BUILD_TYPES") or default_build_types
-    ret = []
-    for msvc_version in msvc_versions:
-        msvc_version = str(msvc_version)
-        for arch in archs:
-            for runtime_type in msvc_runtime_types:
-                msvc_builds = get_msvc_builds_for_version(msvc_runtimes, msvc_version, arch,
-                                                          shared_option_name, dll_with_static_runtime, build_types,
-                                                          cppstds, options, reference,
-                                                          runtime_type=runtime_type,
-                                                          build_all_options_values=build_all_options_values)
-                ret.extend(msvc_builds)
-    return ret
 
+def iter_linux_gcc_builds(*args, **kwargs):
+    return iter(linux_gcc_matrix(*args, **kwargs))
 
-def get_msvc_builds_for_version(msvc_runtimes, msvc_version, arch, shared_option_name, dll_with_static_runtime,
-                                build_types, cppstds, options, reference=None,
-                                runtime_type=None, build_all_options_values=None):
-    base_set = {"compiler": "msvc",
-                "compiler.version": msvc_version,
-                "arch": arch,
-                "compiler.runtime_type": runtime_type}
-    if runtime_type is None and msvc_runtimes:
-        base_set["compiler.runtime_type"] = "Release"
-        runtime_type = "Release"
-    sets = []
-
-    debug_builds = ['Debug']
-    release_builds = ['Release', 'RelWithDebInfo', 'MinSizeRel']
-    rtt_build_map = {"release": release_builds, "debug": debug_builds}
-    build_types_set = set(build_types)
-
-    for rt in msvc_runtimes:
-        for cppstd in cppstds:
-            compatible_builds = list(build_types_set.intersection(rtt_build_map[runtime_type.lower()]))
-            compatible_builds.sort()
-            for bld in compatible_builds:
-                partial_settings = {"build_type": bld, "compiler.runtime": rt}
-                if cppstd:
-                    partial_settings["compiler.cppstd"] = cppstd
-                if shared_option_name and not build_all_options_values:
-                    opt = copy.copy(options)
-                    opt[shared_option_name] = False
-                    sets.append((partial_settings, opt, {}, {}))
-                    if (rt == "static" and dll_with_static_runtime) or rt == "dynamic":
-                        opt = copy.copy(options)
-                        opt[shared_option_name] = True
-                        sets.append((partial_settings, opt, {}, {}))
-                elif build_all_options_values:
-                    for option_values in build_all_options_values:
-                        opt = copy.copy(options)
-                        opt.update(option_values)
-                        sets.append((partial_settings, opt, {}, {}))
-                        if shared_option_name and rt == "static" and dll_with_static_runtime:
-                            new_opt = copy.copy(opt)
-                            new_opt[shared_option_name] = True
-                            sets.append((partial_settings, opt, {}, {}))
-                else:
-                    sets.append((partial_settings, options, {}, {}))
 
-    ret = []
-    for setting, options, env_vars, build_requires in sets:
-        tmp = copy.copy(base_set)
-        tmp.update(setting)
-        ret.append(BuildConf(tmp, copy.copy(options), env_vars, build_requires, reference))
+def linux_clang_matrix(clang_versions, archs, shared_option_name, pure_c, build_types, cppstds,
+                       options, reference=None, build_all_options_values=None, rules=None):
+    return _compiler_matrix("clang", clang_versions, ["libstdc++", "libc++"], archs,
+                            shared_option_name, pure_c, build_types, cppstds, options, reference,
+                            build_all_options_values, rules)
 
-    return ret
 
+def iter_linux_clang_builds(*args, **kwargs):
+    return iter(linux_clang_matrix(*args, **kwargs))
 
-def get_build(compiler, the_arch, the_build_type, the_compiler_version,
-              the_compiler_cppstd, the_libcxx, options, reference):
-    setts = {"arch": the_arch,
-             "build_type": the_build_type,
-             "compiler": compiler,
-             "compiler.version": the_compiler_version}
-    if the_compiler_cppstd:
-        setts["compiler.cppstd"] = the_compiler_cppstd
-    if the_libcxx:
-        setts["compiler.libcxx"] = the_libcxx
 
-    return BuildConf(setts, copy.copy(options), {}, {}, reference)
+# List versions of the generators above, they materialize all the configurations
+def get_mingw_builds(*args, **kwargs):
+    return list(iter_mingw_builds(*args, **kwargs))
 
 
-def get_osx_apple_clang_builds(apple_clang_versions, archs, shared_option_name,
-                               pure_c, build_types, cppstds, options, reference=None,
-                               build_all_options_values=None):
-    ret = []
-    # Not specified compiler or compiler version, will use the auto detected
-    for compiler_version in apple_clang_versions:
-        for arch in archs:
-            for cppstd in cppstds:
-                if shared_option_name and not build_all_options_values:
-                    for shared in [False, True]:
-                        opt = copy.copy(options)
-                        opt[shared_option_name] = shared
-                        for build_type_it in build_types:
-                            if not pure_c:
-                                ret.append(get_build("apple-clang", arch, build_type_it,
-                                                        compiler_version, cppstd,
-                                                        "libc++", opt, reference))
-                            else:
-                                ret.append(get_build("apple-clang", arch, build_type_it,
-                                                        compiler_version, None,
-                                                        None, opt, reference))
-                elif build_all_options_values:
-                    for option_values in build_all_options_values:
-                        opt = copy.copy(options)
-                        opt.update(option_values)
-                        for build_type_it in build_types:
-                            if not pure_c:
-                                ret.append(get_build("apple-clang", arch, build_type_it,
-                                                     compiler_version, cppstd,
-                                                     "libc++", opt, reference))
-                            else:
-                                ret.append(get_build("apple-clang", arch, build_type_it,
-                                                     compiler_version, None,
-                                                     None, opt, reference))
-                else:
-                    for build_type_it in build_types:
-                        if not pure_c:
-                            ret.append(get_build("apple-clang", arch, build_type_it,
-                                                    compiler_version, cppstd,
-                                                    "libc++", options, reference))
-                        else:
-                            ret.append(get_build("apple-clang", arch, build_type_it,
-                                                    compiler_version, None,
-                                                    None, options, reference))
+def get_visual_builds(*args, **kwargs):
+    return list(iter_visual_builds(*args, **kwargs))
 
-    return ret
 
+def get_visual_builds_for_version(*args, **kwargs):
+    return list(iter_visual_builds_for_version(*args, **kwargs))
 
-def get_linux_gcc_builds(gcc_versions, archs, shared_option_name, pure_c, build_types, cppstds,
-                         options, reference=None, build_all_options_values=None):
-    ret = []
-    # Not specified compiler or compiler version, will use the auto detected
-    for gcc_version in gcc_versions:
-        for arch in archs:
-            for cppstd in cppstds:
-                if shared_option_name and not build_all_options_values:
-                    for shared in [False, True]:
-                        opt = copy.copy(options)
-                        opt[shared_option_name] = shared
-                        for build_type_it in build_types:
-                            if not pure_c:
-                                ret.append(get_build("gcc", arch, build_type_it, gcc_version,
-                                                     cppstd, "libstdc++", opt, reference))
-                                if float(gcc_version) >= 5:
-                                    ret.append(get_build("gcc", arch, build_type_it, gcc_version,
-                                                         cppstd, "libstdc++11", opt, reference))
-                            else:
-                                ret.append(get_build("gcc", arch, build_type_it, gcc_version,
-                                                     None, None, opt, reference))
-                elif build_all_options_values:
-                    for option_values in build_all_options_values:
-                        opt = copy.copy(options)
-                        opt.update(option_values)
-                        for build_type_it in build_types:
-                            if not pure_c:
-                                ret.append(get_build("gcc", arch, build_type_it, gcc_version,
-                                                     cppstd, "libstdc++", opt, reference))
-                                if float(gcc_version) >= 5:
-                                    ret.append(get_build("gcc", arch, build_type_it, gcc_version,
-                                                         cppstd, "libstdc++11", opt, reference))
-                            else:
-                                ret.append(get_build("gcc", arch, build_type_it, gcc_version,
-                                                     None, None, opt, reference))
-
-                else:
-                    for build_type_it in build_types:
-                        if not pure_c:
-                            ret.append(get_build("gcc", arch, build_type_it, gcc_version,
-                                                 cppstd, "libstdc++", options, reference))
-                            if float(gcc_version) >= 5:
-                                ret.append(get_build("gcc", arch, build_type_it, gcc_version,
-                                                     cppstd, "libstdc++11", options, reference))
-                        else:
-                            ret.append(get_build("gcc", arch, build_type_it, gcc_version, None,
-                                                 None, options, reference))
-    return ret
 
+def get_msvc_builds(*args, **kwargs):
+    return list(iter_msvc_builds(*args, **kwargs))
 
-def get_linux_clang_builds(clang_versions, archs, shared_option_name, pure_c, build_types, cppstds,
-                           options, reference=None, build_all_options_values=None):
-    ret = []
-    # Not specified compiler or compiler version, will use the auto detected
-    for clang_version in clang_versions:
-        for arch in archs:
-            for cppstd in cppstds:
-                if shared_option_name and not build_all_options_values:
-                    for shared in [False, True]:
-                        opt = copy.copy(options)
-                        opt[shared_option_name] = shared
-                        for build_type_it in build_types:
-                            if not pure_c:
-                                ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                     cppstd, "libstdc++", opt, reference))
-                                ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                     cppstd, "libc++", opt, reference))
-                            else:
-                                ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                     None, None, opt, reference))
-                elif build_all_options_values:
-                    for option_values in build_all_options_values:
-                        opt = copy.copy(options)
-                        opt.update(option_values)
-                        for build_type_it in build_types:
-                            if not pure_c:
-                                ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                     cppstd, "libstdc++", opt, reference))
-                                ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                     cppstd, "libc++", opt, reference))
-                            else:
-                                ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                     None, None, opt, reference))
-                else:
-                    for build_type_it in build_types:
-                        if not pure_c:
-                            ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                 cppstd, "libstdc++", options, reference))
-                            ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                 cppstd, "libc++", options, reference))
-                        else:
-                            ret.append(get_build("clang", arch, build_type_it, clang_version,
-                                                 None, None, options, reference))
-    return ret
+
+def get_msvc_builds_for_version(*args, **kwargs):
+    return list(iter_msvc_builds_for_version(*args, **kwargs))
+
+
+def get_osx_apple_clang_builds(*args, **kwargs):
+    return list(iter_osx_apple_clang_builds(*args, **kwargs))
+
+
+def get_linux_gcc_builds(*args, **kwargs):
+    return list(iter_linux_gcc_builds(*args, **kwargs))
+
+
+def get_linux_clang_builds(*args, **kwargs):
+    return list(iter_linux_clang_builds(*args, **kwargs))
@@ -0,0 +1,141 @@
+from conans.model.version import Version
+
+from cpt import get_client_version
+
+
+class ConanCompat(object):
+    """ Calls to the Conan API that differ between Conan client versions. The branches for the
+    installed client are chosen once, get_compat() returns the instance of the process"""
+
+    def __init__(self, client_version):
+        self.client_version = Version(str(client_version))
+        self._checked = {}
+        # The results of 'conan create' have the recipe revision
+        self.has_revisions = self._at_least("1.10.0")
+        self.supports_skip_packages = self._at_least("1.18.0")
+        self.supports_download_cache = self._at_least("1.24.0")
+        self.supports_profile_build = self._at_least("1.24.0")
+        self.supports_locked_python_requires = self._at_least("1.21.0")
+        if self._at_least("1.8.0"):
+            from conans.errors import ConanInvalidConfiguration
+            self.invalid_configuration_error = ConanInvalidConfiguration
+        else:
+            self.invalid_configuration_error = None
+
+    def _at_least(self, version):
+        if version not in self._checked:
+            self._checked[version] = self.client_version >= Version(version)
+        return self._checked[version]
+
+    def factory(self):
+        """ New Conan API with the app created, and its client cache"""
+        from conans.client.conan_api import Conan
+        if not self._at_least("1.18.0"):
+            conan_api, client_cache, _ = Conan.factory()
+            return conan_api, client_cache
+        conan_api, _, _ = Conan.factory()
+        conan_api.create_app()
+        return conan_api, conan_api.app.cache
+
+    def cache(self, conan_api):
+        if not self._at_least("1.12.0"):
+            return conan_api._client_cache
+        if not self._at_least("1.18.0"):
+            return conan_api._cache
+        if not conan_api.app:
+            conan_api.create_app()
+        return conan_api.app.cache
+
+    def load_class(self, path, conan_api, python_requires_cache=None, recipe_hash=None):
+        """ Loads the conanfile class, enabling the remotes for its python_requires, or resolving
+        them with the PythonRequiresCache"""
+        if not self._at_least("1.7.0"):
+            from conans.client.loader_parse import load_conanfile_class
+            return load_conanfile_class(path)
+        if not self._at_least("1.14.0"):
+            return conan_api._loader.load_class(path)
+        if not self._at_least("1.15.0"):
+            for remote in conan_api._cache.registry.remotes.list:
+                conan_api.python_requires.enable_remotes(remote_name=remote)
+            return conan_api._loader.load_class(path)
+        if not self._at_least("1.16.0"):
+            remotes = conan_api._cache.registry.load_remotes()
+            conan_api.python_requires.enable_remotes(remotes=remotes)
+            return conan_api._loader.load_class(path)
+        if not self._at_least("1.18.0"):
+            remotes = conan_api._cache.registry.load_remotes()
+            conan_api._python_requires.enable_remotes(remotes=remotes)
+            return conan_api._loader.load_class(path)
+
+        if not conan_api.app:
+            conan_api.create_app()
+        if python_requires_cache is not None and self.supports_locked_python_requires:
+            return python_requires_cache.load(path, recipe_hash, conan_api.app)
+        remotes = conan_api.app.cache.registry.load_remotes()
+        conan_api.app.python_requires.enable_remotes(remotes=remotes)
+        if not self._at_least("1.20.0"):
+            return conan_api.app.loader.load_class(path)
+        if not self._at_least("1.21.0"):
+            return conan_api.app.loader.load_basic(path)
+        conan_api.app.pyreq_loader.enable_remotes(remotes=remotes)
+        return conan_api.app.loader.load_named(path, None, None, None, None)
+
+    def recipe_hash(self, conan_api, reference, remote_name=None):
+        """ Summary hash of the manifest of the exported recipe, in the local cache or in a
+        remote. The packages built from another recipe are 'outdated'"""
+        from conans.model.manifest import FileTreeManifest
+        content = conan_api.get_path(str(reference), path="conanmanifest.txt",
+                                     remote_name=remote_name)
+        if isinstance(content, tuple):
+            content = content[0]
+        return FileTreeManifest.loads(content).summary_hash
+
+    def create(self, conan_api, conanfile, name, version, user, channel, build_modes,
+               require_overrides, profile_abs_path, test_folder, not_export, update,
+               lockfile=None, profile_build_abs_path=None):
+        if not self._at_least("1.12.0"):
+            return conan_api.create(conanfile, name=name, version=version, user=user,
+                                    channel=channel, build_modes=build_modes,
+                                    require_overrides=require_overrides,
+                                    profile_name=profile_abs_path, test_folder=test_folder,
+                                    not_export=not_export, update=update)
+
+        profile_build = None
+        if profile_build_abs_path is not None:
+            from conans.client.conan_api import ProfileData
+            if not self._at_least("1.38.0"):
+                profile_build = ProfileData(profiles=[profile_build_abs_path], settings=None,
+                                            options=None, env=None)
+            else:
+                profile_build = ProfileData(profiles=[profile_build_abs_path], settings=None,
+                                            options=None, env=None, conf=None)
+        return conan_api.create(conanfile, name=name, version=version, user=user,
+                                channel=channel, build_modes=build_modes,
+                                require_overrides=require_overrides,
+                                profile_names=[profile_abs_path], test_folder=test_folder,
+                                not_export=not_export, update=update, lockfile=lockfile,
+                                profile_build=profile_build)
+
+    def upload(self, conan_api, reference, package_id, remote_name, force, retry):
+        """ Uploads the recipe, and its packages if there is a 'package_id'"""
+        if not self._at_least("1.7.0"):
+            return conan_api.upload(str(reference), package=package_id, remote=remote_name,
+                                    force=force, retry=retry)
+        if not self._at_least("1.8.0"):
+            return conan_api.upload(str(reference), package=package_id,
+                                    remote_name=remote_name, force=force, retry=retry)
+        from conans.client.cmd.uploader import UPLOAD_POLICY_FORCE
+        return conan_api.upload(str(reference), all_packages=package_id is not None,
+                                remote_name=remote_name,
+                                policy=UPLOAD_POLICY_FORCE if force else None, retry=retry)
+
+
+_compat = None
+
+
+def get_compat():
+    """ The ConanCompat of the installed Conan client"""
+    global _compat
+    if _compat is None:
+        _compat = ConanCompat(get_client_version())
+    return _compat
@@ -0,0 +1,162 @@
+from itertools import chain
+
+
+def _matches(value, condition):
+    if callable(condition):
+        return condition(value)
+    if isinstance(condition, (list, tuple, set)):
+        return value in condition
+    return value == condition
+
+
+class Exclude(object):
+    """ Rule excluding the combinations matching all the conditions, e.g.
+    Exclude({"compiler.version": "10", "arch": "x86_64"}). A condition is a value, a list of
+    values or a function of the value"""
+
+    def __init__(self, conditions):
+        self.conditions = conditions
+        self.axes = set(conditions)
+
+    def excludes(self, values):
+        return all(_matches(values[axis], condition)
+                   for axis, condition in self.conditions.items())
+
+    def __repr__(self):
+        return "Exclude(%r)" % (self.conditions, )
+
+
+class Require(object):
+    """ Rule excluding the combinations matching all the 'when' conditions but not all the
+    'then' ones, e.g. Require({"compiler.runtime": "MTd"}, {"build_type": "Debug"}). An empty
+    'when' applies to every combination"""
+
+    def __init__(self, when, then):
+        self.when = when
+        self.then = then
+        self.axes = set(when) | set(then)
+
+    def excludes(self, values):
+        return (all(_matches(values[axis], condition) for axis, condition in self.when.items())
+                and not all(_matches(values[axis], condition)
+                            for axis, condition in self.then.items()))
+
+    def __repr__(self):
+        return "Require(%r, %r)" % (self.when, self.then)
+
+
+class ConstraintMatrix(object):
+    """ Combinations of the values of some axes, pruned by rules while they are enumerated.
+
+    The axes are (name, values) pairs, enumerated in order (the first one is the outermost). The
+    values are a list or a function returning them from the values already chosen for the
+    previous axes. The name can be a tuple of names, then every value is a tuple assigning all
+    of them at once. A rule is evaluated as soon as all its axes have a value, so the subtree of
+    an excluded combination is never visited. The rules about axes that are not in the matrix
+    are ignored, they are kept in 'ignored_rules' (None without axes).
+
+    'make' converts the {name: value} dict of every combination into the generated item"""
+
+    def __init__(self, axes, rules=None, make=None):
+        self._axes = axes
+        self._make = make or dict
+        depths = {}
+        for depth, (name, _) in enumerate(axes):
+            for axis_name in (name if isinstance(name, tuple) else (name, )):
+                depths[axis_name] = depth
+        self._rules = [[] for _ in axes]
+        self.ignored_rules = [] if axes else None
+        for rule in rules or []:
+            if rule.axes and rule.axes.issubset(depths):
+                self._rules[max(depths[axis] for axis in rule.axes)].append(rule)
+            elif not rule.axes and axes:
+                self._rules[0].append(rule)
+            elif axes:
+                self.ignored_rules.append(rule)
+        # From this depth on, the remaining axes are fixed lists without rules, the count of the
+        # combinations is the product of their lengths
+        self._free_depth = len(axes)
+        while self._free_depth > 0:
+            _, values = axes[self._free_depth - 1]
+            if callable(values) or self._rules[self._free_depth - 1]:
+                break
+            self._free_depth -= 1
+
+    def _assign(self, values, depth, value):
+        name = self._axes[depth][0]
+        if isinstance(name, tuple):
+            values.update(zip(name, value))
+        else:
+            values[name] = value
+
+    def _candidates(self, values, depth):
+        name, axis_values = self._axes[depth]
+        for value in (axis_values(values) if callable(axis_values) else axis_values):
+            self._assign(values, depth, value)
+            if not any(rule.excludes(values) for rule in self._rules[depth]):
+                yield value
+
+    def _walk(self, values, depth):
+        if depth == len(self._axes):
+            yield self._make(dict(values))
+            return
+        for _ in self._candidates(values, depth):
+            for item in self._walk(values, depth + 1):
+                yield item
+
+    def __iter__(self):
+        if not self._axes:
+            return iter([])
+        return self._walk({}, 0)
+
+    def _count(self, values, depth):
+        if depth == self._free_depth:
+            count = 1
+            for _, axis_values in self._axes[depth:]:
+                count *= len(axis_values)
+            return count
+        return sum(self._count(values, depth + 1) for _ in self._candidates(values, depth))
+
+    def count(self):
+        """ Number of combinations, counted without generating them. It is not __len__ because
+        list() would call it before iterating"""
+        if not self._axes:
+            return 0
+        return self._count({}, 0)
+
+
+class MatrixChain(object):
+    """ Several matrices (or lists) one after the other"""
+
+    def __init__(self, *matrices):
+        self._matrices = matrices
+
+    def __iter__(self):
+        return chain(*self._matrices)
+
+    @property
+    def ignored_rules(self):
+        """ The rules ignored by all the matrices, None without matrices"""
+        ignored = None
+        for matrix in self._matrices:
+            rules = getattr(matrix, "ignored_rules", None)
+            if rules is not None:
+                ignored = rules if ignored is None else [rule for rule in ignored
+                                                         if rule in rules]
+        return ignored
+
+    def count(self):
+        """ Number of items, None if the size of any matrix can't be known"""
+        sizes = [matrix_size(matrix) for matrix in self._matrices]
+        if None in sizes:
+            return None
+        return sum(sizes)
+
+
+def matrix_size(items):
+    """ Number of items of a matrix or a list, None if it can't be known without iterating"""
+    if isinstance(items, (ConstraintMatrix, MatrixChain)):
+        return items.count()
+    if isinstance(items, (list, tuple)):
+        return len(items)
+    return None
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from six.moves.queue import Empty, Queue
+
+from cpt.runner import PrintRunner, pull_docker_image
+
+
+class ContainerPool(object):
+    """ One long-lived container per Docker image, started the first time a build of the page
+    needs the image. The builds run in it with 'docker exec', so they don't pay the container
+    creation, the Conan update and the entry script, and they reuse the Conan cache of the
+    container. With 'batch_folders' every container mounts its own host folder for the files of
+    DockerCreateRunner.run_batch(). close() removes the containers and their folders"""
+
+    def __init__(self, runner, printer, sudo_docker_command="", batch_folders=False):
+        self._runner = PrintRunner(runner, printer)
+        self._printer = printer
+        self._sudo_docker_command = sudo_docker_command or ""
+        self._batch_folders = batch_folders
+        self._containers = OrderedDict()
+        self._folders = {}
+
+    def __len__(self):
+        return len(self._containers)
+
+    def container(self, docker_runner, docker_image, docker_entry_script=None):
+        """ Name of the container of the image, 'docker_runner' (a DockerCreateRunner of the
+        image) prepares the image and starts the container the first time"""
+        if docker_image not in self._containers:
+            name = "cpt_%s_%s" % (os.getpid(), len(self._containers) + 1)
+            docker_runner.prepare_image()
+            # Registered before starting it, so close() removes it if it fails to start
+            self._containers[docker_image] = name
+            self._printer.print_message("Starting container '%s' for image '%s'"
+                                        % (name, docker_image))
+            batch_folder = None
+            if self._batch_folders:
+                batch_folder = tempfile.mkdtemp(prefix="cpt_batch_")
+                self._folders[name] = batch_folder
+            docker_runner.start_container(name, docker_entry_script, batch_folder)
+        return self._containers[docker_image]
+
+    def batch_folder(self, container):
+        """ Host folder mounted in the container for the files of run_batch()"""
+        return self._folders.get(container)
+
+    def close(self):
+        for name in self._containers.values():
+            self._runner("%s docker rm -f %s" % (self._sudo_docker_command, name))
+        self._containers.clear()
+        for folder in self._folders.values():
+            shutil.rmtree(folder, ignore_errors=True)
+        self._folders.clear()
+
+
+class ImagePrefetcher(object):
+    """ Pulls the Docker images of the page in the background, up to 'jobs' at the same time and
+    in the order of their first build, while the builds of the images already pulled run.
+    wait() blocks until an image is pulled"""
+
+    def __init__(self, runner, printer, docker_images, jobs, sudo_docker_command=""):
+        self._runner = PrintRunner(runner, printer)
+        self._printer = printer
+        self._sudo_docker_command = sudo_docker_command or ""
+        self._pulled = OrderedDict((image, threading.Event()) for image in docker_images)
+        self._errors = {}
+        pending = Queue()
+        for image in self._pulled:
+            pending.put(image)
+        for _ in range(min(jobs, len(self._pulled))):
+            # Daemon threads, so a failed build doesn't wait for the pulls in progress
+            thread = threading.Thread(target=self._pull, args=(pending, ))
+            thread.daemon = True
+            thread.start()
+
+    def _pull(self, pending):
+        while True:
+            try:
+                image = pending.get_nowait()
+            except Empty:
+                return
+            try:
+                pull_docker_image(self._runner, self._printer, image, self._sudo_docker_command)
+            except Exception as exc:
+                self._errors[image] = exc
+            finally:
+                self._pulled[image].set()
+
+    def wait(self, docker_image):
+        """ Waits for the pull of the image, raising its error if it failed. False if the image
+        isn't prefetched"""
+        if docker_image not in self._pulled:
+            return False
+        self._pulled[docker_image].wait()
+        if docker_image in self._errors:
+            raise self._errors[docker_image]
+        return True
@@ -0,0 +1,101 @@
+import json
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PhaseTimer(object):
+    """ Accumulates the wall-clock time spent in the named phases of a build"""
+
+    def __init__(self):
+        self.durations = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.time() - start
+
+
+class BuildHistory(object):
+    """ Local SQLite database with one row per executed build: configuration hash, reference,
+    start and end time, phase durations, outcome and host"""
+
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self._path = os.path.abspath(os.path.expanduser(path))
+        folder = os.path.dirname(self._path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS builds ("
+                               "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                               "config_hash TEXT NOT NULL, "
+                               "reference TEXT, "
+                               "configuration TEXT, "
+                               "runner TEXT, "
+                               "started REAL, "
+                               "finished REAL, "
+                               "duration REAL, "
+                               "phases TEXT, "
+                               "outcome TEXT, "
+                               "host TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS builds_config_hash "
+                               "ON builds (config_hash)")
+
+    @property
+    def path(self):
+        return self._path
+
+    @contextmanager
+    def _connect(self):
+        import sqlite3  # Only the builds with history need it
+        with self._lock:
+            connection = sqlite3.connect(self._path, timeout=30)
+            try:
+                with connection:
+                    yield connection
+            finally:
+                connection.close()
+
+    def record(self, build, runner, started, finished, outcome, phases=None, host=None):
+        configuration = json.dumps({"settings": build.settings, "options": build.options},
+                                   sort_keys=True, default=str)
+        with self._connect() as connection:
+            connection.execute("INSERT INTO builds (config_hash, reference, configuration, "
+                               "runner, started, finished, duration, phases, outcome, host) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (build.content_hash(), str(build.reference), configuration,
+                                runner, started, finished, finished - started,
+                                json.dumps(phases or {}, sort_keys=True), outcome,
+                                host or platform.node()))
+
+    def durations(self):
+        """ Average duration of the successful builds of every configuration hash"""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT config_hash, AVG(duration) FROM builds "
+                                      "WHERE outcome = 'success' GROUP BY config_hash")
+            return {config_hash: duration for config_hash, duration in rows}
+
+    def builds(self, config_hash=None):
+        """ Recorded builds, the most recent first, as dicts"""
+        query = "SELECT * FROM builds"
+        params = ()
+        if config_hash:
+            query += " WHERE config_hash = ?"
+            params = (config_hash, )
+        query += " ORDER BY started DESC, id DESC"
+        with self._connect() as connection:
+            cursor = connection.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            result = []
+            for row in cursor:
+                item = dict(zip(columns, row))
+                item["phases"] = json.loads(item["phases"] or "{}")
+                result.append(item)
+            return result
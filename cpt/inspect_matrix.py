@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import platform
+import sys
+from collections import OrderedDict
+
+from conans.model.ref import ConanFileReference
+
+from cpt.build_filter import compile_build_filter
+from cpt.builds_generator import BuildGenerator, get_all_options_values, get_header_only_builds
+from cpt.history import BuildHistory
+from cpt.loader import parse_recipe_metadata
+from cpt.sampling import covering_sample, get_sampling_strength
+from cpt.scheduler import assign_pages, get_build_durations, load_recorded_durations
+from cpt.tools import get_bool_from_env, get_custom_bool_from_env, get_docker_image, \
+    split_colon_env
+
+
+def _get_reference():
+    """ The reference of the builds, only when the environment has it complete, the recipe is
+    not loaded"""
+    reference = os.getenv("CONAN_REFERENCE")
+    if not reference:
+        return None
+    if "@" in reference:
+        return ConanFileReference.loads(reference)
+    username, channel = os.getenv("CONAN_USERNAME"), os.getenv("CONAN_CHANNEL")
+    if username and channel:
+        name, version = reference.split("/")
+        return ConanFileReference(name, version, username, channel)
+    return None
+
+
+def _get_recorded_durations():
+    durations = {}
+    history_db = os.getenv("CPT_HISTORY_DB")
+    # Only when all the pages share the database, like the packager
+    if history_db and os.path.exists(history_db) and \
+            get_bool_from_env("CPT_PAGINATION_HISTORY"):
+        durations.update(BuildHistory(history_db).durations())
+    durations.update(load_recorded_durations(os.getenv("CPT_BUILD_DURATIONS")))
+    return durations
+
+
+def _get_recipe_metadata(conanfile, limits):
+    """ The metadata of the recipe, parsed without loading it. The reasons to ignore it are
+    added to 'limits'"""
+    if not os.path.exists(conanfile):
+        limits.append("There is no recipe '%s', its options are not considered" % conanfile)
+        return None
+    metadata = parse_recipe_metadata(conanfile)
+    if metadata is None:
+        limits.append("The recipe '%s' computes its metadata (set_name(), "
+                      "python_requires_extend...), its options are not considered" % conanfile)
+    return metadata
+
+
+def get_matrix_report(os_name=None, shared_option_name=None, total_pages=None, conanfile=None,
+                      dll_with_static_runtime=False, header_only=True):
+    """ Builds, images and pages that ConanMultiPackager.add_common_builds() and run_builds()
+    would produce with the environment variables, without initializing Conan or loading the
+    recipe. The recipe options ('shared', 'header_only' and the CONAN_BUILD_ALL_OPTIONS_VALUES
+    ones) are parsed from the conanfile when it declares them with literals, otherwise the
+    report 'limits' tell what is not considered"""
+    docker_image = os.getenv("CONAN_DOCKER_IMAGE")
+    use_docker = get_bool_from_env("CONAN_USE_DOCKER") or docker_image is not None
+    os_name = os_name or ("Linux" if use_docker else platform.system())
+    if shared_option_name is None:
+        shared_option_name = os.getenv("CONAN_SHARED_OPTION_NAME")
+        if str(shared_option_name).lower() == "false":
+            shared_option_name = False
+    pure_c = get_custom_bool_from_env("CONAN_PURE_C", True)
+    total_pages = int(total_pages or os.getenv("CONAN_TOTAL_PAGES", 1))
+    pagination = os.getenv("CPT_PAGINATION", "sequential").lower()
+    build_all_options_values = split_colon_env("CONAN_BUILD_ALL_OPTIONS_VALUES") or []
+    build_filter = os.getenv("CPT_BUILD_FILTER")
+
+    limits = []
+    metadata = _get_recipe_metadata(conanfile or os.getenv("CONAN_CONANFILE", "conanfile.py"),
+                                    limits)
+    reference = _get_reference()
+    name = reference.name if reference else getattr(metadata, "name", None)
+    if metadata is not None and not name:
+        limits.append("The recipe has no name, its options are not considered")
+        metadata = None
+    if metadata is not None:
+        if shared_option_name is None and metadata.options and "shared" in metadata.options:
+            shared_option_name = "%s:shared" % name
+        build_all_options_values = get_all_options_values(metadata, name, shared_option_name,
+                                                          build_all_options_values)
+    elif build_all_options_values:
+        limits.append("CONAN_BUILD_ALL_OPTIONS_VALUES is not considered without the recipe "
+                      "options")
+        build_all_options_values = None
+
+    generator = BuildGenerator(reference, os_name, None, None, None, None, None, None, False,
+                               None, None, None, None, None, None, None, None, None)
+    builds = generator.get_builds(pure_c, shared_option_name, dll_with_static_runtime, reference,
+                                  build_all_options_values)
+    header_only_builds = get_header_only_builds(metadata, name, builds)
+    if header_only_builds is not None and header_only:
+        builds.extend(list(header_only_builds))
+    generated = len(builds)
+    if build_filter:
+        predicate = compile_build_filter(build_filter)
+        builds = [build for build in builds if predicate(build)]
+    filtered = len(builds)
+    strength = get_sampling_strength(os.getenv("CPT_MATRIX_SAMPLING"))
+    if strength:
+        builds = covering_sample(builds, strength)
+
+    recorded = _get_recorded_durations()
+    durations = get_build_durations(builds, recorded)
+    if pagination == "duration":
+        pages = assign_pages(durations, total_pages)
+    else:
+        pages = [(index % total_pages) + 1 for index in range(len(builds))]
+
+    compilers = OrderedDict()
+    images = OrderedDict()
+    page_counts = OrderedDict((page, {"builds": 0, "duration": 0.0})
+                              for page in range(1, total_pages + 1))
+    for build, duration, page in zip(builds, durations, pages):
+        compiler = "%s %s" % (build.settings.get("compiler"),
+                              build.settings.get("compiler.version"))
+        compilers[compiler] = compilers.get(compiler, 0) + 1
+        if use_docker:
+            try:
+                image = get_docker_image(build, docker_image,
+                                         os.getenv("CONAN_DOCKER_32_IMAGES", False))
+            except Exception:
+                image = "unknown"
+            images[image] = images.get(image, 0) + 1
+        page_counts[page]["builds"] += 1
+        page_counts[page]["duration"] += duration
+
+    return {"os": os_name, "generated": generated, "build_filter": build_filter,
+            "filtered": filtered, "builds": len(builds),
+            "sampling": strength, "compilers": compilers, "images": images,
+            "pages": page_counts, "duration": sum(durations),
+            # Without recorded durations, the estimations are relative to a Release build
+            "duration_units": "seconds" if recorded else "relative", "limits": limits}
+
+
+def _format_duration(duration, units):
+    if units == "seconds":
+        return "%.0fs" % duration
+    return "%.1f Release builds" % duration
+
+
+def print_matrix_report(report, out):
+    out("Build matrix for %s: %s configurations" % (report["os"], report["builds"]))
+    if report["build_filter"]:
+        out("Build filter: %s, %s of %s configurations"
+            % (report["build_filter"], report["filtered"], report["generated"]))
+    if report["sampling"]:
+        out("Sampling (%s-wise): %s of %s configurations"
+            % (report["sampling"], report["builds"], report["filtered"]))
+    out("\nCompilers:")
+    for compiler, count in report["compilers"].items():
+        out("    %s: %s" % (compiler, count))
+    if report["images"]:
+        out("\nDocker images:")
+        for image, count in report["images"].items():
+            out("    %s: %s" % (image, count))
+    out("\nPages:")
+    for page, values in report["pages"].items():
+        out("    %s: %s configurations, estimated %s"
+            % (page, values["builds"], _format_duration(values["duration"],
+                                                        report["duration_units"])))
+    out("\nEstimated duration: %s" % _format_duration(report["duration"],
+                                                     report["duration_units"]))
+    if report["limits"]:
+        out("\nNot considered:")
+        for limit in report["limits"]:
+            out("    %s" % limit)
+
+
+def run(args=None):
+    parser = argparse.ArgumentParser(description="Prints the build matrix of the environment "
+                                                 "variables (CONAN_GCC_VERSIONS, CONAN_ARCHS, "
+                                                 "CONAN_TOTAL_PAGES...) without running Conan")
+    parser.add_argument("--os", dest="os_name", help="Operating system of the builds, the "
+                        "current one by default (Linux with Docker)")
+    parser.add_argument("--shared-option-name", help="Shared option of the recipe, e.g. "
+                        "'mylib:shared', the recipe is not loaded to detect it")
+    parser.add_argument("--total-pages", type=int, help="Number of CI pages, CONAN_TOTAL_PAGES "
+                        "by default")
+    parser.add_argument("--conanfile", help="Recipe whose options are parsed, without loading "
+                        "it, CONAN_CONANFILE or 'conanfile.py' by default")
+    parser.add_argument("--dll-with-static-runtime", action="store_true", help="Like "
+                        "add_common_builds(dll_with_static_runtime=True)")
+    parser.add_argument("--no-header-only", action="store_true", help="Like "
+                        "add_common_builds(header_only=False)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(args)
+
+    report = get_matrix_report(args.os_name, args.shared_option_name, args.total_pages,
+                               args.conanfile, args.dll_with_static_runtime,
+                               not args.no_header_only)
+    if args.json:
+        sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    else:
+        print_matrix_report(report, lambda text: sys.stdout.write(text + "\n"))
+
+
+if __name__ == "__main__":
+    run()
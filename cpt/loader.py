@@ -0,0 +1,190 @@
+import ast
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+from conans.errors import ConanException
+from conans.model.ref import ConanFileReference
+
+from cpt.compat import get_compat
+
+# Shared by all the packagers of the process, by absolute path of the recipe
+_loaded_classes = {}
+_static_metadata = {}
+
+RecipeMetadata = namedtuple("RecipeMetadata", "name version options default_options")
+
+_metadata_fields = RecipeMetadata._fields
+# The recipe computes its metadata (or inherits it) when it has any of these
+_dynamic_members = ("set_name", "set_version", "init", "python_requires",
+                    "python_requires_extend")
+
+
+def _resolved_python_requires(conanfile):
+    """ References (with revision) and local folders of the python_requires of the loaded
+    class, the new ones and the legacy python_requires() ones"""
+    python_requires = getattr(conanfile, "python_requires", None)
+    if hasattr(python_requires, "all_items"):
+        items = python_requires.all_items()
+    elif isinstance(python_requires, dict):
+        items = python_requires.items()
+    else:
+        items = []
+    references, folders = [], []
+    for _, python_require in items:
+        references.append(python_require.ref.full_str())
+        folders.append(getattr(python_require, "path", None) or
+                       getattr(python_require, "exports_folder", None))
+    return references, [folder for folder in folders if folder]
+
+
+class PythonRequiresCache(object):
+    """ Resolved python_requires of every recipe, persisted in a JSON file. While an entry is
+    younger than 'ttl' seconds (always in offline mode), and its python_requires are still in the
+    local cache, the recipe is loaded with them locked and without remotes, so it doesn't wait for
+    any remote. In offline mode the remotes are never used"""
+
+    def __init__(self, path, ttl=3600, offline=False):
+        self._path = path
+        self._ttl = ttl
+        self.offline = offline
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return {}
+        try:
+            with open(self._path) as json_file:
+                return json.load(json_file)
+        except ValueError:
+            return {}
+
+    def _save(self, entries):
+        folder = os.path.dirname(self._path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(self._path, "w") as json_file:
+            json.dump(entries, json_file, indent=2, sort_keys=True)
+
+    def _locked(self, entry):
+        if not entry or not (self.offline or time.time() - entry["timestamp"] < self._ttl):
+            return None
+        if not all(os.path.exists(folder) for folder in entry["folders"]):
+            return None
+        return [ConanFileReference.loads(reference) for reference in entry["references"]]
+
+    @staticmethod
+    def _enable_remotes(app, remotes):
+        app.python_requires.enable_remotes(remotes=remotes)
+        app.pyreq_loader.enable_remotes(remotes=remotes)
+
+    def load(self, path, recipe_hash, app):
+        """ Loads the conanfile class (Conan >= 1.21)"""
+        from conans.client.cache.remote_registry import Remotes
+
+        key = "%s %s" % (path, recipe_hash)
+        entries = self._load()
+        locked = self._locked(entries.get(key))
+        if locked is not None:
+            self._enable_remotes(app, Remotes())
+            try:
+                return app.loader.load_named(path, None, None, None, None,
+                                             lock_python_requires=locked)
+            except ConanException:
+                if self.offline:
+                    raise
+
+        self._enable_remotes(app, Remotes() if self.offline else
+                             app.cache.registry.load_remotes())
+        conanfile = app.loader.load_named(path, None, None, None, None)
+        references, folders = _resolved_python_requires(conanfile)
+        entries[key] = {"timestamp": time.time(), "references": references, "folders": folders}
+        self._save(entries)
+        return conanfile
+
+
+def _memoized(memo, path, load):
+    """ The result of load(path, contents), memoized by path, modification time and content
+    hash, so a modified recipe is loaded again"""
+    path = os.path.abspath(path)
+    with open(path, "rb") as conanfile:
+        contents = conanfile.read()
+    key = (os.path.getmtime(path), hashlib.sha1(contents).hexdigest())
+    cached = memo.get(path)
+    if cached is None or cached[0] != key:
+        cached = key, load(path, contents)
+        memo[path] = cached
+    return cached[1]
+
+
+def load_cf_class(path, conan_api, python_requires_cache=None):
+    """ Loads the conanfile class of the recipe, enabling the remotes for its python_requires,
+    or resolving them with the 'python_requires_cache' (a PythonRequiresCache). The classes are
+    memoized, so the packager constructor and every add_common_builds() call load the recipe
+    and resolve its python_requires only once"""
+    def load(path, contents):
+        return get_compat().load_class(path, conan_api, python_requires_cache,
+                                       hashlib.sha1(contents).hexdigest())
+    return _memoized(_loaded_classes, path, load)
+
+
+def _is_conanfile_base(base):
+    return (isinstance(base, ast.Name) and base.id == "ConanFile") or \
+        (isinstance(base, ast.Attribute) and base.attr == "ConanFile")
+
+
+def _parse_metadata(path, contents):
+    """ The metadata of the recipe when its class declares it with literals, otherwise None"""
+    try:
+        tree = ast.parse(contents, path)
+    except SyntaxError:
+        return None
+    classes = [node for node in tree.body if isinstance(node, ast.ClassDef) and
+               any(_is_conanfile_base(base) for base in node.bases)]
+    if len(classes) != 1 or len(classes[0].bases) != 1:
+        return None
+    # The recipe can be a subclass of it, or the module code can modify it: Lib.name = ...
+    for statement in tree.body:
+        if statement is not classes[0] and \
+                any(isinstance(node, ast.Name) and node.id == classes[0].name
+                    for node in ast.walk(statement)):
+            return None
+    values = {}
+    for statement in classes[0].body:
+        if isinstance(statement, ast.FunctionDef):
+            if statement.name in _dynamic_members:
+                return None
+            continue
+        if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and \
+                isinstance(statement.targets[0], ast.Name):
+            name = statement.targets[0].id
+            if name in _dynamic_members:
+                return None
+            if name in _metadata_fields:
+                try:
+                    values[name] = ast.literal_eval(statement.value)
+                except ValueError:
+                    return None
+                continue
+        # Any other statement using the metadata could modify it: options["fPIC"] = ...
+        names = set(node.id for node in ast.walk(statement) if isinstance(node, ast.Name))
+        if names.intersection(_metadata_fields + _dynamic_members):
+            return None
+    return RecipeMetadata(*[values.get(field) for field in _metadata_fields])
+
+
+def parse_recipe_metadata(path):
+    """ The name, version, options and default_options of the recipe, parsed from the conanfile
+    without executing it. None unless the recipe class declares them with literals"""
+    return _memoized(_static_metadata, path, _parse_metadata)
+
+
+def load_recipe_metadata(path, conan_api, python_requires_cache=None):
+    """ The name, version, options and default_options of the recipe. They are parsed from the
+    conanfile without executing it when the recipe class declares them with literals, and the
+    conanfile class is loaded otherwise (set_name(), python_requires_extend...)"""
+    metadata = parse_recipe_metadata(path)
+    if metadata is not None:
+        return metadata
+    return load_cf_class(path, conan_api, python_requires_cache)
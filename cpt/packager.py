@@ -2,64 +2,57 @@ import os
 import platform
 import re
 import sys
-import copy
-from collections import defaultdict
-from itertools import product
+import shutil
+import tempfile
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from itertools import chain, islice
 
 import six
+from six.moves.queue import Queue
 from conans import tools
 from conans.client.conan_api import Conan
 from conans.client.runner import ConanRunner
 from conans.model.ref import ConanFileReference
-from conans.model.version import Version
 
-from cpt import get_client_version
+from cpt.analyzer import BuildAnalyzer, INVALID_PACKAGE_ID, get_recipe_hash
 from cpt.auth import AuthManager
-from cpt.builds_generator import BuildConf, BuildGenerator
+from cpt.build_matrix import BuildMatrix, selector_predicate
+from cpt.build_filter import compile_build_filter
+from cpt.builds_generator import BuildConf, BuildGenerator, get_all_options_values, \
+    get_header_only_builds, remove_duplicated_builds
 from cpt.ci_manager import CIManager
+from cpt.compat import get_compat
+from cpt.constraints import matrix_size
+from cpt.history import BuildHistory
+from cpt.loader import PythonRequiresCache, load_cf_class, load_recipe_metadata
+from cpt.parallel import get_parallel_jobs, get_container_resources, run_in_pool, \
+    PrefixedOutputRunner
+from cpt.plan import BuildPlan
 from cpt.printer import Printer
 from cpt.profiles import get_profiles, save_profile_to_tmp
-from cpt.remotes import RemotesManager
-from cpt.runner import CreateRunner, DockerCreateRunner
-from cpt.tools import get_bool_from_env, get_custom_bool_from_env
+from cpt.remotes import RemotePackagesCache, RemotesManager
+from cpt.runner import CreateRunner, DockerCreateRunner, SubprocessCreateRunner
+from cpt.sampling import covering_sample, get_sampling_strength
+from cpt.scheduler import assign_pages, get_build_durations, load_recorded_durations
+from cpt.tools import get_bool_from_env, get_custom_bool_from_env, get_docker_image, \
+    autodetect_docker_base_image
 from cpt.tools import split_colon_env
 from cpt.uploader import Uploader
 from cpt.config import ConfigManager
+from cpt.containers import ContainerPool, ImagePrefetcher
 
 
-def load_cf_class(path, conan_api):
-    client_version = get_client_version()
-    client_version = Version(client_version)
-    if client_version < Version("1.7.0"):
-        from conans.client.loader_parse import load_conanfile_class
-        return load_conanfile_class(path)
-    elif client_version < Version("1.14.0"):
-        return conan_api._loader.load_class(path)
-    elif client_version < Version("1.15.0"):
-        remotes = conan_api._cache.registry.remotes.list
-        for remote in remotes:
-            conan_api.python_requires.enable_remotes(remote_name=remote)
-        return conan_api._loader.load_class(path)
-    elif client_version < Version("1.16.0"):
-        remotes = conan_api._cache.registry.load_remotes()
-        conan_api.python_requires.enable_remotes(remotes=remotes)
-        return conan_api._loader.load_class(path)
-    elif client_version < Version("1.18.0"):
-        remotes = conan_api._cache.registry.load_remotes()
-        conan_api._python_requires.enable_remotes(remotes=remotes)
-        return conan_api._loader.load_class(path)
-    else:
-        if not conan_api.app:
-            conan_api.create_app()
-        remotes = conan_api.app.cache.registry.load_remotes()
-        conan_api.app.python_requires.enable_remotes(remotes=remotes)
-        if client_version < Version("1.20.0"):
-            return conan_api.app.loader.load_class(path)
-        elif client_version < Version("1.21.0"):
-            return conan_api.app.loader.load_basic(path)
-        else:
-            conan_api.app.pyreq_loader.enable_remotes(remotes=remotes)
-            return conan_api.app.loader.load_named(path, None, None, None, None)
+def _iter_not_matching(builds, predicate):
+    for build in builds:
+        if not predicate(build):
+            yield build
+
+
+def _iter_updated_matching(builds, predicate, new_values):
+    for build in builds:
+        yield build.updated(*new_values) if predicate(build) else build
 
 
 class PlatformInfo(object):
@@ -148,9 +141,34 @@ class ConanMultiPackager(object):
                  skip_recipe_export=False,
                  update_dependencies=None,
                  lockfile=None,
-                 global_conf=None):
-
-        conan_version = get_client_version()
+                 global_conf=None,
+                 parallel_jobs=None,
+                 download_cache=None,
+                 pagination=None,
+                 build_durations=None,
+                 history_db=None,
+                 skip_existing_packages=False,
+                 remote_packages_cache=None,
+                 remote_packages_ttl=None,
+                 skip_duplicated_packages=False,
+                 skip_invalid_configurations=False,
+                 lazy_matrix=False,
+                 build_rules=None,
+                 matrix_sampling=None,
+                 build_plan=None,
+                 plan_only=False,
+                 build_filter=None,
+                 python_requires_cache=None,
+                 python_requires_ttl=None,
+                 python_requires_offline=False,
+                 docker_persistent_containers=False,
+                 docker_storage_volume=None,
+                 docker_batch_builds=False,
+                 docker_pull_jobs=None,
+                 docker_cache_updated_images=False,
+                 pagination_history=False):
+
+        compat = get_compat()
 
         self.printer = Printer(out)
         self.printer.print_rule()
@@ -197,7 +215,31 @@ class ConanMultiPackager(object):
         self.uploader = Uploader(self.conan_api, self.remotes_manager, self.auth_manager,
                                  self.printer, self.upload_retry, self.upload_force)
 
-        self._builds = []
+        self.lazy_matrix = lazy_matrix or get_bool_from_env("CPT_LAZY_MATRIX")
+        self.sampling_strength = get_sampling_strength(matrix_sampling or
+                                                       os.getenv("CPT_MATRIX_SAMPLING"))
+        self.build_plan = build_plan or os.getenv("CPT_BUILD_PLAN")
+        self.plan_only = plan_only or get_bool_from_env("CPT_PLAN_ONLY")
+        self.build_filter = build_filter or os.getenv("CPT_BUILD_FILTER")
+        if self.build_filter:
+            # Invalid expressions fail before doing anything
+            compile_build_filter(self.build_filter)
+        # Opt-in, otherwise the python_requires are resolved with the remotes as usual
+        python_requires_cache = python_requires_cache or os.getenv("CPT_PYTHON_REQUIRES_CACHE")
+        python_requires_ttl = int(python_requires_ttl or os.getenv("CPT_PYTHON_REQUIRES_TTL", 3600))
+        python_requires_offline = python_requires_offline or \
+                                  get_bool_from_env("CPT_PYTHON_REQUIRES_OFFLINE")
+        self.python_requires_cache = None
+        if python_requires_cache or python_requires_offline:
+            python_requires_cache = python_requires_cache or \
+                                    os.path.join(tempfile.gettempdir(), "cpt_python_requires.json")
+            self.python_requires_cache = PythonRequiresCache(python_requires_cache,
+                                                             python_requires_ttl,
+                                                             python_requires_offline)
+        self._plan = None
+        self._builds = BuildMatrix()
+        # Lazy mode: generated builds and filters, applied when the builds are iterated
+        self._lazy_steps = []
         self._named_builds = {}
         self._packages_summary = []
 
@@ -226,7 +268,8 @@ class ConanMultiPackager(object):
                 raise Exception("Conanfile not found, specify a 'reference' "
                                 "parameter with name and version")
 
-            conanfile = load_cf_class(os.path.join(self.cwd, self.conanfile), self.conan_api)
+            conanfile = load_recipe_metadata(os.path.join(self.cwd, self.conanfile),
+                                             self.conan_api, self.python_requires_cache)
             name, version = conanfile.name, conanfile.version
             if name and version:
                 self.reference = ConanFileReference(name, version, self.username, self.channel)
@@ -248,7 +291,7 @@ class ConanMultiPackager(object):
                                               vs10_x86_64_enabled,
                                               msvc_versions, msvc_runtimes, msvc_runtime_types,
                                               mingw_configurations, archs, allow_gcc_minors,
-                                              build_types, options, cppstds)
+                                              build_types, options, cppstds, build_rules)
 
         self.build_policy = (build_policy or
                         self.ci_manager.get_commit_build_policy() or
@@ -300,6 +343,11 @@ class ConanMultiPackager(object):
                                           get_bool_from_env("CONAN_DOCKER_IMAGE_SKIP_UPDATE")
         self._docker_image_skip_pull = docker_image_skip_pull or \
                                         get_bool_from_env("CONAN_DOCKER_IMAGE_SKIP_PULL")
+        docker_pull_jobs = docker_pull_jobs or os.getenv("CPT_DOCKER_PULL_JOBS")
+        self.docker_pull_jobs = int(docker_pull_jobs) if docker_pull_jobs else 0
+        self._image_prefetcher = None
+        self.docker_cache_updated_images = docker_cache_updated_images or \
+                                           get_bool_from_env("CPT_DOCKER_CACHE_UPDATED_IMAGES")
 
         self.runner = runner or os.system
         self.output_runner = ConanOutputRunner()
@@ -309,6 +357,10 @@ class ConanMultiPackager(object):
             self.docker_run_options = " ".join(self.docker_run_options)
 
         self.docker_entry_script = docker_entry_script or os.getenv("CONAN_DOCKER_ENTRY_SCRIPT")
+        self.docker_persistent_containers = docker_persistent_containers or \
+                                            get_bool_from_env("CPT_DOCKER_PERSISTENT_CONTAINERS")
+        self.docker_batch_builds = docker_batch_builds or \
+                                   get_bool_from_env("CPT_DOCKER_BATCH_BUILDS")
 
         self.pip_install = pip_install or split_colon_env("CONAN_PIP_INSTALL")
 
@@ -331,8 +383,17 @@ class ConanMultiPackager(object):
         self.force_selinux = force_selinux or get_bool_from_env("CONAN_FORCE_SELINUX")
         self.curpage = curpage or os.getenv("CONAN_CURRENT_PAGE", 1)
         self.total_pages = total_pages or os.getenv("CONAN_TOTAL_PAGES", 1)
-
-        self.conan_pip_package = os.getenv("CONAN_PIP_PACKAGE", "conan==%s" % conan_version)
+        self.pagination = (pagination or os.getenv("CPT_PAGINATION", "sequential")).lower()
+        if self.pagination not in ("sequential", "duration"):
+            raise Exception("Invalid pagination '%s', use 'sequential' or 'duration'"
+                            % self.pagination)
+        self.build_durations = build_durations or os.getenv("CPT_BUILD_DURATIONS")
+        history_db = history_db or os.getenv("CPT_HISTORY_DB")
+        self.history = BuildHistory(history_db) if history_db else None
+        self.pagination_history = pagination_history or \
+                                  get_bool_from_env("CPT_PAGINATION_HISTORY")
+
+        self.conan_pip_package = os.getenv("CONAN_PIP_PACKAGE", "conan==%s" % compat.client_version)
         if self.conan_pip_package in ("0", "False"):
             self.conan_pip_package = ""
         self.vs10_x86_64_enabled = vs10_x86_64_enabled
@@ -351,6 +412,38 @@ class ConanMultiPackager(object):
 
         self.lockfile = lockfile or os.getenv("CONAN_LOCKFILE")
 
+        self.parallel_jobs = get_parallel_jobs(parallel_jobs or os.getenv("CPT_PARALLEL_JOBS"))
+        self.download_cache = download_cache or os.getenv("CPT_DOWNLOAD_CACHE")
+        self.docker_storage_volume = docker_storage_volume or \
+                                     os.getenv("CPT_DOCKER_STORAGE_VOLUME")
+        if self.docker_storage_volume and self.parallel_jobs > 1:
+            raise Exception("The Docker storage volume can't be shared by parallel builds, "
+                            "Conan doesn't lock the package storage between containers. Set "
+                            "'parallel_jobs' to 1 or remove 'docker_storage_volume'")
+        if self.docker_batch_builds and self.parallel_jobs > 1:
+            raise Exception("The Docker batch builds run in a single container, they can't be "
+                            "combined with 'parallel_jobs'")
+
+        self.skip_existing_packages = skip_existing_packages or \
+                                      get_bool_from_env("CPT_SKIP_EXISTING_PACKAGES")
+        if self.skip_existing_packages and not compat.supports_skip_packages:
+            raise Exception("Skipping existing packages requires Conan >= 1.18")
+        remote_packages_cache = remote_packages_cache or \
+                                os.getenv("CPT_REMOTE_PACKAGES_CACHE") or \
+                                os.path.join(tempfile.gettempdir(), "cpt_remote_packages.json")
+        remote_packages_ttl = int(remote_packages_ttl or os.getenv("CPT_REMOTE_PACKAGES_TTL", 600))
+        self.skip_duplicated_packages = skip_duplicated_packages or \
+                                        get_bool_from_env("CPT_SKIP_DUPLICATED_PACKAGES")
+        if self.skip_duplicated_packages and not compat.supports_skip_packages:
+            raise Exception("Skipping duplicated packages requires Conan >= 1.18")
+        self.skip_invalid_configurations = skip_invalid_configurations or \
+                                           get_bool_from_env("CPT_SKIP_INVALID_CONFIGURATIONS")
+        if self.skip_invalid_configurations and not compat.supports_skip_packages:
+            raise Exception("Skipping invalid configurations requires Conan >= 1.18")
+        self._analyzers = {}
+        self.remote_packages = RemotePackagesCache(self.conan_api, self.printer,
+                                                   remote_packages_cache, remote_packages_ttl)
+
         def valid_pair(var, value):
             return (isinstance(value, six.string_types) or
                     isinstance(value, bool) or
@@ -397,7 +490,10 @@ class ConanMultiPackager(object):
 
     @property
     def items(self):
-        return self._builds
+        if self._lazy_steps:
+            self._builds = BuildMatrix(self.iter_items())
+            self._lazy_steps = []
+        return self._builds.to_list()
 
     @items.setter
     def items(self, confs):
@@ -411,13 +507,14 @@ class ConanMultiPackager(object):
                                    ".builds is deprecated use '.items' instead (unpack 5 elements: "
                                    "settings, options, env_vars, build_requires, reference  *******"
                                    "**\n\n\n")
-        return [elem[0:4] for elem in self._builds]
+        return [elem[0:4] for elem in self.items]
 
     @builds.setter
     def builds(self, confs):
         """For retro compatibility directly assigning builds"""
         self._named_builds = {}
-        self._builds = []
+        self._builds = BuildMatrix()
+        self._lazy_steps = []
         for values in confs:
             if len(values) == 2:
                 self._builds.append(BuildConf(values[0], values[1], {}, {}, self.reference))
@@ -436,7 +533,8 @@ class ConanMultiPackager(object):
 
     @named_builds.setter
     def named_builds(self, confs):
-        self._builds = []
+        self._builds = BuildMatrix()
+        self._lazy_steps = []
         self._named_builds = {}
         for key, pages in confs.items():
             for values in pages:
@@ -458,6 +556,11 @@ class ConanMultiPackager(object):
     def add_common_builds(self, shared_option_name=None, pure_c=None,
                           dll_with_static_runtime=False, reference=None, header_only=True,
                           build_all_options_values=None):
+        if self._get_plan() is not None:
+            self.printer.print_message("Using the build plan '%s', the build configurations are "
+                                       "not generated" % self.build_plan)
+            return
+
         if reference:
             if "@" in reference:
                 reference = ConanFileReference.loads(reference)
@@ -483,58 +586,36 @@ class ConanMultiPackager(object):
 
         conanfile = None
         if os.path.exists(os.path.join(self.cwd, self.conanfile)):
-            conanfile = load_cf_class(os.path.join(self.cwd, self.conanfile), self.conan_api)
-
-        header_only_option = None
-        if conanfile:
-            if hasattr(conanfile, "options") and conanfile.options and "header_only" in conanfile.options:
-                header_only_option = "%s:header_only" % reference.name
+            conanfile = load_recipe_metadata(os.path.join(self.cwd, self.conanfile),
+                                             self.conan_api, self.python_requires_cache)
 
         if shared_option_name is None:
             if conanfile:
                 if hasattr(conanfile, "options") and conanfile.options and "shared" in conanfile.options:
                     shared_option_name = "%s:shared" % reference.name
 
-        # filter only valid options
-        raw_options_for_building = [opt[opt.find(":") + 1:] for opt in build_all_options_values]
-        for raw_option in reversed(raw_options_for_building):
-            if hasattr(conanfile, "options") and conanfile.options and \
-               not isinstance(conanfile.options.get(raw_option), list):
-                raw_options_for_building.remove(raw_option)
-        if raw_options_for_building and conanfile:
-            # get option and its values
-            cloned_options = copy.copy(conanfile.options)
-            for key, value in conanfile.options.items():
-                if key == "shared" and shared_option_name:
-                    continue
-                elif key not in raw_options_for_building:
-                    del cloned_options[key]
-            cloned_options2 = {}
-            for key, value in cloned_options.items():
-                # add package reference to the option name
-                if not key.startswith("{}:".format(reference.name)):
-                    cloned_options2["{}:{}".format(reference.name, key)] = value
-            # combine all options x values (cartesian product)
-            build_all_options_values = [dict(zip(cloned_options2, v)) for v in product(*cloned_options2.values())]
-
-        builds = self.build_generator.get_builds(pure_c, shared_option_name,
-                                                 dll_with_static_runtime, reference,
-                                                 build_all_options_values)
-
-        if header_only_option and header_only:
-            if conanfile.default_options.get("header_only"):
-                cloned_builds = copy.deepcopy(builds)
-                for settings, options, env_vars, build_requires, reference in cloned_builds:
-                    options.update({header_only_option: False})
-                builds.extend(cloned_builds)
-            else:
-                settings, options, env_vars, build_requires, reference = builds[0]
-                cloned_options = copy.copy(options)
-                cloned_options.update({header_only_option: True})
-                builds.append(BuildConf(copy.copy(settings), cloned_options, copy.copy(env_vars),
-                                        copy.copy(build_requires), reference))
-
-        self._builds.extend(builds)
+        build_all_options_values = get_all_options_values(conanfile, reference.name,
+                                                          shared_option_name,
+                                                          build_all_options_values)
+
+        builds = self.build_generator.builds_matrix(pure_c, shared_option_name,
+                                                    dll_with_static_runtime, reference,
+                                                    build_all_options_values)
+        for rule in self.build_generator.ignored_rules(builds):
+            self.printer.print_message("WARNING", "The build rule %s is ignored, no generated "
+                                                  "configuration has all its settings and "
+                                                  "options" % (rule, ))
+        self._add_builds(builds)
+
+        header_only_builds = get_header_only_builds(conanfile, reference.name, builds)
+        if header_only_builds is not None and header_only:
+            self._add_builds(header_only_builds)
+
+    def _add_builds(self, builds):
+        if self.lazy_matrix:
+            self._lazy_steps.append(("add", builds))
+        else:
+            self._builds.extend(builds)
 
     def add(self, settings=None, options=None, env_vars=None, build_requires=None, reference=None):
         settings = settings or {}
@@ -545,35 +626,86 @@ class ConanMultiPackager(object):
             reference = ConanFileReference.loads("%s@%s/%s" % (reference,
                                                                self.username, self.channel))
         reference = reference or self.reference
-        self._builds.append(BuildConf(settings, options, env_vars, build_requires, reference))
+        self._add_builds([BuildConf(settings, options, env_vars, build_requires, reference)])
 
     def remove_build_if(self, predicate):
+        """ 'predicate' is a function or a selector dict, e.g. {"compiler": "gcc", "arch": "x86"},
+        resolved with the indexes of the build matrix"""
+        if self._lazy_steps:
+            if isinstance(predicate, dict):
+                predicate = selector_predicate(predicate)
+            self._lazy_steps.append(("remove", predicate))
+            return
+        if isinstance(predicate, dict):
+            self._builds.remove(predicate)
+            return
         filtered_builds = []
         for build in self.items:
             if not predicate(build):
                 filtered_builds.append(build)
 
-        self._builds = filtered_builds
+        self._builds = BuildMatrix(filtered_builds)
 
     def update_build_if(self, predicate, new_settings=None, new_options=None, new_env_vars=None,
                         new_build_requires=None, new_reference=None):
+        """ 'predicate' is a function or a selector dict, e.g. {"compiler": "gcc", "arch": "x86"},
+        resolved with the indexes of the build matrix"""
+        if self._lazy_steps:
+            if isinstance(predicate, dict):
+                predicate = selector_predicate(predicate)
+            self._lazy_steps.append(("update", predicate, (new_settings, new_options,
+                                                           new_env_vars, new_build_requires,
+                                                           new_reference)))
+            return
+        if isinstance(predicate, dict):
+            self._builds.update(predicate, new_settings, new_options, new_env_vars,
+                                new_build_requires, new_reference)
+            return
         updated_builds = []
         for build in self.items:
             if predicate(build):
-                if new_settings:
-                    build.settings.update(new_settings)
-                if new_options:
-                    build.options.update(new_options)
-                if new_build_requires:
-                    build.build_requires.update(new_build_requires)
-                if new_env_vars:
-                    build.env_vars.update(new_env_vars)
-                if new_reference:
-                    build.reference = new_reference
+                build = build.updated(new_settings, new_options, new_env_vars,
+                                      new_build_requires, new_reference)
             updated_builds.append(build)
-        self._builds = updated_builds
-
-    def run(self, base_profile_name=None, summary_file=None, base_profile_build_name=None):
+        self._builds = BuildMatrix(updated_builds)
+
+    def select_builds(self, selector):
+        """ Build configurations matching a selector dict, e.g. {"compiler": "gcc"}"""
+        if self._lazy_steps:
+            predicate = selector_predicate(selector)
+            return [build for build in self.iter_items() if predicate(build)]
+        return self._builds.select(selector)
+
+    def remove_duplicated_builds(self):
+        self._builds = BuildMatrix(remove_duplicated_builds(self.items))
+
+    def iter_items(self):
+        """ Iterates the build configurations. In lazy mode they are generated, filtered and
+        updated one by one, without materializing the full matrix"""
+        builds = iter(self._builds)
+        for step in self._lazy_steps:
+            if step[0] == "add":
+                builds = chain(builds, step[1])
+            elif step[0] == "remove":
+                builds = _iter_not_matching(builds, step[1])
+            else:
+                builds = _iter_updated_matching(builds, step[1], step[2])
+        return builds
+
+    def count_builds(self):
+        """ Number of build configurations. The generated matrices that are not filtered are
+        counted without generating them"""
+        if all(step[0] != "remove" for step in self._lazy_steps):
+            sizes = [matrix_size(step[1]) for step in self._lazy_steps if step[0] == "add"]
+            if None not in sizes:
+                return len(self._builds) + sum(sizes)
+        return sum(1 for _ in self.iter_items())
+
+    def _has_items(self):
+        return bool(self._builds) or any(step[0] == "add" for step in self._lazy_steps)
+
+    def run(self, base_profile_name=None, summary_file=None, base_profile_build_name=None,
+            build_filter=None):
         env_vars = self.auth_manager.env_vars()
         env_vars.update(self.remotes_manager.env_vars())
         with tools.environment_append(env_vars):
@@ -581,6 +713,9 @@ class ConanMultiPackager(object):
             if self.ci_manager.skip_builds():
                 self.printer.print_message("Skipped builds due [skip ci] commit message")
                 return 99
+            if self.plan_only:
+                self.save_build_plan(base_profile_name=base_profile_name)
+                return
             if not self.skip_check_credentials and self._upload_enabled():
                 self.auth_manager.login(self.remotes_manager.upload_remote_name)
             if self.conan_pip_package and not self.use_docker:
@@ -595,7 +730,8 @@ class ConanMultiPackager(object):
                                                           self.pip_command, packages))
 
             self.run_builds(base_profile_name=base_profile_name,
-                            base_profile_build_name=base_profile_build_name)
+                            base_profile_build_name=base_profile_build_name,
+                            build_filter=build_filter)
 
         summary_file = summary_file or os.getenv("CPT_SUMMARY_FILE", None)
         if summary_file:
@@ -634,163 +770,652 @@ class ConanMultiPackager(object):
         return True
 
     def run_builds(self, curpage=None, total_pages=None, base_profile_name=None,
-                   base_profile_build_name=None):
-        if len(self.named_builds) > 0 and len(self.items) > 0:
+                   base_profile_build_name=None, build_filter=None):
+        if len(self.named_builds) > 0 and self._has_items():
             raise Exception("Both bulk and named builds are set. Only one is allowed.")
 
+        build_filter = build_filter or self.build_filter
         self.builds_in_current_page = []
-        if len(self.items) > 0:
+        page_duplicates = []
+        plan = self._get_plan()
+        if plan is not None:
+            curpage = curpage or self.curpage
+            total_pages = total_pages or int(self.total_pages)
+            if plan.total_pages is not None and plan.total_pages != total_pages:
+                raise Exception("The build plan '%s' has %s pages, not %s"
+                                % (self.build_plan, plan.total_pages, total_pages))
+            self.builds_in_current_page, page_duplicates = plan.page(curpage)
+            self.builds_in_current_page = self._filter_builds(self.builds_in_current_page,
+                                                              build_filter)
+        elif self._lazy_steps and self.pagination == "sequential" and \
+                not self.skip_duplicated_packages and not self.sampling_strength:
+            curpage = curpage or int(self.curpage)
+            total_pages = total_pages or int(self.total_pages)
+            # Only the builds of the current page are kept in memory
+            self.builds_in_current_page = list(islice(self._filter_builds(self.iter_items(),
+                                                                          build_filter),
+                                                      curpage - 1, None, total_pages))
+        elif self._has_items():
             curpage = curpage or int(self.curpage)
             total_pages = total_pages or int(self.total_pages)
-            for index, build in enumerate(self.items):
-                if curpage is None or total_pages is None or (index % total_pages) + 1 == curpage:
+            items, duplicates, pages = self._paginate(self._filter_builds(self.items,
+                                                                          build_filter),
+                                                      total_pages, base_profile_name)
+            for build, build_duplicates, page in zip(items, duplicates, pages):
+                if page == curpage:
                     self.builds_in_current_page.append(build)
+                    page_duplicates.extend(build_duplicates)
         elif len(self.named_builds) > 0:
             curpage = curpage or self.curpage
             if curpage not in self.named_builds:
                 raise Exception("No builds set for page %s" % curpage)
-            for build in self.named_builds[curpage]:
+            for build in self._filter_builds(self.named_builds[curpage], build_filter):
                 self.builds_in_current_page.append(build)
+            if self.skip_duplicated_packages:
+                self.builds_in_current_page, duplicates = self._collapse_duplicated_packages(
+                    self.builds_in_current_page, base_profile_name)
+                for build_duplicates in duplicates:
+                    page_duplicates.extend(build_duplicates)
 
         self.printer.print_current_page(curpage, total_pages)
         self.printer.print_jobs(self.builds_in_current_page)
+        self._packages_summary.extend(page_duplicates)
 
         pulled_docker_images = defaultdict(lambda: False)
         skip_recipe_export = False
 
         base_profile_build_name = base_profile_build_name or os.getenv("CONAN_BASE_PROFILE_BUILD")
         if base_profile_build_name is not None:
-            if get_client_version() < Version("1.24.0"):
+            if not get_compat().supports_profile_build:
                 raise Exception("Conan Profile Build requires >= 1.24")
             self.printer.print_message("**************************************************")
             self.printer.print_message("Using specified "
                                         "build profile: %s" % base_profile_build_name)
             self.printer.print_message("**************************************************")
 
-        # FIXME: Remove in Conan 1.3, https://github.com/conan-io/conan/issues/2787
-        for index, build in enumerate(self.builds_in_current_page):
-            self.printer.print_message("Build: %s/%s" % (index+1, len(self.builds_in_current_page)))
-            base_profile_name = base_profile_name or os.getenv("CONAN_BASE_PROFILE")
-            if base_profile_name:
-                self.printer.print_message("**************************************************")
-                self.printer.print_message("Using specified default "
-                                           "base profile: %s" % base_profile_name)
-                self.printer.print_message("**************************************************")
-                if self.config_url:
-                    ConfigManager(self.conan_api, self.printer).install(url=self.config_url, args=self.config_args)
+        if self.skip_invalid_configurations:
+            self._skip_invalid_configurations(base_profile_name)
+
+        if self.skip_existing_packages:
+            self._skip_existing_packages(base_profile_name)
+
+        self._image_prefetcher = self._get_image_prefetcher()
+
+        if self.parallel_jobs > 1 and len(self.builds_in_current_page) > 1:
+            if self.use_docker:
+                self._run_parallel_docker_builds(base_profile_name, base_profile_build_name)
+            else:
+                self._run_parallel_builds(base_profile_name, base_profile_build_name)
+            return
+
+        if self.use_docker and self.docker_batch_builds:
+            self._run_docker_batches(base_profile_name, base_profile_build_name)
+            return
+
+        containers = None
+        if self.use_docker and self.docker_persistent_containers:
+            containers = ContainerPool(self.runner, self.printer, self.sudo_docker_command)
+        try:
+            # FIXME: Remove in Conan 1.3, https://github.com/conan-io/conan/issues/2787
+            for index, build in enumerate(self.builds_in_current_page):
+                self.printer.print_message("Build: %s/%s" % (index+1, len(self.builds_in_current_page)))
+                base_profile_name = base_profile_name or os.getenv("CONAN_BASE_PROFILE")
+                if base_profile_name:
+                    self.printer.print_message("**************************************************")
+                    self.printer.print_message("Using specified default "
+                                               "base profile: %s" % base_profile_name)
+                    self.printer.print_message("**************************************************")
+                    if self.config_url:
+                        ConfigManager(self.conan_api, self.printer).install(url=self.config_url, args=self.config_args)
+
+                profile_text, base_profile_text = get_profiles(self.client_cache, build,
+                                                               base_profile_name)
+                profile_build_text, base_profile_build_text = get_profiles(self.client_cache, build,
+                                                          base_profile_build_name, True)
+                if not self.use_docker:
+                    profile_abs_path = save_profile_to_tmp(profile_text)
+                    if base_profile_build_text:
+                        profile_build_abs_path = save_profile_to_tmp(profile_build_text)
+                    else:
+                        profile_build_abs_path = None
+                    r = CreateRunner(profile_abs_path, build.reference, self.conan_api,
+                                     self.uploader,
+                                     exclude_vcvars_precommand=self.exclude_vcvars_precommand,
+                                     build_policy=self.build_policy,
+                                     require_overrides=self.require_overrides,
+                                     runner=self.runner,
+                                     cwd=self.cwd,
+                                     printer=self.printer,
+                                     upload=self._upload_enabled(),
+                                     upload_only_recipe=self.upload_only_recipe,
+                                     test_folder=self.test_folder,
+                                     config_url=self.config_url,
+                                     config_args=self.config_args,
+                                     upload_dependencies=self.upload_dependencies,
+                                     conanfile=self.conanfile,
+                                     lockfile=self.lockfile,
+                                     skip_recipe_export=skip_recipe_export,
+                                     update_dependencies=self.update_dependencies,
+                                     profile_build_abs_path=profile_build_abs_path,
+                                     global_conf=self.global_conf,
+                                     )
+                    with self._record_build(build, "local", r):
+                        r.run()
+                    self._packages_summary.append({"configuration":  build, "package" : r.results})
+                else:
+                    if not base_profile_build_text:
+                        profile_build_text = None
+                    docker_image = self._get_docker_image(build)
+                    r = self._get_docker_runner(build, docker_image, profile_text, base_profile_text,
+                                                base_profile_name, profile_build_text,
+                                                base_profile_build_text, skip_recipe_export)
+
+                    if containers is not None:
+                        container = containers.container(r, docker_image,
+                                                         self.docker_entry_script)
+                        with self._record_build(build, "docker", r):
+                            r.run(container=container)
+                    else:
+                        with self._record_build(build, "docker", r):
+                            r.run(pull_image=not pulled_docker_images[docker_image],
+                                  docker_entry_script=self.docker_entry_script)
+                        pulled_docker_images[docker_image] = True
+
+                skip_recipe_export = self.skip_recipe_export
+        finally:
+            if containers is not None:
+                containers.close()
+
+    def _get_image_prefetcher(self):
+        """ Starts pulling the Docker images of the current page in the background, when
+        'docker_pull_jobs' is set. The runners wait for their image instead of pulling it"""
+        if not self.use_docker or not self.docker_pull_jobs or self._docker_image_skip_pull:
+            return None
+        docker_images = list(OrderedDict.fromkeys(self._get_docker_image(build)
+                                                  for build in self.builds_in_current_page))
+        if not docker_images:
+            return None
+        self.printer.print_message("Pulling %s Docker images with %s parallel jobs"
+                                   % (len(docker_images), self.docker_pull_jobs))
+        if self.runner is os.system:
+            runner = PrefixedOutputRunner("pull", output=self.printer.printer)
+        else:
+            runner = self.runner
+        return ImagePrefetcher(runner, self.printer, docker_images, self.docker_pull_jobs,
+                               self.sudo_docker_command)
+
+    def _run_docker_batches(self, base_profile_name, base_profile_build_name):
+        """ Builds the configurations of the current page that use the same Docker image with a
+        single 'run_create_in_docker --batch', so the Conan client, remotes and credentials are
+        set up once per image. The outcome of every build is added to the summary"""
+        base_profile_name = base_profile_name or os.getenv("CONAN_BASE_PROFILE")
+        batches = OrderedDict()
+        for build in self.builds_in_current_page:
+            batches.setdefault(self._get_docker_image(build), []).append(build)
+
+        containers = None
+        if self.docker_persistent_containers:
+            containers = ContainerPool(self.runner, self.printer, self.sudo_docker_command,
+                                       batch_folders=True)
+        skip_recipe_export = False
+        pending = list(batches.values())
+        try:
+            for index, (docker_image, builds) in enumerate(batches.items()):
+                self.printer.print_message("Batch: %s/%s, %s builds in '%s'"
+                                           % (index + 1, len(batches), len(builds),
+                                              docker_image))
+                configurations = []
+                for build in builds:
+                    profile_text, base_profile_text = get_profiles(self.client_cache, build,
+                                                                   base_profile_name)
+                    profile_build_text, base_profile_build_text = get_profiles(
+                        self.client_cache, build, base_profile_build_name, True)
+                    if not base_profile_build_text:
+                        profile_build_text = None
+                    configurations.append({"reference": str(build.reference),
+                                           "profile": profile_text,
+                                           "base_profile": base_profile_text,
+                                           "profile_build": profile_build_text,
+                                           "skip_recipe_export": skip_recipe_export})
+                    skip_recipe_export = self.skip_recipe_export
+
+                first = configurations[0]
+                r = self._get_docker_runner(builds[0], docker_image, first["profile"],
+                                            first["base_profile"], base_profile_name,
+                                            first["profile_build"], None,
+                                            first["skip_recipe_export"])
+                container, batch_folder = None, None
+                if containers is not None:
+                    container = containers.container(r, docker_image, self.docker_entry_script)
+                    batch_folder = containers.batch_folder(container)
+                pending.pop(0)
+                try:
+                    r.run_batch(configurations, docker_entry_script=self.docker_entry_script,
+                                container=container, batch_folder=batch_folder)
+                finally:
+                    self._record_batch(builds, r.batch_results)
+        finally:
+            # The batches of the other images are not run after a failure
+            for builds in pending:
+                self._record_batch(builds, [])
+            if containers is not None:
+                containers.close()
+
+    def _record_batch(self, builds, outcomes):
+        """ Adds the outcomes of the builds of a batch, returned by the container, to the
+        summary and the history. The builds without outcome, after a failed one, are added as
+        not run"""
+        for build, outcome in zip(builds, outcomes):
+            if outcome["outcome"] != "failed":
+                self._packages_summary.append({"configuration": build,
+                                               "package": outcome["results"]})
+            if self.history:
+                self.history.record(build, "docker", outcome["started"], outcome["finished"],
+                                    outcome["outcome"], outcome["phases"])
+        now = time.time()
+        for build in builds[len(outcomes or []):]:
+            self._packages_summary.append({"configuration": build, "package": None,
+                                           "status": "not run"})
+            if self.history:
+                self.history.record(build, "docker", now, now, "not run")
+
+    def _get_analyzer(self, base_profile_name):
+        base_profile_name = base_profile_name or os.getenv("CONAN_BASE_PROFILE")
+        if base_profile_name not in self._analyzers:
+            self._analyzers[base_profile_name] = BuildAnalyzer(self.conan_api,
+                                                               os.path.join(self.cwd,
+                                                                            self.conanfile),
+                                                               self.printer, self.client_cache,
+                                                               base_profile_name)
+        return self._analyzers[base_profile_name]
+
+    def _filter_builds(self, builds, build_filter):
+        """ The builds matching the filter expression. Lists are filtered to a list, other
+        iterables are filtered lazily"""
+        if not build_filter:
+            return builds
+        predicate = compile_build_filter(build_filter)
+        if not isinstance(builds, list):
+            self.printer.print_message("Build filter: %s" % build_filter)
+            return (build for build in builds if predicate(build))
+        matching = [build for build in builds if predicate(build)]
+        self.printer.print_message("Build filter: %s, %s of %s configurations"
+                                   % (build_filter, len(matching), len(builds)))
+        return matching
+
+    def _paginate(self, builds, total_pages, base_profile_name):
+        """ The builds to run, the summary entries of the builds collapsed into each of them and
+        the page of each of them"""
+        if self.sampling_strength:
+            builds = self._sample_builds(builds)
+        duplicates = [[]] * len(builds)
+        if self.skip_duplicated_packages:
+            builds, duplicates = self._collapse_duplicated_packages(builds, base_profile_name)
+        if self.pagination == "duration":
+            pages = self._get_duration_pages(builds, total_pages)
+        else:
+            pages = [(index % total_pages) + 1 for index in range(len(builds))]
+        return builds, duplicates, pages
+
+    def _get_plan(self):
+        """ The build plan to load the builds of the page from, if any"""
+        if self._plan is None and self.build_plan and not self.plan_only and \
+                os.path.exists(self.build_plan):
+            plan = BuildPlan.load(self.build_plan)
+            recipe_hash = get_recipe_hash(os.path.join(self.cwd, self.conanfile))
+            if plan.recipe_hash != recipe_hash:
+                raise Exception("The build plan '%s' was generated for a different recipe, "
+                                "generate it again" % self.build_plan)
+            self._plan = plan
+        return self._plan
+
+    def save_build_plan(self, path=None, total_pages=None, base_profile_name=None):
+        """ Saves the builds of all the pages to a file, so the pages load them from it instead of
+        generating the build matrix"""
+        path = path or self.build_plan
+        if not path:
+            raise Exception("Specify the build plan file with 'build_plan' or CPT_BUILD_PLAN")
+        base_profile_name = base_profile_name or os.getenv("CONAN_BASE_PROFILE")
+        recipe_hash = get_recipe_hash(os.path.join(self.cwd, self.conanfile))
+        if self.named_builds:
+            plan = BuildPlan(None, recipe_hash)
+            for page, builds in self.named_builds.items():
+                for build in builds:
+                    plan.add(build, page)
+        else:
+            total_pages = total_pages or int(self.total_pages)
+            plan = BuildPlan(total_pages, recipe_hash)
+            builds, duplicates, pages = self._paginate(self._filter_builds(self.items,
+                                                                           self.build_filter),
+                                                       total_pages, base_profile_name)
+            for build, build_duplicates, page in zip(builds, duplicates, pages):
+                plan.add(build, page, [(duplicate["configuration"], duplicate["package_id"])
+                                       for duplicate in build_duplicates])
+        plan.save(path)
+        self.printer.print_message("Build plan saved to '%s': %s configurations in %s pages"
+                                   % (path, len(plan), len(plan.pages)))
+        return plan
+
+    def _sample_builds(self, builds):
+        sample = covering_sample(builds, self.sampling_strength)
+        self.printer.print_message("Matrix sampling (%s-wise): building %s of %s configurations"
+                                   % (self.sampling_strength, len(sample), len(builds)))
+        return sample
+
+    def _collapse_duplicated_packages(self, builds, base_profile_name):
+        """ Groups the configurations by reference and package ID. Returns the first
+        configuration of every group, and for each of them the summary entries of the rest of
+        the group, which are not built"""
+        analyzer = self._get_analyzer(base_profile_name)
+        representatives = []
+        duplicates = []
+        groups = {}
+        for build in builds:
+            package_id = analyzer.package_id(build)
+            key = (str(build.reference), package_id)
+            if package_id in (None, INVALID_PACKAGE_ID) or key not in groups:
+                groups[key] = len(representatives)
+                representatives.append(build)
+                duplicates.append([])
+                continue
+            representative = representatives[groups[key]]
+            self.printer.print_message("Configuration %s generates the same package '%s:%s' as %s"
+                                       % (build.settings, build.reference, package_id,
+                                          representative.settings))
+            duplicates[groups[key]].append({"configuration": build, "package": None,
+                                            "status": "duplicate", "package_id": package_id,
+                                            "duplicate_of": representative})
+        collapsed = len(builds) - len(representatives)
+        if collapsed:
+            self.printer.print_message("%s configurations collapsed, they generate the same "
+                                       "package as other configuration" % collapsed)
+        return representatives, duplicates
+
+    def _skip_invalid_configurations(self, base_profile_name):
+        """ Removes from the current page the configurations rejected by the recipe, before
+        creating any runner or pulling any Docker image"""
+        analyzer = self._get_analyzer(base_profile_name)
+        valid = []
+        for build in self.builds_in_current_page:
+            if analyzer.is_valid(build):
+                valid.append(build)
+            else:
+                self.printer.print_message("Invalid configuration %s, rejected by the recipe, "
+                                           "skipping the build" % build.settings)
+                self._packages_summary.append({"configuration": build, "package": None,
+                                               "status": "invalid"})
+        self.builds_in_current_page = valid
+
+    def _skip_existing_packages(self, base_profile_name):
+        """ Removes from the current page the configurations whose binary is already in the upload
+        remote, they are reported as "up to date" in the summary"""
+        remote_name = self.remotes_manager.upload_remote_name
+        if not remote_name:
+            self.printer.print_message("No upload remote, can't skip the existing packages")
+            return
 
+        analyzer = self._get_analyzer(base_profile_name)
+        pending = []
+        for build in self.builds_in_current_page:
+            package_id = analyzer.package_id(build)
+            existing = None
+            recipe_hash = analyzer.exported_recipe_hash(build.reference) if package_id else None
+            if recipe_hash:
+                existing = self.remote_packages.package_ids(remote_name,
+                                                            self.remotes_manager.upload_remote_url,
+                                                            build.reference, recipe_hash)
+            if existing and package_id in existing:
+                self.printer.print_message("Package '%s:%s' already in remote '%s', skipping "
+                                           "the build" % (build.reference, package_id,
+                                                          remote_name))
+                self._packages_summary.append({"configuration": build, "package": None,
+                                               "status": "up to date",
+                                               "package_id": package_id})
+            else:
+                pending.append(build)
+        self.builds_in_current_page = pending
+
+    def _get_duration_pages(self, builds, total_pages):
+        durations = get_build_durations(builds, self._get_recorded_durations())
+        pages = assign_pages(durations, total_pages)
+        loads = defaultdict(float)
+        for page, duration in zip(pages, durations):
+            loads[page] += duration
+        self.printer.print_message("Pages assigned by duration, estimated load: %s"
+                                   % ", ".join("%s: %.1f" % (page, loads[page])
+                                               for page in sorted(loads)))
+        return pages
+
+    def _get_recorded_durations(self):
+        """ Durations of the duration pagination. Every page has to compute the same ones, so the
+        history database of the host is only used with 'pagination_history', when all the pages
+        share it"""
+        durations = {}
+        if self.history and self.pagination_history:
+            durations.update(self.history.durations())
+        if isinstance(self.build_durations, dict):
+            durations.update(self.build_durations)
+        else:
+            durations.update(load_recorded_durations(self.build_durations))
+        return durations
+
+    @contextmanager
+    def _record_build(self, build, runner_name, runner):
+        """ Stores the build in the history database, if any, whatever its outcome"""
+        started = time.time()
+        try:
+            yield
+        except Exception:
+            if self.history:
+                self.history.record(build, runner_name, started, time.time(), "failed",
+                                    runner.phases.durations)
+            raise
+        if self.history:
+            # The recipe can reject a configuration, then there are no results
+            outcome = "skipped" if getattr(runner, "results", True) is None else "success"
+            self.history.record(build, runner_name, started, time.time(), outcome,
+                                runner.phases.durations)
+
+    def _run_parallel_builds(self, base_profile_name, base_profile_build_name):
+        """ Runs the builds of the current page in up to 'parallel_jobs' local subprocesses.
+        Every worker owns an isolated Conan user home, all of them share the download cache"""
+        base_profile_name = base_profile_name or os.getenv("CONAN_BASE_PROFILE")
+        builds = self.builds_in_current_page
+        jobs = min(self.parallel_jobs, len(builds))
+        self.printer.print_message("Running %s builds with %s parallel jobs" % (len(builds), jobs))
+
+        workers_folder = tempfile.mkdtemp(prefix="cpt_workers_")
+        download_cache = self.download_cache or os.path.join(workers_folder, "download_cache")
+        seed_conan_folder = os.path.dirname(self.client_cache.profiles_path) \
+                            if self.client_cache else None
+        conan_homes = Queue()
+        for worker in range(jobs):
+            conan_homes.put(os.path.join(workers_folder, "worker%s" % worker))
+
+        runners = []
+        for index, build in enumerate(builds):
             profile_text, base_profile_text = get_profiles(self.client_cache, build,
                                                            base_profile_name)
             profile_build_text, base_profile_build_text = get_profiles(self.client_cache, build,
-                                                      base_profile_build_name, True)
-            if not self.use_docker:
-                profile_abs_path = save_profile_to_tmp(profile_text)
-                if base_profile_build_text:
-                    profile_build_abs_path = save_profile_to_tmp(profile_build_text)
-                else:
-                    profile_build_abs_path = None
-                r = CreateRunner(profile_abs_path, build.reference, self.conan_api,
-                                 self.uploader,
-                                 exclude_vcvars_precommand=self.exclude_vcvars_precommand,
-                                 build_policy=self.build_policy,
-                                 require_overrides=self.require_overrides,
-                                 runner=self.runner,
-                                 cwd=self.cwd,
-                                 printer=self.printer,
-                                 upload=self._upload_enabled(),
-                                 upload_only_recipe=self.upload_only_recipe,
-                                 test_folder=self.test_folder,
-                                 config_url=self.config_url,
-                                 config_args=self.config_args,
-                                 upload_dependencies=self.upload_dependencies,
-                                 conanfile=self.conanfile,
-                                 lockfile=self.lockfile,
-                                 skip_recipe_export=skip_recipe_export,
-                                 update_dependencies=self.update_dependencies,
-                                 profile_build_abs_path=profile_build_abs_path,
-                                 global_conf=self.global_conf,
-                                 )
-                r.run()
-                self._packages_summary.append({"configuration":  build, "package" : r.results})
+                                                                       base_profile_build_name,
+                                                                       True)
+            if not base_profile_build_text:
+                profile_build_text = None
+            runners.append(SubprocessCreateRunner(profile_text, base_profile_text,
+                                                  base_profile_name, build.reference,
+                                                  seed_conan_folder=seed_conan_folder,
+                                                  download_cache=download_cache,
+                                                  prefix="%s/%s" % (index + 1, len(builds)),
+                                                  exclude_vcvars_precommand=self.exclude_vcvars_precommand,
+                                                  build_policy=self.build_policy,
+                                                  require_overrides=self.require_overrides,
+                                                  upload=self._upload_enabled(),
+                                                  upload_retry=self.upload_retry,
+                                                  upload_only_recipe=self.upload_only_recipe,
+                                                  upload_force=self.upload_force,
+                                                  test_folder=self.test_folder,
+                                                  config_url=self.config_url,
+                                                  config_args=self.config_args,
+                                                  printer=self.printer,
+                                                  upload_dependencies=self.upload_dependencies,
+                                                  conanfile=self.conanfile,
+                                                  lockfile=self.lockfile,
+                                                  update_dependencies=self.update_dependencies,
+                                                  profile_build_text=profile_build_text,
+                                                  base_profile_build_text=base_profile_build_text,
+                                                  global_conf=self.global_conf,
+                                                  cwd=self.cwd))
+
+        def run_runner(args):
+            build, runner = args
+            conan_home = conan_homes.get()
+            try:
+                with self._record_build(build, "subprocess", runner):
+                    runner.run(conan_home)
+            finally:
+                conan_homes.put(conan_home)
+            return runner.results
+
+        try:
+            outcomes = run_in_pool(run_runner, zip(builds, runners), jobs)
+        finally:
+            shutil.rmtree(workers_folder, ignore_errors=True)
+
+        errors = []
+        for index, (build, (results, error)) in enumerate(zip(builds, outcomes)):
+            if error:
+                errors.append("Build %s/%s: %s" % (index + 1, len(builds), error))
+            else:
+                self._packages_summary.append({"configuration": build, "package": results})
+        if errors:
+            raise Exception("%s of %s parallel builds failed:\n%s" % (len(errors), len(builds),
+                                                                     "\n".join(errors)))
+
+    def _get_docker_runner(self, build, docker_image, profile_text, base_profile_text,
+                           base_profile_name, profile_build_text, base_profile_build_text,
+                           skip_recipe_export, runner=None, docker_run_options=None):
+        return DockerCreateRunner(profile_text, base_profile_text, base_profile_name,
+                                  build.reference,
+                                  conan_pip_package=self.conan_pip_package,
+                                  docker_image=docker_image,
+                                  sudo_docker_command=self.sudo_docker_command,
+                                  sudo_pip_command=self.sudo_pip_command,
+                                  docker_image_skip_update=self._docker_image_skip_update,
+                                  docker_image_skip_pull=self._docker_image_skip_pull,
+                                  build_policy=self.build_policy,
+                                  require_overrides=self.require_overrides,
+                                  always_update_conan_in_docker=self._update_conan_in_docker,
+                                  upload=self._upload_enabled(),
+                                  upload_retry=self.upload_retry,
+                                  upload_only_recipe=self.upload_only_recipe,
+                                  upload_force=self.upload_force,
+                                  runner=runner or self.runner,
+                                  docker_shell=self.docker_shell,
+                                  docker_conan_home=self.docker_conan_home,
+                                  docker_platform_param=self.docker_platform_param,
+                                  docker_run_options=docker_run_options or self.docker_run_options,
+                                  lcow_user_workaround=self.lcow_user_workaround,
+                                  test_folder=self.test_folder,
+                                  pip_install=self.pip_install,
+                                  docker_pip_command=self.docker_pip_command,
+                                  config_url=self.config_url,
+                                  config_args=self.config_args,
+                                  printer=self.printer,
+                                  upload_dependencies=self.upload_dependencies,
+                                  conanfile=self.conanfile,
+                                  lockfile=self.lockfile,
+                                  force_selinux=self.force_selinux,
+                                  skip_recipe_export=skip_recipe_export,
+                                  update_dependencies=self.update_dependencies,
+                                  profile_build_text=profile_build_text,
+                                  base_profile_build_text=base_profile_build_text,
+                                  global_conf=self.global_conf,
+                                  cwd=self.cwd,
+                                  docker_download_cache=self._docker_download_cache(),
+                                  docker_storage_volume=self._docker_storage_volume(),
+                                  image_prefetcher=self._image_prefetcher,
+                                  docker_cache_updated_images=self.docker_cache_updated_images)
+
+    def _docker_download_cache(self):
+        """ Host folder of the download cache mounted in the containers, created before Docker
+        creates it owned by root"""
+        if not self.download_cache:
+            return None
+        download_cache = os.path.abspath(self.download_cache)
+        if not os.path.exists(download_cache):
+            os.makedirs(download_cache)
+        return download_cache
+
+    def _docker_storage_volume(self):
+        """ Docker volume name, or host folder created like the download cache"""
+        volume = self.docker_storage_volume
+        if not volume or not ("/" in volume or os.sep in volume):
+            return volume
+        volume = os.path.abspath(volume)
+        if not os.path.exists(volume):
+            os.makedirs(volume)
+        return volume
+
+    def _run_parallel_docker_builds(self, base_profile_name, base_profile_build_name):
+        """ Runs up to 'parallel_jobs' containers at the same time. The images are pulled and
+        updated first, one by one, then every container gets its own slice of the host CPUs and
+        memory, and its output is prefixed with the build number"""
+        base_profile_name = base_profile_name or os.getenv("CONAN_BASE_PROFILE")
+        builds = self.builds_in_current_page
+        jobs = min(self.parallel_jobs, len(builds))
+        resource_options = get_container_resources(jobs, self.docker_run_options)
+        docker_run_options = " ".join(option for option in (self.docker_run_options,
+                                                            resource_options) if option)
+        self.printer.print_message("Running %s builds with %s parallel containers" % (len(builds),
+                                                                                   jobs))
+        if resource_options:
+            self.printer.print_message("Container resources: %s" % resource_options)
+
+        runners = []
+        prepared_images = set()
+        for index, build in enumerate(builds):
+            profile_text, base_profile_text = get_profiles(self.client_cache, build,
+                                                           base_profile_name)
+            profile_build_text, base_profile_build_text = get_profiles(self.client_cache, build,
+                                                                       base_profile_build_name,
+                                                                       True)
+            if not base_profile_build_text:
+                profile_build_text = None
+            docker_image = self._get_docker_image(build)
+            if self.runner is os.system:
+                runner = PrefixedOutputRunner("%s/%s" % (index + 1, len(builds)),
+                                              output=self.printer.printer)
             else:
-                if not base_profile_build_text:
-                    profile_build_text = None
-                docker_image = self._get_docker_image(build)
-                r = DockerCreateRunner(profile_text, base_profile_text, base_profile_name,
-                                       build.reference,
-                                       conan_pip_package=self.conan_pip_package,
-                                       docker_image=docker_image,
-                                       sudo_docker_command=self.sudo_docker_command,
-                                       sudo_pip_command=self.sudo_pip_command,
-                                       docker_image_skip_update=self._docker_image_skip_update,
-                                       docker_image_skip_pull=self._docker_image_skip_pull,
-                                       build_policy=self.build_policy,
-                                       require_overrides=self.require_overrides,
-                                       always_update_conan_in_docker=self._update_conan_in_docker,
-                                       upload=self._upload_enabled(),
-                                       upload_retry=self.upload_retry,
-                                       upload_only_recipe=self.upload_only_recipe,
-                                       upload_force=self.upload_force,
-                                       runner=self.runner,
-                                       docker_shell=self.docker_shell,
-                                       docker_conan_home=self.docker_conan_home,
-                                       docker_platform_param=self.docker_platform_param,
-                                       docker_run_options=self.docker_run_options,
-                                       lcow_user_workaround=self.lcow_user_workaround,
-                                       test_folder=self.test_folder,
-                                       pip_install=self.pip_install,
-                                       docker_pip_command=self.docker_pip_command,
-                                       config_url=self.config_url,
-                                       config_args=self.config_args,
-                                       printer=self.printer,
-                                       upload_dependencies=self.upload_dependencies,
-                                       conanfile=self.conanfile,
-                                       lockfile=self.lockfile,
-                                       force_selinux=self.force_selinux,
-                                       skip_recipe_export=skip_recipe_export,
-                                       update_dependencies=self.update_dependencies,
-                                       profile_build_text=profile_build_text,
-                                       base_profile_build_text=base_profile_build_text,
-                                       global_conf=self.global_conf,
-                                       cwd=self.cwd)
-
-                r.run(pull_image=not pulled_docker_images[docker_image],
-                      docker_entry_script=self.docker_entry_script)
-                pulled_docker_images[docker_image] = True
-
-            skip_recipe_export = self.skip_recipe_export
+                runner = self.runner
+            r = self._get_docker_runner(build, docker_image, profile_text, base_profile_text,
+                                        base_profile_name, profile_build_text,
+                                        base_profile_build_text, False, runner=runner,
+                                        docker_run_options=docker_run_options)
+            if docker_image not in prepared_images:
+                self._get_docker_runner(build, docker_image, profile_text, base_profile_text,
+                                        base_profile_name, profile_build_text,
+                                        base_profile_build_text, False).prepare_image()
+                prepared_images.add(docker_image)
+            runners.append(r)
+
+        def run_runner(args):
+            build, runner = args
+            with self._record_build(build, "docker", runner):
+                runner.run(pull_image=False, docker_entry_script=self.docker_entry_script)
+
+        outcomes = run_in_pool(run_runner, zip(builds, runners), jobs)
+        errors = ["Build %s/%s: %s" % (index + 1, len(builds), error)
+                  for index, (_, error) in enumerate(outcomes) if error]
+        if errors:
+            raise Exception("%s of %s parallel builds failed:\n%s" % (len(errors), len(builds),
+                                                                     "\n".join(errors)))
 
     def _get_docker_image(self, build):
-        if self._docker_image:
-            docker_image = self._docker_image
-        else:
-            compiler_name = build.settings.get("compiler", "")
-            compiler_version = build.settings.get("compiler.version", "")
-            docker_image = self._autodetect_docker_base_image(compiler_name, compiler_version)
-
-        arch = build.settings.get("arch", "") or build.settings.get("arch_build", "")
-        if self.docker_32_images and arch == "x86":
-            build.settings["arch_build"] = "x86"
-            docker_arch_suffix = "x86"
-        elif arch != "x86" and arch != "x86_64":
-            docker_arch_suffix = arch
-        else:
-            docker_arch_suffix = None
-        if docker_arch_suffix and "-" not in docker_image:
-            docker_image = "%s-%s" % (docker_image, docker_arch_suffix)
-
-        return docker_image
+        return get_docker_image(build, self._docker_image, self.docker_32_images)
 
     @staticmethod
     def _autodetect_docker_base_image(compiler_name, compiler_version):
-        if compiler_name not in ["clang", "gcc"]:
-            raise Exception("Docker image cannot be autodetected for "
-                            "the compiler %s" % compiler_name)
-
-        if compiler_name == "gcc" and Version(compiler_version) > Version("5"):
-            compiler_version = Version(compiler_version).major(fill=False)
-
-        return "conanio/%s%s" % (compiler_name, compiler_version.replace(".", ""))
+        return autodetect_docker_base_image(compiler_name, compiler_version)
 
     def _get_channel(self, specified_channel, stable_channel, upload_when_tag):
         if not specified_channel:
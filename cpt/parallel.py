@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+
+
+def get_parallel_jobs(value):
+    """ Normalizes the value of 'parallel_jobs' or CPT_PARALLEL_JOBS. 'auto' means one job per
+    CPU, any value lower than 2 means serial execution (returns 1)"""
+    if value is None or value is False or str(value).strip() == "":
+        return 1
+    if str(value).strip().lower() == "auto":
+        return multiprocessing.cpu_count()
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise Exception("Invalid number of parallel jobs: '%s'" % value)
+    return max(jobs, 1)
+
+
+def run_in_pool(function, items, jobs):
+    """ Calls function(item) for every item using up to 'jobs' concurrent threads.
+    Returns a list of (result, exception) tuples in the same order as 'items', so one failure
+    never aborts the rest of the in-flight calls"""
+    def _call(item):
+        try:
+            return function(item), None
+        except Exception as exc:
+            return None, exc
+
+    items = list(items)
+    if not items:
+        return []
+    from multiprocessing.pool import ThreadPool  # Only the parallel builds need it
+    pool = ThreadPool(max(min(jobs, len(items)), 1))
+    try:
+        return pool.map(_call, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_host_memory():
+    """ Total physical memory of the host in bytes, None when it can't be determined"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_container_resources(jobs, docker_run_options=None):
+    """ Docker run options giving every one of 'jobs' concurrent containers an even slice of the
+    host CPUs and memory. Limits already present in 'docker_run_options' are respected"""
+    docker_run_options = docker_run_options or ""
+    options = []
+    if "--cpus" not in docker_run_options:
+        cpus = max(float(multiprocessing.cpu_count()) / jobs, 1.0)
+        options.append("--cpus=%.2f" % cpus)
+    memory = get_host_memory()
+    if memory and "--memory" not in docker_run_options and "-m " not in docker_run_options:
+        options.append("--memory=%sm" % max(memory // jobs // (1024 * 1024), 512))
+    return " ".join(options)
+
+
+class PrefixedOutputRunner(object):
+    """ Runs a command in a subprocess, prefixing every output line with a tag. Shared by the
+    concurrent runners so the output of every job can be told apart in the CI log"""
+
+    _lock = threading.Lock()
+
+    def __init__(self, prefix, output=None, env=None, cwd=None):
+        self._prefix = prefix
+        self._output = output or sys.stdout.write
+        self._env = env
+        self._cwd = cwd
+
+    def __call__(self, command):
+        proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, env=self._env, cwd=self._cwd)
+        for line in iter(proc.stdout.readline, b""):
+            line = line.decode("utf-8", "replace").rstrip("\r\n")
+            with self._lock:
+                self._output("[%s] %s\n" % (self._prefix, line))
+        proc.stdout.close()
+        return proc.wait()
@@ -0,0 +1,100 @@
+import json
+
+from cpt.builds_generator import BuildConf
+
+PLAN_VERSION = 1
+
+_fields = ("settings", "options", "env_vars", "build_requires")
+
+
+def _jsonable(values):
+    # The build_requires are ConanFileReference lists, stored as strings
+    return {key: [str(item) for item in value] if isinstance(value, (list, tuple)) else value
+            for key, value in values.items()}
+
+
+class BuildPlan(object):
+    """ Ordered build configurations of all the CI pages, with the page assigned to each of them
+    and the configurations collapsed into them ('skip_duplicated_packages'). It is computed once
+    and saved to a file, so the pages load their builds without generating the matrix again.
+
+    In the file the equal settings, options... are stored once in a table and referenced by
+    index, and every build has its content hash to verify it when it is loaded"""
+
+    def __init__(self, total_pages, recipe_hash=None):
+        self.total_pages = total_pages
+        self.recipe_hash = recipe_hash
+        self._tables = {field: [] for field in _fields + ("references", )}
+        self._entries = []
+        self._ids = {}
+
+    def _ref(self, field, value):
+        # Keyed by the stored JSON, not by the value: {"shared": True} == {"shared": 1}
+        value = value if field == "references" else _jsonable(value)
+        key = (field, json.dumps(value, sort_keys=True))
+        if key not in self._ids:
+            self._ids[key] = len(self._tables[field])
+            self._tables[field].append(value)
+        return self._ids[key]
+
+    def _encode(self, build):
+        reference = str(build.reference) if build.reference else None
+        return [self._ref(field, getattr(build, field)) for field in _fields] + \
+            [self._ref("references", reference), build.content_hash()]
+
+    def _decode(self, encoded):
+        values = [self._tables[field][index] for field, index in zip(_fields, encoded)]
+        reference = self._tables["references"][encoded[4]]
+        reference = str(reference) if reference else None
+        build = BuildConf(*(values + [reference]))
+        if build.content_hash() != encoded[5]:
+            raise Exception("The build plan is corrupted, the configuration %s doesn't match "
+                            "its hash" % build.settings)
+        return build
+
+    def add(self, build, page, duplicates=None):
+        """ 'duplicates' are (build, package_id) pairs, built by this build"""
+        self._entries.append([page, self._encode(build),
+                              [self._encode(duplicate) + [package_id]
+                               for duplicate, package_id in duplicates or []]])
+
+    @property
+    def pages(self):
+        return sorted(set(entry[0] for entry in self._entries), key=str)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def page(self, page):
+        """ Builds of the page, and the summary entries of the configurations collapsed into
+        them. Only the builds of the page are instantiated"""
+        builds = []
+        duplicates = []
+        for entry_page, encoded, entry_duplicates in self._entries:
+            if str(entry_page) != str(page):
+                continue
+            build = self._decode(encoded)
+            builds.append(build)
+            for duplicate in entry_duplicates:
+                duplicates.append({"configuration": self._decode(duplicate[:-1]),
+                                   "package": None, "status": "duplicate",
+                                   "package_id": duplicate[-1], "duplicate_of": build})
+        return builds, duplicates
+
+    def save(self, path):
+        contents = {"version": PLAN_VERSION, "total_pages": self.total_pages,
+                    "recipe_hash": self.recipe_hash, "tables": self._tables,
+                    "builds": self._entries}
+        with open(path, "w") as plan_file:
+            json.dump(contents, plan_file, separators=(",", ":"))
+
+    @staticmethod
+    def load(path):
+        with open(path) as plan_file:
+            contents = json.load(plan_file)
+        if contents.get("version") != PLAN_VERSION:
+            raise Exception("Unsupported build plan version in '%s', generate it again" % path)
+        plan = BuildPlan(contents["total_pages"], contents["recipe_hash"])
+        plan._tables = contents["tables"]
+        plan._entries = contents["builds"]
+        return plan
@@ -1,9 +1,14 @@
 import sys
-from tabulate import tabulate
 from contextlib import contextmanager
 from cpt import __version__ as version
 
 
+def tabulate(*args, **kwargs):
+    # Imported when a table is printed, it is slow to import
+    from tabulate import tabulate as _tabulate
+    return _tabulate(*args, **kwargs)
+
+
 class Printer(object):
 
     def __init__(self, printer=None):
@@ -3,9 +3,8 @@ import tempfile
 
 from conans.client import tools
 from conans.client.profile_loader import _load_profile
-from conans.model.version import Version
 from conans.util.files import save
-from cpt import get_client_version
+from cpt.compat import get_compat
 
 
 def get_profiles(client_cache, build_config, base_profile_name=None, is_build_profile=False):
@@ -59,15 +58,7 @@ def patch_default_base_profile(conan_api, profile_abs_path):
     is other, we have to change the include"""
     text = tools.load(profile_abs_path)
     if "include(default)" in text:  # User didn't specified a custom profile
-        conan_version = get_client_version()
-        if conan_version < Version("1.12.0"):
-            cache = conan_api._client_cache
-        elif conan_version < Version("1.18.0"):
-            cache = conan_api._cache
-        else:
-            if not conan_api.app:
-                conan_api.create_app()
-            cache = conan_api.app.cache
+        cache = get_compat().cache(conan_api)
 
         default_profile_name = os.path.basename(cache.default_profile_path)
         if not os.path.exists(cache.default_profile_path):
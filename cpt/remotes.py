@@ -1,7 +1,13 @@
+import json
 import os
+import time
 from collections import namedtuple
+
+from conans.errors import ConanException, NotFoundException
 from six import string_types
 
+from cpt.compat import get_compat
+
 
 class Remote(namedtuple("Remote", "url use_ssl name")):
 
@@ -142,6 +148,12 @@ class RemotesManager(object):
             return None
         return self._upload.name
 
+    @property
+    def upload_remote_url(self):
+        if not self._upload:
+            return None
+        return self._upload.url
+
     def named_remotes(self):
         if not self._remotes:
             return False
@@ -158,3 +170,65 @@ class RemotesManager(object):
                 tmp.append(remote.to_str())
         ret["CONAN_REMOTES"] = ",".join(tmp)
         return ret
+
+
+class RemotePackagesCache(object):
+    """ Package IDs available in a remote for every reference. The listings are persisted in a
+    JSON file, so consecutive runs don't search the remote again while they are younger than
+    'ttl' seconds"""
+
+    def __init__(self, conan_api, printer, path, ttl=600):
+        self._conan_api = conan_api
+        self._printer = printer
+        self._path = path
+        self._ttl = ttl
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return {}
+        try:
+            with open(self._path) as json_file:
+                return json.load(json_file)
+        except ValueError:
+            return {}
+
+    def _save(self, entries):
+        folder = os.path.dirname(self._path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(self._path, "w") as json_file:
+            json.dump(entries, json_file, indent=2, sort_keys=True)
+
+    def package_ids(self, remote_name, remote_url, reference, recipe_hash):
+        """ Set of the package IDs of the reference in the remote built from the recipe with the
+        manifest hash 'recipe_hash', None if the remote can't be searched. When the recipe in the
+        remote is another one, none of its packages are"""
+        key = "%s %s %s" % (remote_url or remote_name, reference, recipe_hash)
+        entries = self._load()
+        entry = entries.get(key)
+        if entry and time.time() - entry["timestamp"] < self._ttl:
+            return set(entry["packages"])
+
+        try:
+            remote_recipe_hash = get_compat().recipe_hash(self._conan_api, reference,
+                                                          remote_name=remote_name)
+            if remote_recipe_hash != recipe_hash:
+                packages = set()
+            else:
+                result = self._conan_api.search_packages(str(reference),
+                                                         remote_name=remote_name)
+                packages = set(package["id"]
+                               for remote_result in result.get("results", [])
+                               for item in remote_result.get("items", [])
+                               for package in item.get("packages", [])
+                               if not package.get("outdated"))
+        except NotFoundException:
+            packages = set()
+        except ConanException as exc:
+            self._printer.print_message("Can't list the packages of '%s' in remote '%s': %s"
+                                        % (reference, remote_name, exc))
+            return None
+
+        entries[key] = {"timestamp": time.time(), "packages": sorted(packages)}
+        self._save(entries)
+        return packages
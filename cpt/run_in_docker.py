@@ -1,30 +1,41 @@
+import argparse
+import datetime
+import json
 import os
+import time
 
 from conans import tools
-from conans.client.conan_api import Conan
 from conans.model.ref import ConanFileReference
-from conans.model.version import Version
 
 from cpt.auth import AuthManager
+from cpt.compat import get_compat
 from cpt.printer import Printer
 from cpt.profiles import save_profile_to_tmp
 from cpt.remotes import RemotesManager
 from cpt.runner import CreateRunner, unscape_env
 from cpt.uploader import Uploader
-from cpt import get_client_version
 
 
-def run():
-    conan_version = get_client_version()
-    if conan_version < Version("1.18.0"):
-        conan_api, client_cache, _ = Conan.factory()
-    else:
-        conan_api, _, _ = Conan.factory()
-        conan_api.create_app()
-        client_cache = conan_api.app.cache
+def run(args=None):
+    parser = argparse.ArgumentParser(prog="run_create_in_docker",
+                                     description="Builds the configuration of the CPT_ "
+                                                 "environment variables")
+    parser.add_argument("--batch", action="store_true", help="Build every configuration of "
+                        "the CPT_BATCH_FILE with the same Conan client, one after the other")
+    args = parser.parse_args(args)
+
+    compat = get_compat()
+    conan_api, client_cache = compat.factory()
 
     printer = Printer()
 
+    download_cache = unscape_env(os.getenv("CPT_DOWNLOAD_CACHE"))
+    if download_cache:
+        if not compat.supports_download_cache:
+            printer.print_message("Download cache requires Conan >= 1.24, ignoring it")
+        else:
+            conan_api.config_set("storage.download_cache", download_cache)
+
     remotes_manager = RemotesManager(conan_api, printer)
     remotes_manager.add_remotes_to_conan()
     default_username = os.getenv("CONAN_USERNAME")
@@ -40,10 +51,6 @@ def run():
     global_conf = unscape_env(os.getenv("CPT_GLOBAL_CONF"))
     reference = ConanFileReference.loads(os.getenv("CONAN_REFERENCE"))
 
-    profile_text = unscape_env(os.getenv("CPT_PROFILE"))
-    abs_profile_path = save_profile_to_tmp(profile_text)
-    base_profile_text = unscape_env(os.getenv("CPT_BASE_PROFILE"))
-    profile_build_text = unscape_env(os.getenv("CPT_PROFILE_BUILD"))
     config_url = unscape_env(os.getenv("CPT_CONFIG_URL"))
     config_args = unscape_env(os.getenv("CPT_CONFIG_ARGS"))
     upload_dependencies = unscape_env(os.getenv("CPT_UPLOAD_DEPENDENCIES"))
@@ -51,27 +58,79 @@ def run():
     conanfile = unscape_env(os.getenv("CPT_CONANFILE"))
     lockfile = unscape_env(os.getenv("CPT_LOCKFILE"))
     skip_recipe_export = unscape_env(os.getenv("CPT_SKIP_RECIPE_EXPORT"))
-    if base_profile_text:
-        base_profile_name = unscape_env(os.getenv("CPT_BASE_PROFILE_NAME"))
-        tools.save(os.path.join(client_cache.profiles_path, base_profile_name),
-                   base_profile_text)
-    if profile_build_text:
-        abs_profile_build_path = save_profile_to_tmp(profile_build_text)
-    else:
-        abs_profile_build_path = None
-
+    exclude_vcvars_precommand = unscape_env(os.getenv("CPT_EXCLUDE_VCVARS_PRECOMMAND"))
+    results_file = unscape_env(os.getenv("CPT_RESULTS_FILE"))
+    base_profile_name = unscape_env(os.getenv("CPT_BASE_PROFILE_NAME"))
     upload = os.getenv("CPT_UPLOAD_ENABLED")
-    runner = CreateRunner(abs_profile_path, reference, conan_api, uploader,
-                          build_policy=build_policy, require_overrides=require_overrides, printer=printer, upload=upload,
-                          upload_only_recipe=upload_only_recipe,
-                          test_folder=test_folder, config_url=config_url, config_args=config_args,
-                          upload_dependencies=upload_dependencies, conanfile=conanfile,
-                          skip_recipe_export=skip_recipe_export,
-                          update_dependencies=update_dependencies,
-                          lockfile=lockfile,
-                          profile_build_abs_path=abs_profile_build_path,
-                          global_conf=global_conf)
-    runner.run()
+
+    def build(configuration, config_url):
+        if configuration["base_profile"]:
+            tools.save(os.path.join(client_cache.profiles_path, base_profile_name),
+                       configuration["base_profile"])
+        abs_profile_path = save_profile_to_tmp(configuration["profile"])
+        if configuration["profile_build"]:
+            abs_profile_build_path = save_profile_to_tmp(configuration["profile_build"])
+        else:
+            abs_profile_build_path = None
+
+        runner = CreateRunner(abs_profile_path, configuration["reference"], conan_api, uploader,
+                              build_policy=build_policy, require_overrides=require_overrides, printer=printer, upload=upload,
+                              upload_only_recipe=upload_only_recipe,
+                              test_folder=test_folder, config_url=config_url, config_args=config_args,
+                              upload_dependencies=upload_dependencies, conanfile=conanfile,
+                              skip_recipe_export=configuration["skip_recipe_export"],
+                              update_dependencies=update_dependencies,
+                              lockfile=lockfile,
+                              profile_build_abs_path=abs_profile_build_path,
+                              global_conf=global_conf,
+                              exclude_vcvars_precommand=exclude_vcvars_precommand)
+        runner.run()
+        return runner
+
+    if not args.batch:
+        runner = build({"reference": reference,
+                        "profile": unscape_env(os.getenv("CPT_PROFILE")),
+                        "base_profile": unscape_env(os.getenv("CPT_BASE_PROFILE")),
+                        "profile_build": unscape_env(os.getenv("CPT_PROFILE_BUILD")),
+                        "skip_recipe_export": skip_recipe_export}, config_url)
+        if results_file:
+            save_results(results_file, runner.results)
+        return
+
+    with open(unscape_env(os.getenv("CPT_BATCH_FILE"))) as json_file:
+        configurations = json.load(json_file)
+    outcomes = []
+    for index, configuration in enumerate(configurations):
+        printer.print_message("Batch build: %s/%s" % (index + 1, len(configurations)))
+        configuration["reference"] = ConanFileReference.loads(configuration["reference"])
+        started = time.time()
+        try:
+            # The Conan config is installed once, by the first build
+            runner = build(configuration, config_url if index == 0 else None)
+        except Exception as error:
+            outcomes.append({"results": None, "outcome": "failed", "error": str(error),
+                             "started": started, "finished": time.time(), "phases": {}})
+            raise
+        else:
+            # The recipe can reject a configuration, then there are no results
+            outcomes.append({"results": runner.results,
+                             "outcome": "skipped" if runner.results is None else "success",
+                             "started": started, "finished": time.time(),
+                             "phases": runner.phases.durations})
+        finally:
+            # Saved after every build, so the host gets the results of the builds finished
+            # before a failure
+            if results_file:
+                save_results(results_file, outcomes)
+
+
+def save_results(path, results):
+    def default(o):
+        if isinstance(o, (datetime.date, datetime.datetime)):
+            return o.isoformat()
+
+    with open(path, "w") as json_file:
+        json.dump(results, json_file, default=default)
 
 
 if __name__ == '__main__':
@@ -1,19 +1,24 @@
+import hashlib
 import os
 import sys
 import subprocess
 import re
 import time
+import json
+import shutil
+import tempfile
 from collections import namedtuple
 
 from conans import tools
-from conans.model.version import Version
 from conans.model.ref import ConanFileReference
 
-from cpt import __version__ as package_tools_version, get_client_version
+from cpt import __version__ as package_tools_version
+from cpt.compat import get_compat
 from cpt.config import ConfigManager, GlobalConf
+from cpt.history import PhaseTimer
+from cpt.parallel import PrefixedOutputRunner
 from cpt.printer import Printer
 from cpt.profiles import load_profile, patch_default_base_profile
-from conans.client.conan_api import ProfileData
 
 
 class CreateRunner(object):
@@ -55,20 +60,10 @@ class CreateRunner(object):
         self._results = None
         self._profile_build_abs_path = profile_build_abs_path
         self._global_conf = global_conf
+        self.phases = PhaseTimer()
 
         patch_default_base_profile(conan_api, profile_abs_path)
-        client_version = get_client_version()
-
-        if client_version < Version("1.12.0"):
-            cache = self._conan_api._client_cache
-        elif client_version < Version("1.18.0"):
-            cache = self._conan_api._cache
-        else:
-            if not conan_api.app:
-                conan_api.create_app()
-            cache = conan_api.app.cache
-
-        self._profile = load_profile(profile_abs_path, cache)
+        self._profile = load_profile(profile_abs_path, get_compat().cache(conan_api))
 
         if isinstance(self._test_folder, str) and self._test_folder.lower() == "false":
             self._test_folder = False
@@ -82,10 +77,12 @@ class CreateRunner(object):
         return self._results
 
     def run(self):
-        client_version = get_client_version()
+        compat = get_compat()
 
         if self._config_url:
-            ConfigManager(self._conan_api, self.printer).install(url=self._config_url, args=self._config_args)
+            with self.phases.phase("config_install"):
+                ConfigManager(self._conan_api, self.printer).install(url=self._config_url,
+                                                                     args=self._config_args)
 
         if self._global_conf:
             global_conf = GlobalConf(self._conan_api, self.printer)
@@ -108,10 +105,7 @@ class CreateRunner(object):
                 self.printer.print_profile(tools.load(self._profile_build_abs_path))
 
             with self.printer.foldable_output("conan_create"):
-                if client_version < Version("1.10.0"):
-                    name, version, user, channel = self._reference
-                else:
-                    name, version, user, channel, _ = self._reference
+                name, version, user, channel = tuple(self._reference)[:4]
 
                 if self._build_policy:
                     self._build_policy = [] if self._build_policy == ["all"] else self._build_policy
@@ -125,73 +119,116 @@ class CreateRunner(object):
                     self.printer.print_message("Calling 'conan create'")
                     self.printer.print_dict(params)
                     with tools.chdir(self._cwd):
-                        if Version(client_version) >= "1.8.0":
-                            from conans.errors import ConanInvalidConfiguration
-                            exc_class = ConanInvalidConfiguration
-                        else:
-                            exc_class = None
-
                         try:
-                            if client_version < Version("1.12.0"):
-                                self._results = self._conan_api.create(self._conanfile, name=name, version=version,
-                                                        user=user, channel=channel,
-                                                        build_modes=self._build_policy,
-                                                        require_overrides=self._require_overrides,
-                                                        profile_name=self._profile_abs_path,
-                                                        test_folder=self._test_folder,
-                                                        not_export=self.skip_recipe_export,
-                                                        update=self._update_dependencies)
-                            else:
-                                if self._profile_build_abs_path is not None:
-                                    if client_version < Version("1.38.0"):
-                                        profile_build = ProfileData(profiles=[self._profile_build_abs_path], settings=None,
-                                                                    options=None, env=None)
-                                    else:
-                                        profile_build = ProfileData(profiles=[self._profile_build_abs_path], settings=None,
-                                                                    options=None, env=None, conf=None)
-                                else:
-                                    profile_build = None
-
-                                self._results = self._conan_api.create(self._conanfile, name=name, version=version,
-                                                        user=user, channel=channel,
-                                                        build_modes=self._build_policy,
-                                                        require_overrides=self._require_overrides,
-                                                        profile_names=[self._profile_abs_path],
-                                                        test_folder=self._test_folder,
-                                                        not_export=self.skip_recipe_export,
-                                                        update=self._update_dependencies,
-                                                        lockfile=self._lockfile,
-                                                        profile_build=profile_build)
-                        except exc_class as e:
+                            with self.phases.phase("create"):
+                                self._results = compat.create(
+                                    self._conan_api, self._conanfile, name, version, user,
+                                    channel, self._build_policy, self._require_overrides,
+                                    self._profile_abs_path, self._test_folder,
+                                    self.skip_recipe_export, self._update_dependencies,
+                                    self._lockfile, self._profile_build_abs_path)
+                        except compat.invalid_configuration_error as e:
                             self.printer.print_rule()
                             self.printer.print_message("Skipped configuration by the recipe: "
                                                        "%s" % str(e))
                             self.printer.print_rule()
                             return
-                        for installed in self._results['installed']:
-                            reference = installed["recipe"]["id"]
-                            if client_version >= Version("1.10.0"):
-                                reference = ConanFileReference.loads(reference)
-                                reference = str(reference.copy_clear_rev())
-                            if ((reference == str(self._reference)) or
-                               (reference in self._upload_dependencies) or
-                               ("all" in self._upload_dependencies)) and \
-                               installed['packages']:
-                                package_id = installed['packages'][0]['id']
-                                if installed['packages'][0]["built"]:
-                                    if "@" not in reference:
-                                        reference += "@"
-                                    if self._upload_only_recipe:
-                                        self._uploader.upload_recipe(reference, self._upload)
+                        with self.phases.phase("upload"):
+                            for installed in self._results['installed']:
+                                reference = installed["recipe"]["id"]
+                                if compat.has_revisions:
+                                    reference = ConanFileReference.loads(reference)
+                                    reference = str(reference.copy_clear_rev())
+                                if ((reference == str(self._reference)) or
+                                   (reference in self._upload_dependencies) or
+                                   ("all" in self._upload_dependencies)) and \
+                                   installed['packages']:
+                                    package_id = installed['packages'][0]['id']
+                                    if installed['packages'][0]["built"]:
+                                        if "@" not in reference:
+                                            reference += "@"
+                                        if self._upload_only_recipe:
+                                            self._uploader.upload_recipe(reference, self._upload)
+                                        else:
+                                            self._uploader.upload_packages(reference,
+                                                                           self._upload, package_id)
                                     else:
-                                        self._uploader.upload_packages(reference,
-                                                                    self._upload, package_id)
-                                else:
-                                    self.printer.print_message("Skipping upload for %s, "
-                                                               "it hasn't been built" % package_id)
+                                        self.printer.print_message("Skipping upload for %s, "
+                                                                   "it hasn't been built" % package_id)
+
+
+# Label of the images updated by CPT with the id of the image they were updated from
+UPDATED_IMAGE_BASE_LABEL = "cpt.base_image"
+
+
+class EntryPointRunner(object):
+    """ Base of the runners building a configuration with the 'run_create_in_docker' entry point,
+    which reads the profiles, reference, upload and recipe settings from the environment
+    variables of get_env_vars()"""
+
+    def __init__(self, profile_text, base_profile_text, base_profile_name, reference,
+                 build_policy=None, require_overrides=None, upload=False, upload_retry=None,
+                 upload_only_recipe=None, upload_force=None, test_folder=None, config_url=None,
+                 config_args=None, printer=None, upload_dependencies=None, conanfile=None,
+                 skip_recipe_export=False, update_dependencies=False, lockfile=None,
+                 profile_build_text=None, base_profile_build_text=None, cwd=None,
+                 global_conf=None):
+        self.printer = printer or Printer()
+        self._upload = upload
+        self._upload_retry = upload_retry
+        self._upload_only_recipe = upload_only_recipe
+        self._upload_force = upload_force
+        self._reference = reference
+        self._build_policy = build_policy
+        self._require_overrides = require_overrides
+        self._profile_text = profile_text
+        self._base_profile_text = base_profile_text
+        self._base_profile_name = base_profile_name
+        self._test_folder = test_folder
+        self._config_url = config_url
+        self._config_args = config_args
+        self._upload_dependencies = upload_dependencies or []
+        self._conanfile = conanfile
+        self._lockfile = lockfile
+        self._skip_recipe_export = skip_recipe_export
+        self._update_dependencies = update_dependencies
+        self._profile_build_text = profile_build_text
+        self._base_profile_build_text = base_profile_build_text
+        self._cwd = cwd or os.getcwd()
+        self._global_conf = global_conf
+        self.phases = PhaseTimer()
+
+    def get_env_vars(self):
+        ret = {key: value for key, value in os.environ.items() if key.startswith("CONAN_") and
+               key != "CONAN_USER_HOME"}
+        ret["CONAN_REFERENCE"] = self._reference
 
+        ret["CPT_PROFILE"] = escape_env(self._profile_text)
+        ret["CPT_BASE_PROFILE"] = escape_env(self._base_profile_text)
+        ret["CPT_BASE_PROFILE_NAME"] = escape_env(self._base_profile_name)
+        ret["CPT_PROFILE_BUILD"] = escape_env(self._profile_build_text)
+        ret["CPT_GLOBAL_CONF"] = escape_env(self._global_conf)
 
-class DockerCreateRunner(object):
+        ret["CONAN_USERNAME"] = escape_env(self._reference.user or ret.get("CONAN_USERNAME"))
+        ret["CONAN_TEMP_TEST_FOLDER"] = "1"  # test package folder to a temp one
+        ret["CPT_UPLOAD_ENABLED"] = self._upload
+        ret["CPT_UPLOAD_RETRY"] = self._upload_retry
+        ret["CPT_UPLOAD_ONLY_RECIPE"] = self._upload_only_recipe
+        ret["CPT_UPLOAD_FORCE"] = self._upload_force
+        ret["CPT_BUILD_POLICY"] = escape_env(self._build_policy)
+        ret["CPT_REQUIRE_OVERRIDES"] = escape_env(self._require_overrides)
+        ret["CPT_TEST_FOLDER"] = escape_env(self._test_folder)
+        ret["CPT_CONFIG_URL"] = escape_env(self._config_url)
+        ret["CPT_CONFIG_ARGS"] = escape_env(self._config_args)
+        ret["CPT_UPLOAD_DEPENDENCIES"] = escape_env(self._upload_dependencies)
+        ret["CPT_CONANFILE"] = escape_env(self._conanfile)
+        ret["CPT_LOCKFILE"] = escape_env(self._lockfile)
+        ret["CPT_SKIP_RECIPE_EXPORT"] = self._skip_recipe_export
+        ret["CPT_UPDATE_DEPENDENCIES"] = self._update_dependencies
+        return ret
+
+
+class DockerCreateRunner(EntryPointRunner):
     def __init__(self, profile_text, base_profile_text, base_profile_name, reference,
                  conan_pip_package=None, docker_image=None, sudo_docker_command=None,
                  sudo_pip_command=False,
@@ -219,47 +256,51 @@ class DockerCreateRunner(object):
                  profile_build_text=None,
                  base_profile_build_text=None,
                  cwd=None,
-                 global_conf=None):
-
-        self.printer = printer or Printer()
-        self._upload = upload
-        self._upload_retry = upload_retry
-        self._upload_only_recipe = upload_only_recipe
-        self._upload_force = upload_force
-        self._reference = reference
+                 global_conf=None,
+                 docker_download_cache=None,
+                 docker_storage_volume=None,
+                 image_prefetcher=None,
+                 docker_cache_updated_images=False):
+
+        super(DockerCreateRunner, self).__init__(profile_text, base_profile_text,
+                                                 base_profile_name, reference,
+                                                 build_policy=build_policy,
+                                                 require_overrides=require_overrides,
+                                                 upload=upload, upload_retry=upload_retry,
+                                                 upload_only_recipe=upload_only_recipe,
+                                                 upload_force=upload_force,
+                                                 test_folder=test_folder, config_url=config_url,
+                                                 config_args=config_args, printer=printer,
+                                                 upload_dependencies=upload_dependencies,
+                                                 conanfile=conanfile,
+                                                 skip_recipe_export=skip_recipe_export,
+                                                 update_dependencies=update_dependencies,
+                                                 lockfile=lockfile,
+                                                 profile_build_text=profile_build_text,
+                                                 base_profile_build_text=base_profile_build_text,
+                                                 cwd=cwd, global_conf=global_conf)
         self._conan_pip_package = conan_pip_package
-        self._build_policy = build_policy
-        self._require_overrides = require_overrides
         self._docker_image = docker_image
         self._always_update_conan_in_docker = always_update_conan_in_docker
         self._docker_image_skip_update = docker_image_skip_update
         self._docker_image_skip_pull = docker_image_skip_pull
         self._sudo_docker_command = sudo_docker_command or ""
         self._sudo_pip_command = sudo_pip_command
-        self._profile_text = profile_text
-        self._base_profile_text = base_profile_text
-        self._base_profile_name = base_profile_name
         self._docker_shell = docker_shell
         self._docker_conan_home = docker_conan_home
         self._docker_platform_param = docker_platform_param
         self._docker_run_options = docker_run_options or ""
         self._lcow_user_workaround = lcow_user_workaround
         self._runner = PrintRunner(runner, self.printer)
-        self._test_folder = test_folder
         self._pip_install = pip_install
         self._docker_pip_command = docker_pip_command
-        self._config_url = config_url
-        self._config_args = config_args
-        self._upload_dependencies = upload_dependencies or []
-        self._conanfile = conanfile
-        self._lockfile = lockfile
         self._force_selinux = force_selinux
-        self._skip_recipe_export = skip_recipe_export
-        self._update_dependencies = update_dependencies
-        self._profile_build_text = profile_build_text
-        self._base_profile_build_text = base_profile_build_text
-        self._cwd = cwd or os.getcwd()
-        self._global_conf = global_conf
+        self._docker_download_cache = docker_download_cache
+        self._docker_storage_volume = docker_storage_volume
+        self._image_prefetcher = image_prefetcher
+        self._docker_cache_updated_images = docker_cache_updated_images
+        self._batch_folder = None
+        self.batch_results = None
 
     def _pip_update_conan_command(self):
         commands = []
@@ -293,62 +334,195 @@ class DockerCreateRunner(object):
             return "Enforcing" in output.decode()
         return False
 
-    def run(self, pull_image=True, docker_entry_script=None):
+    def _env_vars_text(self):
         envs = self.get_env_vars()
-        env_vars_text = " ".join(['-e %s="%s"' % (key, value)
-                                 for key, value in envs.items() if value])
+        return " ".join(['-e %s="%s"' % (key, value) for key, value in envs.items() if value])
 
-        # Run the build
-        if pull_image:
-            if not self._docker_image_skip_pull:
+    def prepare_image(self):
+        """ Pulls the image and updates the Conan and CPT installed in it, unless skipped"""
+        if not self._docker_image_skip_pull:
+            with self.phases.phase("pull"):
                 self.pull_image()
-            if not self._docker_image_skip_update and not self._always_update_conan_in_docker:
-                # Update the downloaded image
-                with self.printer.foldable_output("update conan"):
-                    try:
-                        command = '%s docker run %s --name conan_runner ' \
-                                  ' %s %s %s "%s"' % (self._sudo_docker_command,
-                                                   env_vars_text,
-                                                   self._docker_run_options,
-                                                   self._docker_image,
-                                                   self._docker_shell,
-                                                   self._pip_update_conan_command())
-
-                        ret = self._runner(command)
-                        if ret != 0:
-                            raise Exception("Error updating the image: %s" % command)
-                        # Save the image with the updated installed
-                        # packages and remove the intermediate container
-                        command = "%s docker commit conan_runner %s" % (self._sudo_docker_command,
-                                                                        self._docker_image)
-                        ret = self._runner(command)
-                        if ret != 0:
-                            raise Exception("Error commiting the image: %s" % command)
-                    finally:
-                        command = "%s docker rm conan_runner" % self._sudo_docker_command
-                        ret = self._runner(command)
-                        if ret != 0:
-                            raise Exception("Error removing the temp container: %s" % command)
-
+        if not self._docker_image_skip_update and not self._always_update_conan_in_docker:
+            # Update the downloaded image
+            with self.phases.phase("update"), self.printer.foldable_output("update conan"):
+                base_image, updated_image = None, None
+                if self._docker_cache_updated_images:
+                    base_image, updated_image = self._updated_image()
+                if updated_image and self._inspect_image(updated_image):
+                    self.printer.print_message("Using the updated image '%s'" % updated_image)
+                    self._tag_image(updated_image, self._docker_image)
+                    return
+                try:
+                    command = '%s docker run %s --name conan_runner ' \
+                              ' %s %s %s "%s"' % (self._sudo_docker_command,
+                                               self._env_vars_text(),
+                                               self._docker_run_options,
+                                               self._docker_image,
+                                               self._docker_shell,
+                                               self._pip_update_conan_command())
+
+                    ret = self._runner(command)
+                    if ret != 0:
+                        raise Exception("Error updating the image: %s" % command)
+                    # Save the image with the updated installed
+                    # packages and remove the intermediate container
+                    change = '--change "LABEL %s=%s" ' % (UPDATED_IMAGE_BASE_LABEL, base_image) \
+                             if base_image else ""
+                    command = "%s docker commit %sconan_runner %s" % (self._sudo_docker_command,
+                                                                      change, self._docker_image)
+                    ret = self._runner(command)
+                    if ret != 0:
+                        raise Exception("Error commiting the image: %s" % command)
+                    if updated_image:
+                        self._tag_image(self._docker_image, updated_image)
+                finally:
+                    command = "%s docker rm conan_runner" % self._sudo_docker_command
+                    ret = self._runner(command)
+                    if ret != 0:
+                        raise Exception("Error removing the temp container: %s" % command)
+
+    def _inspect_image(self, docker_image):
+        """ 'docker image inspect' of a local image, None if it doesn't exist. It runs with the
+        runner like the other docker commands, writing the output to a temporary file"""
+        folder = tempfile.mkdtemp(prefix="cpt_inspect_")
+        try:
+            output_file = os.path.join(folder, "image.json")
+            ret = self._runner('%s docker image inspect %s > "%s"'
+                               % (self._sudo_docker_command, docker_image, output_file))
+            if ret != 0 or not os.path.exists(output_file):
+                return None
+            with open(output_file) as json_file:
+                output = json_file.read()
+            return json.loads(output)[0] if output.strip() else None
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def _updated_image(self):
+        """ The base image and the tag of the image updated from it by the pip update command,
+        named after a hash of both, so it is reused while they don't change. (None, None) if
+        the image isn't local"""
+        image = self._inspect_image(self._docker_image)
+        if not image:
+            return None, None
+        # The image can be an updated one already, committed by a previous run
+        labels = (image.get("Config") or {}).get("Labels") or {}
+        base_image = labels.get(UPDATED_IMAGE_BASE_LABEL) or image["Id"]
+        key = hashlib.sha1(("%s\n%s" % (base_image, self._pip_update_conan_command()))
+                           .encode()).hexdigest()
+        repository = self._docker_image.split("@")[0]
+        if ":" in repository.rsplit("/", 1)[-1]:
+            repository = repository.rsplit(":", 1)[0]
+        return base_image, "%s:cpt-%s" % (repository, key[:16])
+
+    def _tag_image(self, source, target):
+        command = "%s docker tag %s %s" % (self._sudo_docker_command, source, target)
+        ret = self._runner(command)
+        if ret != 0:
+            raise Exception("Error tagging the image: %s" % command)
+
+    def _volume_options(self):
+        return ":z" if (DockerCreateRunner.is_selinux_running() or self._force_selinux) else ""
+
+    def _cache_volumes(self):
+        """ Mounts of the host download cache and package storage, shared by the containers.
+        The download cache is locked by file, the package storage is only shared by the
+        containers of sequential builds"""
+        volumes = []
+        if self._docker_download_cache:
+            volumes.append('-v "%s:%s%s"' % (self._docker_download_cache,
+                                             self._container_download_cache(),
+                                             self._volume_options()))
+        if self._docker_storage_volume:
+            volumes.append('-v "%s:%s/.conan/data%s"' % (self._docker_storage_volume,
+                                                         self._docker_conan_home,
+                                                         self._volume_options()))
+        return " ".join(volumes)
+
+    def _container_download_cache(self):
+        return "%s/.conan_download_cache" % self._docker_conan_home
+
+    def _create_command(self):
+        if self._batch_folder:
+            return "run_create_in_docker --batch"
+        return "run_create_in_docker"
+
+    def run_batch(self, configurations, pull_image=True, docker_entry_script=None,
+                  container=None, batch_folder=None):
+        """ Builds several configurations of the image with a single 'run_create_in_docker
+        --batch', that sets up the Conan client once for all of them. 'configurations' are dicts
+        with the reference, profile, base_profile, profile_build and skip_recipe_export of every
+        build. They are passed, and the outcome of every finished build returned, in a host
+        folder mounted in the container, out of the project so it isn't exported with the recipe.
+        A 'container' needs the 'batch_folder' mounted by start_container(), otherwise a
+        temporary one is mounted. The outcomes are kept in 'batch_results' also when a build
+        fails"""
+        self.batch_results = []
+        self._batch_folder = batch_folder or tempfile.mkdtemp(prefix="cpt_batch_")
+        batch_file = os.path.join(self._batch_folder, "batch.json")
+        results_file = os.path.join(self._batch_folder, "results.json")
+        try:
+            # The user of the image can be another one than the host user
+            os.chmod(self._batch_folder, 0o777)
+            with open(batch_file, "w") as json_file:
+                json.dump(configurations, json_file)
+            self.run(pull_image=pull_image, docker_entry_script=docker_entry_script,
+                     container=container)
+        finally:
+            if os.path.exists(results_file):
+                with open(results_file) as json_file:
+                    self.batch_results = json.load(json_file)
+            if batch_folder:
+                for path in (batch_file, results_file):
+                    if os.path.exists(path):
+                        os.remove(path)
+            else:
+                shutil.rmtree(self._batch_folder, ignore_errors=True)
+            self._batch_folder = None
+        return self.batch_results
+
+    def _container_batch_folder(self):
+        return "%s/.cpt_batch" % self._docker_conan_home
+
+    def _batch_volume(self, batch_folder):
+        if not batch_folder:
+            return ""
+        return '-v "%s:%s%s"' % (batch_folder, self._container_batch_folder(),
+                                 self._volume_options())
+
+    def _update_command(self):
         if self._always_update_conan_in_docker:
-            update_command = self._pip_update_conan_command() + " && "
-        else:
-            update_command = ""
-        volume_options = ":z" if (DockerCreateRunner.is_selinux_running() or self._force_selinux) else ""
+            return self._pip_update_conan_command() + " && "
+        return ""
+
+    def run(self, pull_image=True, docker_entry_script=None, container=None):
+        """ Builds the configuration in a new container, or with 'docker exec' in a 'container'
+        started with start_container()"""
+        if container:
+            return self._run_in_container(container)
 
-        command = ('%s docker run --rm -v "%s:%s/project%s" %s %s %s %s %s '
+        env_vars_text = self._env_vars_text()
+
+        # Run the build
+        if pull_image:
+            self.prepare_image()
+
+        command = ('%s docker run --rm -v "%s:%s/project%s" %s %s %s %s %s %s %s '
                    '"%s cd project && '
-                   '%s run_create_in_docker "' % (self._sudo_docker_command,
+                   '%s %s "' % (self._sudo_docker_command,
                                                   self._cwd,
                                                   self._docker_conan_home,
-                                                  volume_options,
+                                                  self._volume_options(),
+                                                  self._cache_volumes(),
+                                                  self._batch_volume(self._batch_folder),
                                                   env_vars_text,
                                                   self._docker_run_options,
                                                   self._docker_platform_param,
                                                   self._docker_image,
                                                   self._docker_shell,
                                                   self._lcow_user_workaround,
-                                                  update_command))
+                                                  self._update_command(),
+                                                  self._create_command()))
 
         # Push entry command before to build
         if docker_entry_script:
@@ -356,56 +530,168 @@ class DockerCreateRunner(object):
                                       "%s && run_create_in_docker" % docker_entry_script)
 
         self.printer.print_in_docker(self._docker_image)
-        ret = self._runner(command)
+        with self.phases.phase("build"):
+            ret = self._runner(command)
+        if ret != 0:
+            raise Exception("Error building: %s" % command)
+        self.printer.print_message("Exiting docker...")
+
+    def start_container(self, name, docker_entry_script=None, batch_folder=None):
+        """ Starts a long-lived container of the image, with the project (and the
+        'batch_folder' of run_batch(), if any) mounted, that stays idle until it is removed.
+        Conan (with 'always_update_conan_in_docker') is updated and the entry script is run in
+        it once, instead of once per build"""
+        if self._docker_shell.lower().startswith("cmd"):
+            keep_alive = "ping -t localhost > NUL"
+        else:
+            keep_alive = "tail -f /dev/null"
+        command = ('%s docker run -d -t --name %s -v "%s:%s/project%s" %s %s %s %s %s %s "%s"'
+                   % (self._sudo_docker_command, name, self._cwd, self._docker_conan_home,
+                      self._volume_options(), self._cache_volumes(),
+                      self._batch_volume(batch_folder), self._docker_run_options,
+                      self._docker_platform_param, self._docker_image, self._docker_shell,
+                      keep_alive))
+        with self.phases.phase("container"):
+            ret = self._runner(command)
+            if ret != 0:
+                raise Exception("Error starting the container: %s" % command)
+            setup_commands = []
+            if self._always_update_conan_in_docker:
+                setup_commands.append(self._pip_update_conan_command())
+            if docker_entry_script:
+                setup_commands.append(docker_entry_script)
+            if setup_commands:
+                command = '%s docker exec %s %s %s "%s cd project && %s"' \
+                          % (self._sudo_docker_command, self._env_vars_text(), name,
+                             self._docker_shell, self._lcow_user_workaround,
+                             " && ".join(setup_commands))
+                ret = self._runner(command)
+                if ret != 0:
+                    raise Exception("Error preparing the container: %s" % command)
+
+    def _run_in_container(self, container):
+        command = ('%s docker exec %s %s %s "%s cd project && %s "'
+                   % (self._sudo_docker_command, self._env_vars_text(), container,
+                      self._docker_shell, self._lcow_user_workaround, self._create_command()))
+        self.printer.print_in_docker(container)
+        with self.phases.phase("build"):
+            ret = self._runner(command)
         if ret != 0:
             raise Exception("Error building: %s" % command)
         self.printer.print_message("Exiting docker...")
 
     def pull_image(self):
+        # Pulled in the background, the build only waits for its image
+        if self._image_prefetcher is not None and \
+                self._image_prefetcher.wait(self._docker_image):
+            return
         with self.printer.foldable_output("docker pull"):
-            for retry in range(1, 4):
-                ret = self._runner("%s docker pull %s" % (self._sudo_docker_command, self._docker_image))
-                if ret == 0:
-                    break
-                elif retry == 3:
-                    raise Exception("Error pulling the image: %s" % self._docker_image)
-                self.printer.print_message("Could not pull docker image '{}'. Retry ({})"
-                                           .format(self._docker_image, retry))
-                time.sleep(3)
+            pull_docker_image(self._runner, self.printer, self._docker_image,
+                              self._sudo_docker_command)
 
     def get_env_vars(self):
-        ret = {key: value for key, value in os.environ.items() if key.startswith("CONAN_") and
-               key != "CONAN_USER_HOME"}
-        ret["CONAN_REFERENCE"] = self._reference
+        ret = super(DockerCreateRunner, self).get_env_vars()
+        if self._docker_download_cache:
+            ret["CPT_DOWNLOAD_CACHE"] = self._container_download_cache()
+        if self._batch_folder:
+            ret["CPT_BATCH_FILE"] = "%s/batch.json" % self._container_batch_folder()
+            ret["CPT_RESULTS_FILE"] = "%s/results.json" % self._container_batch_folder()
 
-        ret["CPT_PROFILE"] = escape_env(self._profile_text)
-        ret["CPT_BASE_PROFILE"] = escape_env(self._base_profile_text)
-        ret["CPT_BASE_PROFILE_NAME"] = escape_env(self._base_profile_name)
-        ret["CPT_PROFILE_BUILD"] = escape_env(self._profile_build_text)
-        ret["CPT_GLOBAL_CONF"] = escape_env(self._global_conf)
+        ret.update({key: value for key, value in os.environ.items() if key.startswith("PIP_")})
 
-        ret["CONAN_USERNAME"] = escape_env(self._reference.user or ret.get("CONAN_USERNAME"))
-        ret["CONAN_TEMP_TEST_FOLDER"] = "1"  # test package folder to a temp one
-        ret["CPT_UPLOAD_ENABLED"] = self._upload
-        ret["CPT_UPLOAD_RETRY"] = self._upload_retry
-        ret["CPT_UPLOAD_ONLY_RECIPE"] = self._upload_only_recipe
-        ret["CPT_UPLOAD_FORCE"] = self._upload_force
-        ret["CPT_BUILD_POLICY"] = escape_env(self._build_policy)
-        ret["CPT_REQUIRE_OVERRIDES"] = escape_env(self._require_overrides)
-        ret["CPT_TEST_FOLDER"] = escape_env(self._test_folder)
-        ret["CPT_CONFIG_URL"] = escape_env(self._config_url)
-        ret["CPT_CONFIG_ARGS"] = escape_env(self._config_args)
-        ret["CPT_UPLOAD_DEPENDENCIES"] = escape_env(self._upload_dependencies)
-        ret["CPT_CONANFILE"] = escape_env(self._conanfile)
-        ret["CPT_LOCKFILE"] = escape_env(self._lockfile)
-        ret["CPT_SKIP_RECIPE_EXPORT"] = self._skip_recipe_export
-        ret["CPT_UPDATE_DEPENDENCIES"] = self._update_dependencies
+        return ret
 
-        ret.update({key: value for key, value in os.environ.items() if key.startswith("PIP_")})
 
+class SubprocessCreateRunner(EntryPointRunner):
+    """ Runs one configuration through the 'run_create_in_docker' entry point in a local
+    subprocess instead of a container. Every call runs on its own Conan user home, so several
+    of them can build concurrently"""
+
+    def __init__(self, profile_text, base_profile_text, base_profile_name, reference,
+                 seed_conan_folder=None, download_cache=None, prefix=None,
+                 exclude_vcvars_precommand=False, output_runner_factory=None, **kwargs):
+        super(SubprocessCreateRunner, self).__init__(profile_text, base_profile_text,
+                                                     base_profile_name, reference, **kwargs)
+        self._seed_conan_folder = seed_conan_folder
+        self._download_cache = download_cache
+        self._prefix = prefix or str(reference)
+        self._exclude_vcvars_precommand = exclude_vcvars_precommand
+        self._output_runner_factory = output_runner_factory or PrefixedOutputRunner
+        self._conan_home = None
+        self._results = None
+
+    @property
+    def results(self):
+        return self._results
+
+    # The configuration of the main Conan cache, what 'conan config install' installs
+    seed_folders = ("profiles", "hooks", "generators")
+    seed_files = ("conan.conf", "global.conf", "remotes.json", "settings.yml",
+                  "artifacts.properties")
+
+    def _prepare_conan_home(self):
+        """ Copies the configuration of the main Conan cache (profiles, hooks, remotes, settings,
+        conan.conf...) to the worker one, so the build gets the same package IDs, revisions
+        and hooks than a serial one"""
+        conan_folder = os.path.join(self._conan_home, ".conan")
+        if not os.path.exists(self._conan_home):
+            os.makedirs(self._conan_home)
+        if os.path.exists(conan_folder) or not self._seed_conan_folder:
+            return
+        os.makedirs(conan_folder)
+        for folder in self.seed_folders:
+            path = os.path.join(self._seed_conan_folder, folder)
+            if os.path.isdir(path):
+                shutil.copytree(path, os.path.join(conan_folder, folder))
+        for filename in self.seed_files:
+            path = os.path.join(self._seed_conan_folder, filename)
+            if os.path.isfile(path):
+                shutil.copy(path, os.path.join(conan_folder, filename))
+
+    def run(self, conan_home):
+        self._conan_home = conan_home
+        self._results = None
+        self._prepare_conan_home()
+        results_file = os.path.join(conan_home, "cpt_results.json")
+        if os.path.exists(results_file):
+            os.remove(results_file)
+
+        env = os.environ.copy()
+        env.update({key: str(value) for key, value in self.get_env_vars().items() if value})
+        env["CPT_RESULTS_FILE"] = results_file
+
+        command = '"%s" -m cpt.run_in_docker' % sys.executable
+        runner = PrintRunner(self._output_runner_factory(self._prefix, output=self.printer.printer,
+                                                         env=env, cwd=self._cwd),
+                             self.printer)
+        with self.phases.phase("build"):
+            ret = runner(command)
+        if ret != 0:
+            raise Exception("Error building '%s': %s" % (self._prefix, command))
+        if os.path.exists(results_file):
+            with open(results_file) as json_file:
+                self._results = json.load(json_file)
+
+    def get_env_vars(self):
+        ret = super(SubprocessCreateRunner, self).get_env_vars()
+        ret["CONAN_USER_HOME"] = self._conan_home
+        ret["CPT_DOWNLOAD_CACHE"] = self._download_cache
+        ret["CPT_EXCLUDE_VCVARS_PRECOMMAND"] = self._exclude_vcvars_precommand
         return ret
 
 
+def pull_docker_image(runner, printer, docker_image, sudo_docker_command=""):
+    for retry in range(1, 4):
+        ret = runner("%s docker pull %s" % (sudo_docker_command, docker_image))
+        if ret == 0:
+            break
+        elif retry == 3:
+            raise Exception("Error pulling the image: %s" % docker_image)
+        printer.print_message("Could not pull docker image '{}'. Retry ({})"
+                              .format(docker_image, retry))
+        time.sleep(3)
+
+
 def unscape_env(text):
     if not text:
         return text
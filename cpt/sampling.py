@@ -0,0 +1,70 @@
+import heapq
+import re
+from itertools import combinations
+
+
+def get_sampling_strength(sampling):
+    """ Strength of the covering of a CPT_MATRIX_SAMPLING value: 2 for 'pairwise', t for 't-wise'
+    or 't', None to build all the configurations"""
+    if not sampling or str(sampling).lower() in ("all", "none", "false", "0"):
+        return None
+    sampling = str(sampling).lower().strip()
+    if sampling == "pairwise":
+        return 2
+    match = re.match(r"^(\d+)(-wise)?$", sampling)
+    if not match:
+        raise Exception("Invalid matrix sampling '%s', use 'pairwise' or '<t>-wise', "
+                        "e.g. '3-wise'" % sampling)
+    return int(match.group(1))
+
+
+def _rows(builds):
+    axes = sorted(set(("settings", name) for build in builds for name in build.settings) |
+                  set(("options", name) for build in builds for name in build.options))
+    rows = []
+    for build in builds:
+        row = []
+        for kind, name in axes:
+            value = getattr(build, kind).get(name)
+            row.append(None if value is None else str(value))
+        rows.append(tuple(row))
+    return axes, rows
+
+
+def covering_sample(builds, strength=2):
+    """ Subset of the builds in which every combination of 'strength' values of different
+    settings or options (every pair for 2) existing in the builds appears at least once. The
+    builds are chosen greedily, the one covering most missing combinations first, and the ties
+    are broken by the order of the builds, so the result is always the same. The builds are
+    returned in their original order"""
+    builds = list(builds)
+    if not builds:
+        return builds
+    axes, rows = _rows(builds)
+    varying = [index for index in range(len(axes)) if len(set(row[index] for row in rows)) > 1]
+    strength = min(strength, len(varying))
+    if strength < 1:
+        return builds[:1]
+    groups = list(combinations(varying, strength))
+
+    def combinations_of(row):
+        return set((group, tuple(row[index] for index in group)) for group in groups)
+
+    covered = set()
+    selected = []
+    # Lazy greedy: the number of new combinations of a build only decreases, so a stale value is
+    # an upper bound and it's only recomputed when the build reaches the top of the heap
+    heap = [(-len(groups), index) for index in range(len(rows))]
+    heapq.heapify(heap)
+    while heap:
+        _, index = heapq.heappop(heap)
+        new = combinations_of(rows[index]) - covered
+        if not new:
+            continue
+        entry = (-len(new), index)
+        if heap and heap[0] < entry:
+            heapq.heappush(heap, entry)
+            continue
+        covered.update(new)
+        selected.append(index)
+    return [builds[index] for index in sorted(selected)]
@@ -0,0 +1,51 @@
+import heapq
+import json
+import os
+
+# Relative cost of a configuration, used when there is no recorded duration for it
+build_type_weights = {"Debug": 1.5, "RelWithDebInfo": 1.3}
+compiler_weights = {"Visual Studio": 1.2, "msvc": 1.2}
+
+
+def estimate_duration(build):
+    """ Relative duration of a build, 1.0 is a plain Release build"""
+    weight = build_type_weights.get(build.settings.get("build_type"), 1.0)
+    weight *= compiler_weights.get(build.settings.get("compiler"), 1.0)
+    for name, value in build.options.items():
+        if name.endswith(":shared") and str(value) == "True":
+            weight *= 1.1
+    return weight
+
+
+def load_recorded_durations(path):
+    """ Reads a JSON file mapping build hashes to their duration in seconds"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as json_file:
+        return {key: float(value) for key, value in json.load(json_file).items()}
+
+
+def get_build_durations(builds, recorded=None):
+    """ Duration of every build: the recorded one when available, otherwise the estimated one
+    scaled to the average seconds per unit of the builds with recorded data"""
+    recorded = recorded or {}
+    hashes = [build.content_hash() for build in builds]
+    estimated = [estimate_duration(build) for build in builds]
+    known = [(recorded[h], e) for h, e in zip(hashes, estimated) if h in recorded]
+    scale = 1.0
+    if known:
+        scale = sum(seconds for seconds, _ in known) / sum(weight for _, weight in known)
+    return [recorded[h] if h in recorded else e * scale for h, e in zip(hashes, estimated)]
+
+
+def assign_pages(durations, total_pages):
+    """ Longest-processing-time-first greedy assignment: the longest builds are placed first,
+    always in the least loaded page. Ties are resolved by build index and page number, so every
+    page computes the same assignment independently. Returns the page (1-based) of every build"""
+    pages = [None] * len(durations)
+    loads = [(0.0, page) for page in range(1, total_pages + 1)]
+    for index in sorted(range(len(durations)), key=lambda i: (-durations[i], i)):
+        load, page = heapq.heappop(loads)
+        pages[index] = page
+        heapq.heappush(loads, (load + durations[index], page))
+    return pages
@@ -0,0 +1,275 @@
+import os
+import unittest
+
+from conans import tools
+from conans.errors import ConanException, ConanInvalidConfiguration, RecipeNotFoundException
+from conans.model.manifest import FileTreeManifest
+from conans.model.ref import ConanFileReference
+
+from cpt.analyzer import BuildAnalyzer, INVALID_PACKAGE_ID
+from cpt.builds_generator import BuildConf
+from cpt.packager import ConanMultiPackager
+from cpt.printer import Printer
+from cpt.remotes import RemotePackagesCache
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+from cpt.test.utils.test_files import temp_folder
+
+
+class FakeGraph(object):
+
+    def __init__(self, package_id):
+        self.root = self
+        self.package_id = package_id
+
+
+class AnalyzerConanAPI(MockConanAPI):
+    """ The package ID is the 'os' setting of the profile, 'Fail' is rejected by the recipe"""
+
+    def __init__(self, remote_packages=None, remote_recipe_hash="hash", outdated=()):
+        super(AnalyzerConanAPI, self).__init__()
+        self.remote_packages = remote_packages
+        self.remote_recipe_hash = remote_recipe_hash
+        self.outdated = outdated
+        self.profiles = []
+        self.searches = []
+        self.exports = []
+
+    def export(self, path, name, version, user, channel, **kwargs):
+        self.exports.append((path, name, version, user, channel))
+
+    def get_path(self, reference, path=None, remote_name=None, **kwargs):
+        if remote_name is None:
+            recipe_hash = "hash"
+        elif self.remote_packages is None:
+            raise RecipeNotFoundException(ConanFileReference.loads(reference))
+        else:
+            recipe_hash = self.remote_recipe_hash
+        return "123\nconanfile.py: %s\n" % recipe_hash, path
+
+    def info(self, path, profile_names=None, **kwargs):
+        profile_text = tools.load(profile_names[0])
+        self.profiles.append(profile_text)
+        if "os=Fail" in profile_text:
+            raise ConanInvalidConfiguration("Not supported")
+        if "os=Error" in profile_text:
+            raise ConanException("Broken")
+        os_line = [line for line in profile_text.splitlines() if line.startswith("os=")][0]
+        return FakeGraph("id-%s" % os_line[3:]), None
+
+    def search_packages(self, reference, remote_name=None, **kwargs):
+        self.searches.append((reference, remote_name))
+        if self.remote_packages is None:
+            raise RecipeNotFoundException(ConanFileReference.loads(reference))
+        return {"error": False,
+                "results": [{"remote": remote_name,
+                             "items": [{"recipe": {"id": reference},
+                                        "packages": [{"id": package_id,
+                                                      "outdated": package_id in self.outdated}
+                                                     for package_id in self.remote_packages]}]}]}
+
+
+# The manifest hash of the recipe of AnalyzerConanAPI
+RECIPE_HASH = FileTreeManifest.loads("123\nconanfile.py: hash\n").summary_hash
+
+
+def build_conf(os_name, options=None):
+    return BuildConf({"os": os_name}, options or {}, {}, {}, "lib/1.0@user/channel")
+
+
+class BuildAnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conan_api = AnalyzerConanAPI()
+        self.conanfile_path = os.path.join(temp_folder(), "conanfile.py")
+        tools.save(self.conanfile_path, "from conans import ConanFile")
+        self.analyzer = BuildAnalyzer(self.conan_api, self.conanfile_path,
+                                      Printer(lambda x: None))
+
+    def test_package_id_memoized(self):
+        self.assertEqual(self.analyzer.package_id(build_conf("Linux")), "id-Linux")
+        self.assertEqual(self.analyzer.package_id(build_conf("Linux")), "id-Linux")
+        self.assertEqual(self.analyzer.package_id(build_conf("Macos")), "id-Macos")
+        self.assertEqual(len(self.conan_api.profiles), 2)
+
+        # Other analyzers of the same recipe reuse the results, until the recipe changes
+        analyzer = BuildAnalyzer(self.conan_api, self.conanfile_path, Printer(lambda x: None))
+        self.assertEqual(analyzer.package_id(build_conf("Linux")), "id-Linux")
+        self.assertEqual(len(self.conan_api.profiles), 2)
+        tools.save(self.conanfile_path, "from conans import ConanFile\n# Changed")
+        analyzer = BuildAnalyzer(self.conan_api, self.conanfile_path, Printer(lambda x: None))
+        self.assertEqual(analyzer.package_id(build_conf("Linux")), "id-Linux")
+        self.assertEqual(len(self.conan_api.profiles), 3)
+
+    def test_invalid_and_errors(self):
+        self.assertEqual(self.analyzer.package_id(build_conf("Fail")), INVALID_PACKAGE_ID)
+        self.assertIsNone(self.analyzer.package_id(build_conf("Error")))
+        self.assertFalse(self.analyzer.is_valid(build_conf("Fail")))
+        self.assertTrue(self.analyzer.is_valid(build_conf("Error")))
+
+    def test_own_options_unscoped(self):
+        self.analyzer.package_id(build_conf("Linux", {"lib:shared": True, "zlib:shared": False}))
+        profile_text = self.conan_api.profiles[0]
+        self.assertIn("\nshared=True", profile_text)
+        self.assertIn("zlib:shared=False", profile_text)
+
+
+class RemotePackagesCacheTest(unittest.TestCase):
+
+    def test_listing_cached_on_disk(self):
+        path = os.path.join(temp_folder(), "cache.json")
+        conan_api = AnalyzerConanAPI(remote_packages=["id1", "id2"])
+        cache = RemotePackagesCache(conan_api, Printer(lambda x: None), path, ttl=600)
+        self.assertEqual(cache.package_ids("remote", "url", "lib/1.0@user/channel", RECIPE_HASH),
+                         {"id1", "id2"})
+        # A different instance, as in the next CI job, reads the file
+        cache = RemotePackagesCache(conan_api, Printer(lambda x: None), path, ttl=600)
+        self.assertEqual(cache.package_ids("remote", "url", "lib/1.0@user/channel", RECIPE_HASH),
+                         {"id1", "id2"})
+        self.assertEqual(len(conan_api.searches), 1)
+
+        cache = RemotePackagesCache(conan_api, Printer(lambda x: None), path, ttl=0)
+        cache.package_ids("remote", "url", "lib/1.0@user/channel", RECIPE_HASH)
+        self.assertEqual(len(conan_api.searches), 2)
+
+    def test_packages_of_the_recipe(self):
+        path = os.path.join(temp_folder(), "cache.json")
+        conan_api = AnalyzerConanAPI(remote_packages=["id1", "id2"], outdated=["id2"])
+        cache = RemotePackagesCache(conan_api, Printer(lambda x: None), path, ttl=600)
+        # The packages built from an older recipe are outdated
+        self.assertEqual(cache.package_ids("remote", "url", "lib/1.0@user/channel", RECIPE_HASH),
+                         {"id1"})
+        # Another recipe is another listing, the cached one isn't used
+        self.assertEqual(cache.package_ids("remote", "url", "lib/1.0@user/channel", "other"),
+                         set())
+        self.assertEqual(len(conan_api.searches), 1)
+
+    def test_recipe_not_in_remote(self):
+        conan_api = AnalyzerConanAPI()
+        cache = RemotePackagesCache(conan_api, Printer(lambda x: None),
+                                    os.path.join(temp_folder(), "cache.json"))
+        self.assertEqual(cache.package_ids("remote", "url", "lib/1.0@user/channel", RECIPE_HASH), set())
+
+
+class SkipExistingPackagesTest(unittest.TestCase):
+
+    def _packager(self, conan_api, **kwargs):
+        return ConanMultiPackager(username="user", channel="channel", runner=MockRunner(),
+                                  conan_api=conan_api, reference="lib/1.0",
+                                  ci_manager=MockCIManager(), upload="https://myremote",
+                                  cwd=temp_folder(),
+                                  remote_packages_cache=os.path.join(temp_folder(), "cache.json"),
+                                  out=lambda x: None, **kwargs)
+
+    def test_existing_packages_not_built(self):
+        conan_api = AnalyzerConanAPI(remote_packages=["id-Linux"])
+        packager = self._packager(conan_api, skip_existing_packages=True)
+        packager.add({"os": "Linux"})
+        packager.add({"os": "Macos"})
+        packager.run_builds(1, 1)
+
+        creates = [call for call in conan_api.calls if call.name == "create"]
+        self.assertEqual(len(creates), 1)
+        self.assertIn("os=Macos", tools.load(creates[0].kwargs["profile_names"][0]))
+        self.assertEqual(len(conan_api.searches), 1)
+        summary = packager.packages_summary
+        self.assertEqual(summary[0]["status"], "up to date")
+        self.assertEqual(summary[0]["package_id"], "id-Linux")
+        self.assertEqual(summary[0]["configuration"].settings["os"], "Linux")
+        self.assertEqual(summary[1]["configuration"].settings["os"], "Macos")
+
+    def test_recipe_changed(self):
+        conan_api = AnalyzerConanAPI(remote_packages=["id-Linux"], remote_recipe_hash="old")
+        packager = self._packager(conan_api, skip_existing_packages=True)
+        packager.add({"os": "Linux"})
+        packager.add({"os": "Macos"})
+        packager.run_builds(1, 1)
+
+        # The packages in the remote are built from another recipe
+        self.assertEqual(len([call for call in conan_api.calls if call.name == "create"]), 2)
+        self.assertEqual(conan_api.searches, [])
+        self.assertEqual(len(conan_api.exports), 1)
+        self.assertEqual(conan_api.exports[0][1:], ("lib", "1.0", "user", "channel"))
+
+    def test_disabled_by_default(self):
+        conan_api = AnalyzerConanAPI(remote_packages=["id-Linux"])
+        with tools.environment_append({"CPT_SKIP_EXISTING_PACKAGES": "0"}):
+            packager = self._packager(conan_api)
+        packager.add({"os": "Linux"})
+        packager.run_builds(1, 1)
+        self.assertEqual(len([call for call in conan_api.calls if call.name == "create"]), 1)
+        self.assertEqual(conan_api.searches, [])
+
+
+class SkipDuplicatedPackagesTest(unittest.TestCase):
+
+    def _packager(self, conan_api, **kwargs):
+        return ConanMultiPackager(username="user", channel="channel", runner=MockRunner(),
+                                  conan_api=conan_api, reference="lib/1.0",
+                                  ci_manager=MockCIManager(), cwd=temp_folder(),
+                                  out=lambda x: None, **kwargs)
+
+    def test_same_package_id_built_once(self):
+        conan_api = AnalyzerConanAPI()
+        packager = self._packager(conan_api, skip_duplicated_packages=True)
+        packager.add({"os": "Linux", "build_type": "Release"})
+        packager.add({"os": "Linux", "build_type": "Debug"})
+        packager.add({"os": "Macos", "build_type": "Release"})
+        packager.add({"os": "Fail", "build_type": "Release"})
+        packager.add({"os": "Fail", "build_type": "Debug"})
+        packager.run_builds(1, 1)
+
+        creates = [call for call in conan_api.calls if call.name == "create"]
+        self.assertEqual(len(creates), 4)
+        duplicates = [summary for summary in packager.packages_summary
+                      if summary.get("status") == "duplicate"]
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0]["configuration"].settings["build_type"], "Debug")
+        self.assertEqual(duplicates[0]["duplicate_of"].settings["build_type"], "Release")
+        self.assertEqual(duplicates[0]["package_id"], "id-Linux")
+
+    def test_duplicates_removed_before_pagination(self):
+        conan_api = AnalyzerConanAPI()
+        with tools.environment_append({"CPT_SKIP_DUPLICATED_PACKAGES": "1"}):
+            packager = self._packager(conan_api)
+        packager.add({"os": "Linux", "build_type": "Release"})
+        packager.add({"os": "Linux", "build_type": "Debug"})
+        packager.add({"os": "Macos", "build_type": "Release"})
+        packager.run_builds(2, 2)
+
+        self.assertEqual([build.settings["os"] for build in packager.builds_in_current_page],
+                         ["Macos"])
+        self.assertEqual(packager.packages_summary[-1]["configuration"].settings["os"], "Macos")
+
+
+class SkipInvalidConfigurationsTest(unittest.TestCase):
+
+    def test_invalid_configurations_not_built(self):
+        conan_api = AnalyzerConanAPI()
+        runner = MockRunner()
+        packager = ConanMultiPackager(username="user", channel="channel", runner=runner,
+                                      conan_api=conan_api, reference="lib/1.0",
+                                      ci_manager=MockCIManager(), cwd=temp_folder(),
+                                      gcc_versions=["9"], use_docker=True,
+                                      skip_invalid_configurations=True, out=lambda x: None)
+        packager.add({"os": "Fail", "compiler": "gcc", "compiler.version": "9"})
+        packager.run_builds(1, 1)
+
+        self.assertEqual(packager.builds_in_current_page, [])
+        self.assertEqual(runner.calls, [])
+        self.assertEqual(packager.packages_summary[0]["status"], "invalid")
+
+    def test_valid_configurations_built(self):
+        conan_api = AnalyzerConanAPI()
+        with tools.environment_append({"CPT_SKIP_INVALID_CONFIGURATIONS": "1"}):
+            packager = ConanMultiPackager(username="user", channel="channel",
+                                          runner=MockRunner(), conan_api=conan_api,
+                                          reference="lib/1.0", ci_manager=MockCIManager(),
+                                          cwd=temp_folder(), out=lambda x: None)
+        packager.add({"os": "Fail"})
+        packager.add({"os": "Linux"})
+        packager.run_builds(1, 1)
+
+        creates = [call for call in conan_api.calls if call.name == "create"]
+        self.assertEqual(len(creates), 1)
+        self.assertEqual([build.settings["os"] for build in packager.builds_in_current_page],
+                         ["Linux"])
@@ -0,0 +1,92 @@
+import unittest
+
+from conans import tools
+
+from cpt.build_filter import compile_build_filter
+from cpt.builds_generator import BuildConf
+from cpt.packager import ConanMultiPackager
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+
+
+def _build(compiler="gcc", version="9", arch="x86_64", shared=False):
+    return BuildConf({"compiler": compiler, "compiler.version": version, "arch": arch,
+                      "build_type": "Release"}, {"lib:shared": shared}, {}, {},
+                     "lib/1.0@user/channel")
+
+
+class BuildFilterTest(unittest.TestCase):
+
+    def _matching(self, expression, builds):
+        predicate = compile_build_filter(expression)
+        return [build for build in builds if predicate(build)]
+
+    def test_operators(self):
+        gcc5, gcc9, gcc11 = _build(version="5"), _build(version="9"), _build(version="11")
+        clang = _build("clang", "10", "x86")
+        builds = [gcc5, gcc9, gcc11, clang]
+        self.assertEqual(self._matching("compiler=gcc", builds), [gcc5, gcc9, gcc11])
+        self.assertEqual(self._matching("settings.compiler == clang", builds), [clang])
+        self.assertEqual(self._matching("compiler!=gcc", builds), [clang])
+        # Versions are compared as versions, not as strings
+        self.assertEqual(self._matching("compiler=gcc and compiler.version>=9", builds),
+                         [gcc9, gcc11])
+        self.assertEqual(self._matching("compiler.version<10", builds), [gcc5, gcc9])
+        self.assertEqual(self._matching("compiler.version~1*", builds), [gcc11, clang])
+        self.assertEqual(self._matching("compiler.version in (5, 11)", builds), [gcc5, gcc11])
+        self.assertEqual(self._matching("arch='x86'", builds), [clang])
+        self.assertEqual(self._matching("reference=lib/1.0@user/channel", builds), builds)
+
+    def test_options(self):
+        static, shared = _build(), _build(shared=True)
+        self.assertEqual(self._matching("lib:shared=True", [static, shared]), [shared])
+        self.assertEqual(self._matching("options.lib:shared=False", [static, shared]), [static])
+        # A field the build doesn't have only matches !=
+        self.assertEqual(self._matching("other:fPIC=True", [static]), [])
+        self.assertEqual(self._matching("other:fPIC!=True", [static]), [static])
+        self.assertEqual(self._matching("os>1", [static]), [])
+
+    def test_logic(self):
+        builds = [_build(arch="x86"), _build(arch="x86_64"), _build("clang", "10", "x86")]
+        self.assertEqual(self._matching("compiler=gcc and arch=x86 or compiler=clang", builds),
+                         [builds[0], builds[2]])
+        self.assertEqual(self._matching("compiler=gcc and (arch=x86 or compiler=clang)",
+                                        builds), [builds[0]])
+        self.assertEqual(self._matching("not arch=x86", builds), [builds[1]])
+        self.assertEqual(self._matching("NOT (compiler=gcc AND arch=x86_64)", builds),
+                         [builds[0], builds[2]])
+
+    def test_invalid(self):
+        for expression in ("compiler=", "compiler gcc", "(compiler=gcc", "compiler=gcc)",
+                           "compiler=gcc and", "compiler in gcc", "arch=x86 !"):
+            with self.assertRaisesRegexp(Exception, "Invalid build filter '%s'"
+                                                    % expression.replace("(", "\\(")
+                                                                .replace(")", "\\)")):
+                compile_build_filter(expression)
+
+    def test_packager(self):
+        def packager(**kwargs):
+            packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                          runner=MockRunner(), conan_api=MockConanAPI(),
+                                          reference="lib/1.0", ci_manager=MockCIManager(),
+                                          out=lambda x: None, **kwargs)
+            for version in ("5", "9", "11"):
+                for arch in ("x86", "x86_64"):
+                    packager.add({"compiler": "gcc", "compiler.version": version,
+                                  "arch": arch})
+            return packager
+
+        with tools.environment_append({"CPT_BUILD_FILTER": "compiler.version>=9"}):
+            builds = packager()
+        builds.run_builds(1, 2)
+        self.assertEqual([build.settings["compiler.version"]
+                          for build in builds.builds_in_current_page], ["9", "11"])
+
+        # The filter is applied before the pagination
+        builds = packager()
+        builds.run(build_filter="arch=x86_64")
+        self.assertEqual([(build.settings["compiler.version"], build.settings["arch"])
+                          for build in builds.builds_in_current_page],
+                         [("5", "x86_64"), ("9", "x86_64"), ("11", "x86_64")])
+
+        with self.assertRaisesRegexp(Exception, "Invalid build filter"):
+            packager(build_filter="compiler=gcc and")
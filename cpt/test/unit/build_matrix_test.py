@@ -0,0 +1,70 @@
+import unittest
+
+from cpt.build_matrix import BuildMatrix, selector_predicate
+from cpt.builds_generator import BuildConf
+from cpt.packager import ConanMultiPackager
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+
+
+def _builds():
+    builds = []
+    for compiler, versions in (("gcc", ["7", "9"]), ("clang", ["10"])):
+        for version in versions:
+            for arch in ("x86", "x86_64"):
+                for shared in (True, False):
+                    builds.append(BuildConf({"compiler": compiler, "compiler.version": version,
+                                             "arch": arch},
+                                            {"lib:shared": shared}, {}, {}, None))
+    return builds
+
+
+class BuildMatrixTest(unittest.TestCase):
+
+    def test_select(self):
+        builds = _builds()
+        matrix = BuildMatrix(builds)
+        self.assertEqual(len(matrix), 12)
+        self.assertEqual(matrix.select({}), builds)
+        selected = matrix.select({"compiler": "gcc", "arch": "x86"})
+        self.assertEqual(selected, [build for build in builds
+                                    if build.settings["compiler"] == "gcc" and
+                                    build.settings["arch"] == "x86"])
+        self.assertEqual(len(matrix.select({"compiler.version": [7, "10"],
+                                            "lib:shared": True})), 4)
+        self.assertEqual(len(matrix.select({"options.lib:shared": "False"})), 6)
+        self.assertEqual(matrix.select({"compiler": "msvc"}), [])
+        self.assertEqual(matrix.select({"compiler.runtime": None}), builds)
+
+    def test_remove_and_update_keep_indexes(self):
+        builds = _builds()
+        matrix = BuildMatrix(builds)
+        self.assertEqual(matrix.remove({"compiler": "clang"}), 4)
+        self.assertEqual(matrix.update({"arch": "x86"}, options={"lib:shared": False}), 4)
+        self.assertEqual(len(matrix.select({"lib:shared": True})), 2)
+        self.assertEqual(len(matrix.select({"lib:shared": False, "arch": "x86"})), 4)
+        matrix.append(builds[-1])
+        self.assertEqual(len(matrix.select({"compiler": "clang"})), 1)
+        # The order is kept
+        self.assertEqual([build.settings["compiler.version"] for build in matrix][:4],
+                         ["7", "7", "7", "7"])
+        self.assertEqual(matrix.to_list()[-1], builds[-1])
+
+    def test_selector_predicate(self):
+        predicate = selector_predicate({"compiler": "gcc", "lib:shared": True})
+        self.assertEqual(len([build for build in _builds() if predicate(build)]), 4)
+
+    def test_packager_selectors(self):
+        packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                      runner=MockRunner(), conan_api=MockConanAPI(),
+                                      reference="lib/1.0", ci_manager=MockCIManager(),
+                                      out=lambda x: None)
+        for build in _builds():
+            packager.add(dict(build.settings), dict(build.options))
+        packager.remove_build_if({"compiler": "clang"})
+        packager.update_build_if({"compiler.version": "9", "arch": "x86"},
+                                 new_settings={"build_type": "Debug"})
+        self.assertEqual(len(packager.items), 8)
+        self.assertEqual(len(packager.select_builds({"build_type": "Debug"})), 2)
+        # Functions can still be used
+        packager.remove_build_if(lambda build: build.settings.get("build_type") == "Debug")
+        self.assertEqual(len(packager.items), 6)
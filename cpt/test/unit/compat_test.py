@@ -0,0 +1,84 @@
+import unittest
+
+import mock
+from conans.client.cmd.uploader import UPLOAD_POLICY_FORCE
+
+from cpt.compat import ConanCompat, get_compat
+from cpt import get_client_version
+
+
+class ConanCompatTest(unittest.TestCase):
+
+    def test_installed_client(self):
+        compat = get_compat()
+        self.assertIs(compat, get_compat())
+        self.assertEqual(compat.client_version, get_client_version())
+
+    def test_features(self):
+        old, new = ConanCompat("1.7.0"), ConanCompat("1.24.0")
+        self.assertFalse(old.has_revisions)
+        self.assertIsNone(old.invalid_configuration_error)
+        self.assertFalse(old.supports_skip_packages)
+        self.assertTrue(new.has_revisions)
+        self.assertTrue(issubclass(new.invalid_configuration_error, Exception))
+        self.assertTrue(new.supports_skip_packages)
+        self.assertTrue(new.supports_profile_build)
+        self.assertTrue(new.supports_download_cache)
+
+    def test_cache(self):
+        conan_api = mock.Mock()
+        self.assertIs(ConanCompat("1.11.0").cache(conan_api), conan_api._client_cache)
+        self.assertIs(ConanCompat("1.17.0").cache(conan_api), conan_api._cache)
+        self.assertIs(ConanCompat("1.30.0").cache(conan_api), conan_api.app.cache)
+
+    def test_load_class(self):
+        conan_api = mock.Mock()
+        loaded = ConanCompat("1.15.0").load_class("conanfile.py", conan_api)
+        self.assertIs(loaded, conan_api._loader.load_class.return_value)
+        conan_api.python_requires.enable_remotes.assert_called_once_with(
+            remotes=conan_api._cache.registry.load_remotes.return_value)
+
+        conan_api = mock.Mock()
+        loaded = ConanCompat("1.30.0").load_class("conanfile.py", conan_api)
+        self.assertIs(loaded, conan_api.app.loader.load_named.return_value)
+        conan_api.app.pyreq_loader.enable_remotes.assert_called_once_with(
+            remotes=conan_api.app.cache.registry.load_remotes.return_value)
+
+        python_requires_cache = mock.Mock()
+        loaded = ConanCompat("1.30.0").load_class("conanfile.py", conan_api,
+                                                  python_requires_cache, "hash")
+        self.assertIs(loaded, python_requires_cache.load.return_value)
+        python_requires_cache.load.assert_called_once_with("conanfile.py", "hash", conan_api.app)
+        # Not supported by old clients
+        conan_api = mock.Mock()
+        loaded = ConanCompat("1.20.0").load_class("conanfile.py", conan_api,
+                                                  python_requires_cache, "hash")
+        self.assertIs(loaded, conan_api.app.loader.load_basic.return_value)
+
+    def test_create(self):
+        args = ("conanfile.py", "lib", "1.0", "user", "channel", ["missing"], None,
+                "/profile", None, False, False)
+        conan_api = mock.Mock()
+        ConanCompat("1.11.0").create(conan_api, *args)
+        self.assertEqual(conan_api.create.call_args[1]["profile_name"], "/profile")
+
+        conan_api = mock.Mock()
+        ConanCompat("1.40.0").create(conan_api, *args, lockfile="lock",
+                                     profile_build_abs_path="/build")
+        kwargs = conan_api.create.call_args[1]
+        self.assertEqual(kwargs["profile_names"], ["/profile"])
+        self.assertEqual(kwargs["lockfile"], "lock")
+        self.assertEqual(kwargs["profile_build"].profiles, ["/build"])
+        self.assertEqual(kwargs["build_modes"], ["missing"])
+
+    def test_upload(self):
+        conan_api = mock.Mock()
+        ConanCompat("1.7.5").upload(conan_api, "lib/1.0@user/channel", "pid", "remote", True, 3)
+        conan_api.upload.assert_called_once_with("lib/1.0@user/channel", package="pid",
+                                                 remote_name="remote", force=True, retry=3)
+
+        conan_api = mock.Mock()
+        ConanCompat("1.30.0").upload(conan_api, "lib/1.0@user/channel", None, "remote", True, 3)
+        conan_api.upload.assert_called_once_with("lib/1.0@user/channel", all_packages=False,
+                                                 remote_name="remote",
+                                                 policy=UPLOAD_POLICY_FORCE, retry=3)
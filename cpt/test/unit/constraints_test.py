@@ -0,0 +1,116 @@
+import unittest
+
+from cpt.builds_generator import linux_gcc_matrix, get_linux_gcc_builds, visual_matrix
+from cpt.constraints import ConstraintMatrix, Exclude, MatrixChain, Require
+from cpt.packager import ConanMultiPackager
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+
+
+class ConstraintMatrixTest(unittest.TestCase):
+
+    def test_rules_prune_enumeration(self):
+        checked = []
+
+        def versions(values):
+            checked.append(values["compiler"])
+            return ["9", "10"] if values["compiler"] == "gcc" else ["12"]
+
+        matrix = ConstraintMatrix([("compiler", ["gcc", "clang"]),
+                                   ("compiler.version", versions),
+                                   ("build_type", ["Release", "Debug"])],
+                                  [Exclude({"compiler": "clang"}),
+                                   Require({"compiler.version": "10"},
+                                           {"build_type": "Release"})])
+        self.assertEqual(list(matrix),
+                         [{"compiler": "gcc", "compiler.version": "9", "build_type": "Release"},
+                          {"compiler": "gcc", "compiler.version": "9", "build_type": "Debug"},
+                          {"compiler": "gcc", "compiler.version": "10",
+                           "build_type": "Release"}])
+        # The excluded compiler subtree is never visited
+        self.assertEqual(checked, ["gcc"])
+        self.assertEqual(matrix.count(), 3)
+        self.assertEqual(list(matrix), list(matrix))
+
+    def test_compound_axes_and_ignored_rules(self):
+        matrix = ConstraintMatrix([(("compiler.version", "arch"), [("8", "x86"), ("8", "x86_64")]),
+                                   ("build_type", ["Release", "Debug"])],
+                                  [Require({}, {"arch": ["x86_64"]}),
+                                   Exclude({"compiler.runtime": "MT"})],
+                                  make=lambda values: (values["arch"], values["build_type"]))
+        self.assertEqual(list(matrix), [("x86_64", "Release"), ("x86_64", "Debug")])
+        self.assertEqual(matrix.count(), 2)
+        self.assertEqual(repr(matrix.ignored_rules), "[Exclude({'compiler.runtime': 'MT'})]")
+        self.assertEqual(MatrixChain(matrix, [1]).count(), 3)
+        self.assertEqual(ConstraintMatrix([]).count(), 0)
+        # The size of a generator is unknown
+        self.assertIsNone(MatrixChain(matrix, iter([1])).count())
+
+    def test_generator_rules(self):
+        rules = [Exclude({"compiler.version": "9", "compiler.libcxx": "libstdc++"})]
+        args = (["4.9", "9"], ["x86_64"], "lib:shared", False, ["Release", "Debug"], [None], {})
+        builds = get_linux_gcc_builds(*args, rules=rules)
+        self.assertEqual(len(builds), 8)
+        self.assertEqual(linux_gcc_matrix(*args, rules=rules).count(), 8)
+        self.assertFalse([build for build in builds if build.settings["compiler.version"] == "9"
+                          and build.settings["compiler.libcxx"] == "libstdc++"])
+
+        matrix = visual_matrix(["10", "16"], ["x86", "x86_64"], ["MT", "MD", "MTd", "MDd"], None,
+                               "lib:shared", False, False, ["Release", "Debug"], [None], {})
+        builds = list(matrix)
+        self.assertEqual(matrix.count(), len(builds))
+        self.assertEqual(len(builds), 18)
+        self.assertFalse([build for build in builds if build.settings["compiler.runtime"] == "MT"
+                          and build.options["lib:shared"]])
+
+    def test_chain_ignored_rules(self):
+        runtime = Exclude({"compiler.runtime": "MT"})
+        clang = Exclude({"compiler": "clang"})
+        typo = Require({"buildtype": "Debug"}, {"arch": "x86"})
+        rules = [runtime, clang, typo]
+        gcc = ConstraintMatrix([("compiler", ["gcc"])], rules)
+        visual = ConstraintMatrix([("compiler", ["Visual Studio"]),
+                                   ("compiler.runtime", ["MT", "MD"])], rules)
+        # Only the rules that every matrix ignores
+        self.assertEqual(MatrixChain(gcc, visual).ignored_rules, [typo])
+        self.assertEqual(MatrixChain(gcc, [], ConstraintMatrix([], rules)).ignored_rules,
+                         [runtime, typo])
+        self.assertIsNone(MatrixChain([]).ignored_rules)
+
+    def test_packager_build_rules(self):
+        packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                      runner=MockRunner(), conan_api=MockConanAPI(),
+                                      reference="lib/1.0", ci_manager=MockCIManager(),
+                                      gcc_versions=["7", "9"], clang_versions=["10"],
+                                      archs=["x86", "x86_64"], lazy_matrix=True,
+                                      build_rules=[Exclude({"compiler": "clang",
+                                                            "build_type": "Debug"})],
+                                      platform_info=_linux(), out=lambda x: None)
+        packager.add_common_builds(shared_option_name="lib:shared", pure_c=False)
+        self.assertEqual(packager.count_builds(), 40)
+        self.assertEqual(len(packager.items), 40)
+        self.assertFalse([build for build in packager.items
+                          if build.settings["compiler"] == "clang" and
+                          build.settings["build_type"] == "Debug"])
+
+    def test_packager_ignored_rules(self):
+        output = []
+        packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                      runner=MockRunner(), conan_api=MockConanAPI(),
+                                      reference="lib/1.0", ci_manager=MockCIManager(),
+                                      gcc_versions=["7"], clang_versions=["10"], archs=["x86"],
+                                      build_rules=[Exclude({"compiler.runtime": "MT"}),
+                                                   Exclude({"buildtype": "Debug"})],
+                                      platform_info=_linux(), out=output.append)
+        packager.add_common_builds(shared_option_name="lib:shared", pure_c=False)
+        warnings = [line for line in output if "is ignored" in line]
+        self.assertEqual(len(warnings), 2)
+        self.assertIn("Exclude({'compiler.runtime': 'MT'})", warnings[0])
+        self.assertIn("Exclude({'buildtype': 'Debug'})", warnings[1])
+        self.assertEqual(len(packager.items), 16)
+
+
+def _linux():
+    class PlatformInfoMock(object):
+        def system(self):
+            return "Linux"
+    return PlatformInfoMock()
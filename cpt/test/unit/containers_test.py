@@ -0,0 +1,401 @@
+import json
+import os
+import re
+import threading
+import unittest
+
+import mock
+from conans import tools
+
+from cpt.containers import ImagePrefetcher
+from cpt.packager import ConanMultiPackager
+from cpt.printer import Printer
+from cpt.runner import DockerCreateRunner
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+from cpt.test.utils.test_files import temp_folder
+
+
+class FailingRunner(MockRunner):
+
+    def __init__(self, failing):
+        super(FailingRunner, self).__init__()
+        self.failing = failing
+
+    def __call__(self, command):
+        super(FailingRunner, self).__call__(command)
+        return 1 if self.failing in command else 0
+
+
+class BatchRunner(MockRunner):
+    """ Answers 'run_create_in_docker --batch' like the container, building the configurations
+    of the batch file until one with 'failing' in its profile"""
+
+    def __init__(self, failing=None):
+        super(BatchRunner, self).__init__()
+        self.failing = failing
+        self.batches = []
+        self.batch_folders = []
+
+    def __call__(self, command):
+        super(BatchRunner, self).__call__(command)
+        # Mounted by 'docker run --rm', or when the persistent container starts
+        mount = re.search(r'-v "([^"]+):/home/conan/.cpt_batch"', command)
+        if mount:
+            self.batch_folders.append(mount.group(1))
+        if "--batch" not in command:
+            return 0
+        batch_file = re.search(r'CPT_BATCH_FILE="([^"]+)"', command).group(1)
+        results_file = re.search(r'CPT_RESULTS_FILE="([^"]+)"', command).group(1)
+        batch_file = batch_file.replace("/home/conan/.cpt_batch", self.batch_folders[-1])
+        results_file = results_file.replace("/home/conan/.cpt_batch", self.batch_folders[-1])
+        with open(batch_file) as json_file:
+            configurations = json.load(json_file)
+        self.batches.append(configurations)
+        outcomes = []
+        ret = 0
+        for configuration in configurations:
+            if self.failing and self.failing in configuration["profile"]:
+                outcomes.append({"results": None, "outcome": "failed", "error": "Boom",
+                                 "started": 1.0, "finished": 2.0, "phases": {}})
+                ret = 1
+                break
+            outcomes.append({"results": {"installed": []}, "outcome": "success",
+                             "started": 1.0, "finished": 2.0, "phases": {"create": 1.0}})
+        with open(results_file, "w") as json_file:
+            json.dump(outcomes, json_file)
+        return ret
+
+
+def _packager(runner, **kwargs):
+    packager = ConanMultiPackager(username="lasote", channel="mychannel", runner=runner,
+                                  conan_api=MockConanAPI(), reference="zlib/1.2.11",
+                                  ci_manager=MockCIManager(), use_docker=True,
+                                  out=lambda x: None, **kwargs)
+    for version in ("6", "7"):
+        for build_type in ("Release", "Debug"):
+            packager.add({"arch": "x86_64", "compiler": "gcc", "compiler.version": version,
+                          "build_type": build_type})
+    return packager
+
+
+class PersistentContainersTest(unittest.TestCase):
+
+    def test_one_container_per_image(self):
+        runner = MockRunner()
+        packager = _packager(runner, docker_persistent_containers=True,
+                                  docker_entry_script="pip install mytool")
+        packager.run_builds(1, 1)
+
+        started = [call for call in runner.calls if "docker run -d -t" in call]
+        self.assertEqual(len(started), 2)
+        self.assertIn("conanio/gcc6", started[0])
+        self.assertIn("conanio/gcc7", started[1])
+        self.assertIn("tail -f /dev/null", started[0])
+        self.assertFalse([call for call in runner.calls if "docker run --rm" in call])
+
+        builds = [call for call in runner.calls if "run_create_in_docker" in call]
+        self.assertEqual(len(builds), 4)
+        for build in builds:
+            self.assertIn("docker exec ", build)
+            self.assertNotIn("pip install mytool", build)
+        self.assertIn("build_type=Release", builds[0])
+        self.assertIn("build_type=Debug", builds[1])
+        # The entry script runs once per container
+        self.assertEqual(len([call for call in runner.calls if "pip install mytool" in call]), 2)
+        # The images are pulled once, and the containers removed at the end
+        self.assertEqual(len([call for call in runner.calls if "docker pull" in call]), 2)
+        removed = [call for call in runner.calls if "docker rm -f" in call]
+        self.assertEqual(len(removed), 2)
+        self.assertEqual(runner.calls[-2:], removed)
+
+    def test_containers_removed_on_error(self):
+        runner = FailingRunner("run_create_in_docker")
+        with tools.environment_append({"CPT_DOCKER_PERSISTENT_CONTAINERS": "1"}):
+            packager = _packager(runner)
+        with self.assertRaisesRegexp(Exception, "Error building"):
+            packager.run_builds(1, 1)
+        self.assertIn("docker rm -f", runner.calls[-1])
+
+    def test_disabled(self):
+        runner = MockRunner()
+        _packager(runner).run_builds(1, 1)
+        self.assertEqual(len([call for call in runner.calls if "docker run --rm" in call]), 4)
+        self.assertFalse([call for call in runner.calls if "docker exec" in call])
+
+
+class CacheVolumesTest(unittest.TestCase):
+
+    def test_shared_caches(self):
+        download_cache = os.path.join(temp_folder(), "download_cache")
+        for persistent in (False, True):
+            runner = MockRunner()
+            with tools.environment_append({"CPT_DOWNLOAD_CACHE": download_cache,
+                                           "CPT_DOCKER_STORAGE_VOLUME": "conan-data"}):
+                packager = _packager(runner, docker_persistent_containers=persistent)
+            packager.run_builds(1, 1)
+            # Created before the first container, so Docker doesn't create it owned by root
+            self.assertTrue(os.path.isdir(download_cache))
+
+            mounts = [call for call in runner.calls if "docker run --rm" in call or
+                      "docker run -d" in call]
+            self.assertEqual(len(mounts), 2 if persistent else 4)
+            for call in mounts:
+                self.assertIn('-v "%s:/home/conan/.conan_download_cache"' % download_cache, call)
+                self.assertIn('-v "conan-data:/home/conan/.conan/data"', call)
+            for call in runner.calls:
+                if "run_create_in_docker" in call:
+                    self.assertIn('-e CPT_DOWNLOAD_CACHE="/home/conan/.conan_download_cache"',
+                                  call)
+
+    def test_storage_folder(self):
+        storage = os.path.join(temp_folder(), "storage")
+        runner = MockRunner()
+        _packager(runner, docker_storage_volume=storage).run_builds(1, 1)
+        self.assertTrue(os.path.isdir(storage))
+        for call in runner.calls:
+            if "docker run --rm" in call:
+                self.assertIn('-v "%s:/home/conan/.conan/data"' % storage, call)
+
+    def test_storage_volume_parallel_jobs(self):
+        with self.assertRaisesRegexp(Exception, "storage volume can't be shared by parallel"):
+            _packager(MockRunner(), docker_storage_volume="conan-data", parallel_jobs=2)
+
+    def test_without_caches(self):
+        runner = MockRunner()
+        _packager(runner).run_builds(1, 1)
+        for call in runner.calls:
+            self.assertNotIn("CPT_DOWNLOAD_CACHE", call)
+            self.assertNotIn(".conan/data", call)
+
+
+class BatchBuildsTest(unittest.TestCase):
+
+    def test_one_run_per_image(self):
+        cwd = temp_folder()
+        runner = BatchRunner()
+        with tools.environment_append({"CPT_DOCKER_BATCH_BUILDS": "1"}):
+            packager = _packager(runner, cwd=cwd, skip_recipe_export=True)
+        packager.run_builds(1, 1)
+
+        builds = [call for call in runner.calls if "run_create_in_docker" in call]
+        self.assertEqual(len(builds), 2)
+        self.assertIn("conanio/gcc6", builds[0])
+        self.assertIn("conanio/gcc7", builds[1])
+        for build in builds:
+            self.assertIn("docker run --rm", build)
+            self.assertIn("run_create_in_docker --batch", build)
+
+        self.assertEqual(len(runner.batches), 2)
+        first = runner.batches[0]
+        self.assertEqual([configuration["reference"] for configuration in first],
+                         ["zlib/1.2.11@lasote/mychannel"] * 2)
+        self.assertIn("build_type=Release", first[0]["profile"])
+        self.assertIn("build_type=Debug", first[1]["profile"])
+        self.assertIn("compiler.version=7", runner.batches[1][0]["profile"])
+        # Only the first build exports the recipe
+        self.assertEqual([configuration["skip_recipe_export"]
+                          for batch in runner.batches for configuration in batch],
+                         [False, True, True, True])
+
+        self.assertEqual(len(packager.packages_summary), 4)
+        self.assertEqual(packager.packages_summary[0]["package"], {"installed": []})
+        # The batch folders are out of the project, and removed
+        self.assertEqual(os.listdir(cwd), [])
+        self.assertEqual(len(runner.batch_folders), 2)
+        for folder in runner.batch_folders:
+            self.assertFalse(folder.startswith(cwd))
+            self.assertFalse(os.path.exists(folder))
+
+    def test_failed_build(self):
+        cwd = temp_folder()
+        runner = BatchRunner(failing="build_type=Debug")
+        packager = _packager(runner, cwd=cwd, docker_batch_builds=True)
+        with self.assertRaisesRegexp(Exception, "Error building"):
+            packager.run_builds(1, 1)
+        # The builds of the batch before the failure are in the summary, the ones of the other
+        # batches are not run
+        self.assertEqual(len(runner.batches), 1)
+        summary = packager.packages_summary
+        self.assertEqual(summary[0]["configuration"].settings["build_type"], "Release")
+        self.assertEqual(summary[0]["package"], {"installed": []})
+        self.assertEqual([entry.get("status") for entry in summary], [None, "not run", "not run"])
+        self.assertEqual([entry["configuration"].settings["compiler.version"]
+                          for entry in summary[1:]], ["7", "7"])
+
+        # The builds of the batch after the failed one are not run either, also in the history
+        history_db = os.path.join(temp_folder(), "history.db")
+        runner = BatchRunner(failing="build_type=Release")
+        packager = _packager(runner, docker_batch_builds=True, history_db=history_db)
+        with self.assertRaisesRegexp(Exception, "Error building"):
+            packager.run_builds(1, 1)
+        self.assertEqual([entry["status"] for entry in packager.packages_summary],
+                         ["not run"] * 3)
+        self.assertEqual(sorted(build["outcome"] for build in packager.history.builds()),
+                         ["failed", "not run", "not run", "not run"])
+        self.assertEqual(os.listdir(cwd), [])
+
+    def test_parallel_jobs(self):
+        with self.assertRaisesRegexp(Exception, "can't be combined with 'parallel_jobs'"):
+            _packager(BatchRunner(), docker_batch_builds=True, parallel_jobs=2)
+
+    def test_persistent_containers(self):
+        cwd = temp_folder()
+        runner = BatchRunner()
+        packager = _packager(runner, cwd=cwd, docker_batch_builds=True,
+                             docker_persistent_containers=True)
+        packager.run_builds(1, 1)
+        builds = [call for call in runner.calls if "run_create_in_docker" in call]
+        self.assertEqual(len(builds), 2)
+        for build in builds:
+            self.assertIn("docker exec ", build)
+            self.assertIn("run_create_in_docker --batch", build)
+        self.assertEqual(len(packager.packages_summary), 4)
+        self.assertIn("docker rm -f", runner.calls[-1])
+        # Mounted when the containers start
+        self.assertEqual(len(runner.batch_folders), 2)
+        for call in runner.calls:
+            if "/home/conan/.cpt_batch" in call and "CPT_BATCH_FILE" not in call:
+                self.assertIn("docker run -d", call)
+        self.assertEqual(os.listdir(cwd), [])
+        for folder in runner.batch_folders:
+            self.assertFalse(os.path.exists(folder))
+
+
+class ImagePrefetcherTest(unittest.TestCase):
+
+    def test_prefetch(self):
+        runner = MockRunner()
+        prefetcher = ImagePrefetcher(runner, Printer(lambda x: None),
+                                     ["conanio/gcc6", "conanio/gcc7", "conanio/gcc8"], 2)
+        for image in ("conanio/gcc6", "conanio/gcc7", "conanio/gcc8"):
+            self.assertTrue(prefetcher.wait(image))
+        self.assertEqual(sorted(runner.calls), [" docker pull conanio/gcc6",
+                                                " docker pull conanio/gcc7",
+                                                " docker pull conanio/gcc8"])
+        self.assertFalse(prefetcher.wait("conanio/clang9"))
+
+    @mock.patch("cpt.runner.time.sleep")
+    def test_failed_pull(self, _):
+        runner = FailingRunner("conanio/gcc7")
+        prefetcher = ImagePrefetcher(runner, Printer(lambda x: None),
+                                     ["conanio/gcc6", "conanio/gcc7"], 2)
+        self.assertTrue(prefetcher.wait("conanio/gcc6"))
+        with self.assertRaisesRegexp(Exception, "Error pulling the image: conanio/gcc7"):
+            prefetcher.wait("conanio/gcc7")
+        self.assertEqual(len([call for call in runner.calls if "gcc7" in call]), 3)
+
+    def test_packager(self):
+        gcc6_built = threading.Event()
+        waited = []
+
+        class PullingRunner(MockRunner):
+            def __call__(self, command):
+                super(PullingRunner, self).__call__(command)
+                if "docker pull conanio/gcc7" in command:
+                    # The builds of gcc6 don't wait for the pull of gcc7
+                    waited.append(gcc6_built.wait(10))
+                elif "run_create_in_docker" in command and "conanio/gcc6" in command:
+                    gcc6_built.set()
+                return 0
+
+        runner = PullingRunner()
+        with tools.environment_append({"CPT_DOCKER_PULL_JOBS": "2"}):
+            packager = _packager(runner)
+        packager.run_builds(1, 1)
+        self.assertEqual(waited, [True])
+        self.assertEqual(len([call for call in runner.calls if "docker pull" in call]), 2)
+        self.assertEqual(len([call for call in runner.calls
+                              if "run_create_in_docker" in call]), 4)
+
+        runner = MockRunner()
+        _packager(runner, docker_pull_jobs=2, docker_image_skip_pull=True).run_builds(1, 1)
+        self.assertFalse([call for call in runner.calls if "docker pull" in call])
+
+
+class UpdatedImagesTest(unittest.TestCase):
+
+    @staticmethod
+    def _inspect(updated_images):
+        def inspect(docker_image):
+            if ":cpt-" in docker_image:
+                return {"Id": "sha256:updated"} if updated_images else None
+            return {"Id": "sha256:%s" % docker_image.split("/")[-1], "Config": {"Labels": None}}
+        return inspect
+
+    def test_update_and_reuse(self):
+        runner = MockRunner()
+        with mock.patch.object(DockerCreateRunner, "_inspect_image",
+                               side_effect=self._inspect(updated_images=False)):
+            with tools.environment_append({"CPT_DOCKER_CACHE_UPDATED_IMAGES": "1"}):
+                _packager(runner).run_builds(1, 1)
+        self.assertEqual(len([call for call in runner.calls if "--name conan_runner" in call]), 2)
+        commits = [call for call in runner.calls if "docker commit" in call]
+        self.assertIn('--change "LABEL cpt.base_image=sha256:gcc6" conan_runner conanio/gcc6',
+                      commits[0])
+        tags = [call.split()[-2:] for call in runner.calls if "docker tag" in call]
+        self.assertEqual([source for source, _ in tags], ["conanio/gcc6", "conanio/gcc7"])
+        self.assertTrue(tags[0][1].startswith("conanio/gcc6:cpt-"))
+
+        # Warm host, the updated images are tagged as the images of the builds
+        runner = MockRunner()
+        with mock.patch.object(DockerCreateRunner, "_inspect_image",
+                               side_effect=self._inspect(updated_images=True)):
+            _packager(runner, docker_cache_updated_images=True).run_builds(1, 1)
+        self.assertFalse([call for call in runner.calls if "conan_runner" in call])
+        self.assertEqual([call.split()[-2:] for call in runner.calls if "docker tag" in call],
+                         [[target, source] for source, target in tags])
+        self.assertEqual(len([call for call in runner.calls if "docker pull" in call]), 2)
+
+    def test_disabled(self):
+        runner = MockRunner()
+        with mock.patch.object(DockerCreateRunner, "_inspect_image") as inspect:
+            _packager(runner).run_builds(1, 1)
+        self.assertFalse(inspect.called)
+        self.assertFalse([call for call in runner.calls if "docker tag" in call])
+        commits = [call for call in runner.calls if "docker commit" in call]
+        self.assertTrue(commits[0].endswith("docker commit conan_runner conanio/gcc6"))
+
+    def test_updated_image_tag(self):
+        def updated_image(docker_image, image, pip_install=None):
+            runner = DockerCreateRunner("", "", "default", "lib/1.0@user/channel",
+                                        conan_pip_package="conan==1.30.0",
+                                        docker_image=docker_image, pip_install=pip_install,
+                                        runner=MockRunner(), printer=Printer(lambda x: None))
+            with mock.patch.object(DockerCreateRunner, "_inspect_image", return_value=image):
+                return runner._updated_image()
+
+        base = {"Id": "sha256:base"}
+        base_image, tag = updated_image("registry:5000/gcc:7", base)
+        self.assertEqual(base_image, "sha256:base")
+        self.assertRegexpMatches(tag, "^registry:5000/gcc:cpt-[0-9a-f]{16}$")
+        self.assertTrue(updated_image("registry:5000/gcc", base)[1].startswith(
+            "registry:5000/gcc:cpt-"))
+        # An image updated by a previous run has the same tag than its base image
+        updated = {"Id": "sha256:updated", "Config": {"Labels": {"cpt.base_image": "sha256:base"}}}
+        self.assertEqual(updated_image("registry:5000/gcc:7", updated), (base_image, tag))
+        # Any change of the base image or the pip packages is another updated image
+        self.assertNotEqual(updated_image("registry:5000/gcc:7", {"Id": "sha256:other"})[1], tag)
+        self.assertNotEqual(updated_image("registry:5000/gcc:7", base, ["mytool"])[1], tag)
+        self.assertEqual(updated_image("registry:5000/gcc:7", None), (None, None))
+
+    def test_inspect_image(self):
+        class InspectRunner(MockRunner):
+            def __call__(self, command):
+                super(InspectRunner, self).__call__(command)
+                if "conanio/missing" in command:
+                    return 1
+                output_file = re.search(r'> "([^"]+)"', command).group(1)
+                with open(output_file, "w") as json_file:
+                    json.dump([{"Id": "sha256:gcc7"}], json_file)
+                return 0
+
+        runner = InspectRunner()
+        docker_runner = DockerCreateRunner("", "", "default", "lib/1.0@user/channel",
+                                           sudo_docker_command="sudo -E", runner=runner,
+                                           printer=Printer(lambda x: None))
+        self.assertEqual(docker_runner._inspect_image("conanio/gcc7"), {"Id": "sha256:gcc7"})
+        self.assertIsNone(docker_runner._inspect_image("conanio/missing"))
+        self.assertTrue(runner.calls[0].startswith("sudo -E docker image inspect conanio/gcc7"))
+        # The output files are removed
+        for call in runner.calls:
+            self.assertFalse(os.path.exists(re.search(r'> "([^"]+)"', call).group(1)))
@@ -0,0 +1,112 @@
+import os
+import unittest
+
+from conans import tools
+
+from cpt.builds_generator import BuildConf
+from cpt.history import BuildHistory, PhaseTimer
+from cpt.packager import ConanMultiPackager
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+from cpt.test.utils.test_files import temp_folder
+
+
+class BuildHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(temp_folder(), "history", "builds.db")
+        self.build = BuildConf({"os": "Linux", "build_type": "Debug"}, {"lib:shared": True}, {},
+                               {}, "lib/1.0@user/channel")
+
+    def test_record(self):
+        history = BuildHistory(self.path)
+        history.record(self.build, "local", 100.0, 160.0, "success", {"create": 50.0},
+                       host="myhost")
+        history.record(self.build, "local", 200.0, 280.0, "success", {"create": 75.0})
+        history.record(self.build, "docker", 300.0, 310.0, "failed")
+
+        builds = BuildHistory(self.path).builds(self.build.content_hash())
+        self.assertEqual([b["outcome"] for b in builds], ["failed", "success", "success"])
+        oldest = builds[-1]
+        self.assertEqual(oldest["reference"], "lib/1.0@user/channel")
+        self.assertEqual(oldest["duration"], 60.0)
+        self.assertEqual(oldest["phases"], {"create": 50.0})
+        self.assertEqual(oldest["host"], "myhost")
+        self.assertIn('"lib:shared": true', oldest["configuration"])
+        # Only successful builds count for the durations
+        self.assertEqual(history.durations(), {self.build.content_hash(): 70.0})
+
+    def test_phase_timer(self):
+        timer = PhaseTimer()
+        with timer.phase("create"):
+            pass
+        try:
+            with timer.phase("upload"):
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(sorted(timer.durations), ["create", "upload"])
+
+    def test_packager_records_builds(self):
+        packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                      runner=MockRunner(), conan_api=MockConanAPI(),
+                                      reference="lib/1.0", ci_manager=MockCIManager(),
+                                      history_db=self.path, out=lambda x: None)
+        packager.add({"os": "Linux"})
+        packager.add({"os": "Windows"})
+        packager.run_builds(1, 1)
+
+        builds = packager.history.builds()
+        self.assertEqual(len(builds), 2)
+        self.assertEqual(set(b["outcome"] for b in builds), {"success"})
+        self.assertEqual(set(b["runner"] for b in builds), {"local"})
+        self.assertIn("create", builds[0]["phases"])
+        self.assertEqual(set(packager.history.durations()),
+                         set(build.content_hash() for build in packager.items))
+
+    def test_packager_records_docker_failures(self):
+        class FailingRunner(MockRunner):
+            def __call__(self, command):
+                super(FailingRunner, self).__call__(command)
+                return 1 if "docker run --rm" in command else 0
+
+        packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                      runner=FailingRunner(), conan_api=MockConanAPI(),
+                                      reference="lib/1.0", ci_manager=MockCIManager(),
+                                      use_docker=True, gcc_versions=["9"],
+                                      history_db=self.path, out=lambda x: None)
+        packager.add({"os": "Linux", "compiler": "gcc", "compiler.version": "9"})
+        with self.assertRaisesRegexp(Exception, "Error building"):
+            packager.run_builds(1, 1)
+
+        build, = packager.history.builds()
+        self.assertEqual(build["outcome"], "failed")
+        self.assertEqual(build["runner"], "docker")
+        self.assertEqual(sorted(build["phases"]), ["build", "pull", "update"])
+
+    def test_pagination_history(self):
+        def packager(**kwargs):
+            packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                          runner=MockRunner(), conan_api=MockConanAPI(),
+                                          reference="lib/1.0", ci_manager=MockCIManager(),
+                                          history_db=self.path, pagination="duration",
+                                          out=lambda x: None, **kwargs)
+            for os_name in ("Linux", "Windows", "Macos"):
+                packager.add({"os": os_name})
+            return packager
+
+        # In this host Linux took much longer than the rest
+        history = BuildHistory(self.path)
+        linux = packager().items[0]
+        history.record(linux, "local", 0.0, 1000.0, "success")
+
+        # Other hosts have another history, it doesn't change the pages by default
+        builds = packager()
+        builds.run_builds(1, 2)
+        self.assertEqual([build.settings["os"] for build in builds.builds_in_current_page],
+                         ["Linux", "Macos"])
+
+        with tools.environment_append({"CPT_PAGINATION_HISTORY": "1"}):
+            builds = packager()
+        builds.run_builds(1, 2)
+        self.assertEqual([build.settings["os"] for build in builds.builds_in_current_page],
+                         ["Linux"])
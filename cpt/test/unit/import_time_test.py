@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+
+def _import_times(statement):
+    """ Cumulative import time (microseconds) of every module imported by the statement, in a
+    new interpreter"""
+    process = subprocess.Popen([sys.executable, "-X", "importtime", "-c", statement],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    assert process.returncode == 0, err
+    times = {}
+    for line in err.decode().splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative)
+    return times
+
+
+def _startup_time(statement, runs=3):
+    """ Wall time (seconds) of a new interpreter running the statement, without the time of the
+    bare interpreter. The fastest of some runs, the others are noise"""
+    def wall_time(code):
+        times = []
+        with open(os.devnull, "w") as devnull:
+            for _ in range(runs):
+                started = time.time()
+                subprocess.check_call([sys.executable, "-c", code], stdout=devnull)
+                times.append(time.time() - started)
+        return min(times)
+    return wall_time(statement) - wall_time("pass")
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime requires Python >= 3.7")
+class ImportTimeTest(unittest.TestCase):
+    """ The modules loaded at startup by 'import cpt', the tools and the Docker entry point
+    (run_create_in_docker). The failures report the import time"""
+
+    def _check(self, module, not_imported):
+        times = _import_times("import %s" % module)
+        for name in not_imported:
+            self.assertNotIn(name, times, "'%s' imports '%s', %.1f ms"
+                                          % (module, name, times[module] / 1000.0))
+
+    def test_import_cpt(self):
+        self._check("cpt", ["conans", "tabulate", "six"])
+
+    def test_import_tools(self):
+        self._check("cpt.tools", ["conans", "tabulate"])
+
+    def test_docker_entry_point(self):
+        self._check("cpt.run_in_docker", ["cpt.packager", "tabulate", "sqlite3",
+                                          "multiprocessing.pool", "cpt.builds_generator"])
+
+    def test_budget(self):
+        # Milliseconds, far above the measured times (about 0.1 ms and 0.3 ms), but far below
+        # the time of importing Conan again
+        for module, budget in (("cpt", 20), ("cpt.tools", 20)):
+            elapsed = _import_times("import %s" % module)[module] / 1000.0
+            self.assertLess(elapsed, budget, "'import %s' takes %.1f ms, the budget is %s ms"
+                                             % (module, elapsed, budget))
+
+    def test_docker_entry_point_budget(self):
+        # Relative to cpt.packager, the import of the Conan client makes the absolute times
+        # depend on the machine. Measured about 50% of it
+        entry_point = min(_import_times("import cpt.run_in_docker")["cpt.run_in_docker"]
+                          for _ in range(3))
+        packager = min(_import_times("import cpt.packager")["cpt.packager"] for _ in range(3))
+        self.assertLess(entry_point, packager * 0.75,
+                        "'import cpt.run_in_docker' takes %.1f ms, 'import cpt.packager' %.1f ms"
+                        % (entry_point / 1000.0, packager / 1000.0))
+
+    def test_docker_entry_point_cold_start(self):
+        # The whole start of run_create_in_docker in every container, until it parses its
+        # arguments, in a new interpreter. Measured about 55% of importing cpt.packager
+        entry_point = _startup_time("from cpt.run_in_docker import run; run(['--help'])")
+        packager = _startup_time("import cpt.packager")
+        self.assertLess(entry_point, packager * 0.75,
+                        "run_create_in_docker starts in %.1f ms, 'import cpt.packager' takes "
+                        "%.1f ms" % (entry_point * 1000, packager * 1000))
+
+    def test_lazy_attribute(self):
+        statement = "import cpt; cpt.ConanMultiPackager"
+        self.assertIn("conans.client.conan_api", _import_times(statement))
@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+import unittest
+
+from conans import tools
+from six import StringIO
+
+from cpt.inspect_matrix import get_matrix_report, run
+from cpt.packager import ConanMultiPackager
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+from cpt.test.utils.test_files import temp_folder
+
+
+class InspectMatrixTest(unittest.TestCase):
+
+    env = {"CONAN_GCC_VERSIONS": "7,9", "CONAN_CLANG_VERSIONS": "", "CONAN_ARCHS": "x86_64,armv8",
+           "CONAN_BUILD_TYPES": "Release,Debug", "CONAN_TOTAL_PAGES": "2", "CONAN_USE_DOCKER": "1",
+           "CONAN_REFERENCE": "lib/1.0@user/testing"}
+
+    def test_report(self):
+        with tools.environment_append(self.env):
+            report = get_matrix_report(shared_option_name="lib:shared")
+        self.assertEqual(report["os"], "Linux")
+        self.assertEqual(report["builds"], 16)
+        self.assertEqual(report["compilers"], {"gcc 7": 8, "gcc 9": 8})
+        self.assertEqual(report["images"], {"conanio/gcc7": 4, "conanio/gcc7-armv8": 4,
+                                            "conanio/gcc9": 4, "conanio/gcc9-armv8": 4})
+        self.assertEqual([page["builds"] for page in report["pages"].values()], [8, 8])
+        self.assertEqual(report["duration_units"], "relative")
+        # Debug builds weight 1.5
+        self.assertAlmostEqual(report["duration"], 8 * 1 + 8 * 1.5 + 8 * 0.1 * 1.25, places=5)
+
+        env = dict(self.env, CPT_MATRIX_SAMPLING="pairwise", CONAN_TOTAL_PAGES="3")
+        with tools.environment_append(env):
+            report = get_matrix_report(shared_option_name="lib:shared")
+        self.assertEqual(report["generated"], 16)
+        self.assertLess(report["builds"], 16)
+        self.assertEqual(sum(page["builds"] for page in report["pages"].values()),
+                         report["builds"])
+
+    def test_recipe_options(self):
+        folder = temp_folder()
+        tools.save(os.path.join(folder, "conanfile.py"), """from conans import ConanFile
+class LibConan(ConanFile):
+    name = "lib"
+    version = "1.0"
+    options = {"shared": [True, False], "header_only": [True, False], "fPIC": [True, False],
+               "with_zlib": [True, False]}
+    default_options = {"shared": False, "header_only": False, "fPIC": True, "with_zlib": True}
+""")
+
+        class PlatformInfoMock(object):
+            def system(self):
+                return "Linux"
+
+        env = dict(self.env, CONAN_BUILD_ALL_OPTIONS_VALUES="lib:with_zlib",
+                   CPT_BUILD_FILTER="compiler.version == 9", CONAN_TOTAL_PAGES="1")
+        with tools.environment_append(env):
+            packager = ConanMultiPackager(runner=MockRunner(), conan_api=MockConanAPI(),
+                                          ci_manager=MockCIManager(), cwd=folder,
+                                          platform_info=PlatformInfoMock(), out=lambda x: None)
+            packager.add_common_builds()
+            packager.run_builds(1, 1)
+            report = get_matrix_report(conanfile=os.path.join(folder, "conanfile.py"))
+        # The shared and with_zlib combinations and the header only build, of gcc 9
+        self.assertEqual(report["generated"], 33)
+        self.assertEqual(report["filtered"], 16)
+        self.assertEqual(report["builds"], len(packager.builds_in_current_page))
+        self.assertEqual(report["limits"], [])
+
+        with tools.environment_append(env):
+            report = get_matrix_report(conanfile=os.path.join(folder, "missing.py"))
+        self.assertEqual(report["generated"], 8)
+        self.assertEqual(len(report["limits"]), 2)
+        self.assertIn("There is no recipe", report["limits"][0])
+        self.assertIn("CONAN_BUILD_ALL_OPTIONS_VALUES is not considered", report["limits"][1])
+
+    def test_console_output(self):
+        output = StringIO()
+        stdout, sys.stdout = sys.stdout, output
+        try:
+            with tools.environment_append(self.env):
+                run(["--os", "Linux", "--total-pages", "4"])
+                run(["--json"])
+        finally:
+            sys.stdout = stdout
+        text = output.getvalue()
+        self.assertIn("Build matrix for Linux: 8 configurations", text)
+        self.assertIn("conanio/gcc9-armv8: 2", text)
+        self.assertIn("4: 2 configurations, estimated", text)
+        report = json.loads(text[text.index("{"):])
+        self.assertEqual(report["builds"], 8)
@@ -0,0 +1,72 @@
+import unittest
+
+from conans import tools
+
+from cpt.builds_generator import LazyBuilds, OptionsProduct, iter_linux_gcc_builds, \
+    get_linux_gcc_builds
+from cpt.packager import ConanMultiPackager
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+
+
+class LazyMatrixTest(unittest.TestCase):
+
+    def _packager(self, **kwargs):
+        return ConanMultiPackager(username="lasote", channel="mychannel", runner=MockRunner(),
+                                  conan_api=MockConanAPI(), reference="lib/1.0",
+                                  ci_manager=MockCIManager(), gcc_versions=["6", "7"],
+                                  clang_versions=["9"], archs=["x86", "x86_64"],
+                                  platform_info=_linux(), out=lambda x: None, **kwargs)
+
+    def _configure(self, packager):
+        packager.add({"arch": "x86", "compiler": "gcc", "compiler.version": "5"})
+        packager.add_common_builds(shared_option_name="lib:shared", pure_c=False)
+        packager.remove_build_if(lambda build: build.settings["compiler"] == "clang" and
+                                 build.settings["build_type"] == "Debug")
+        packager.update_build_if(lambda build: build.settings["arch"] == "x86",
+                                 new_options={"lib:fPIC": False})
+
+    def test_same_builds_as_eager(self):
+        eager = self._packager()
+        self._configure(eager)
+        lazy = self._packager(lazy_matrix=True)
+        self._configure(lazy)
+
+        self.assertEqual(len(lazy._builds), 0)
+        self.assertEqual(lazy.count_builds(), len(eager.items))
+        self.assertEqual(list(lazy.iter_items()), eager.items)
+        # Accessing the items materializes them
+        self.assertEqual(lazy.items, eager.items)
+        self.assertEqual(lazy._lazy_steps, [])
+
+    def test_pages_streamed(self):
+        eager = self._packager()
+        self._configure(eager)
+        with tools.environment_append({"CPT_LAZY_MATRIX": "1"}):
+            lazy = self._packager()
+        self._configure(lazy)
+
+        for page in (1, 2, 3):
+            eager.run_builds(page, 3)
+            lazy.run_builds(page, 3)
+            self.assertEqual(lazy.builds_in_current_page, eager.builds_in_current_page)
+        self.assertEqual(len(lazy._builds), 0)
+
+    def test_options_product(self):
+        values = OptionsProduct({"lib:a": [True, False], "lib:b": ["x", "y", "z"]})
+        self.assertEqual(len(values), 6)
+        self.assertEqual(list(values), list(values))
+        self.assertEqual(list(values)[1], {"lib:a": True, "lib:b": "y"})
+        self.assertFalse(OptionsProduct({"lib:a": []}))
+
+    def test_generators(self):
+        args = (["6", "7"], ["x86"], "lib:shared", False, ["Release", "Debug"], [None], {})
+        builds = LazyBuilds(iter_linux_gcc_builds, *args)
+        self.assertEqual(list(builds), get_linux_gcc_builds(*args))
+        self.assertEqual(len(list(builds)), 16)
+
+
+def _linux():
+    class PlatformInfoMock(object):
+        def system(self):
+            return "Linux"
+    return PlatformInfoMock()
@@ -0,0 +1,207 @@
+import os
+import unittest
+
+import mock
+from conans import tools
+from conans.client.cache.remote_registry import Remotes
+from conans.errors import ConanException
+from conans.model.ref import ConanFileReference
+
+from cpt.loader import PythonRequiresCache, RecipeMetadata, load_cf_class, \
+    load_recipe_metadata
+from cpt.packager import ConanMultiPackager
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+from cpt.test.utils.test_files import temp_folder
+
+
+class LoadConanfileClassTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conanfile_path = os.path.join(temp_folder(), "conanfile.py")
+        tools.save(self.conanfile_path, "# recipe")
+
+    def _loads(self, conan_api):
+        return sum(len(loader.call_args_list) for loader in
+                   (conan_api.app.loader.load_named, conan_api.app.loader.load_basic,
+                    conan_api.app.loader.load_class))
+
+    def test_memoized(self):
+        conan_api = mock.Mock()
+        conanfile = load_cf_class(self.conanfile_path, conan_api)
+        self.assertEqual(self._loads(conan_api), 1)
+        # Other packagers of the process reuse the class too
+        other_api = mock.Mock()
+        self.assertIs(load_cf_class(self.conanfile_path, other_api), conanfile)
+        self.assertIs(load_cf_class(os.path.relpath(self.conanfile_path), other_api), conanfile)
+        self.assertEqual(self._loads(other_api), 0)
+
+    def test_modified_recipe(self):
+        conan_api = mock.Mock()
+        load_cf_class(self.conanfile_path, conan_api)
+        tools.save(self.conanfile_path, "# changed recipe")
+        load_cf_class(self.conanfile_path, conan_api)
+        self.assertEqual(self._loads(conan_api), 2)
+
+
+class RecipeMetadataTest(unittest.TestCase):
+
+    def _metadata(self, recipe):
+        conanfile_path = os.path.join(temp_folder(), "conanfile.py")
+        tools.save(conanfile_path, recipe)
+        conan_api = mock.Mock()
+        return load_recipe_metadata(conanfile_path, conan_api), conan_api
+
+    def test_static(self):
+        metadata, conan_api = self._metadata("""from conans import ConanFile, tools
+import os
+
+
+class LibConan(ConanFile):
+    \"\"\"The recipe\"\"\"
+    name = "lib"
+    version = "1.0"
+    settings = "os", "arch"
+    options = {"shared": [True, False], "fPIC": [True, False], "header_only": [True, False]}
+    default_options = {"shared": False, "fPIC": True, "header_only": False}
+    _source_subfolder = os.path.join("source", "subfolder")
+
+    def build(self):
+        self.options = None
+""")
+        self.assertEqual(metadata, RecipeMetadata("lib", "1.0",
+                                                  {"shared": [True, False],
+                                                   "fPIC": [True, False],
+                                                   "header_only": [True, False]},
+                                                  {"shared": False, "fPIC": True,
+                                                   "header_only": False}))
+        self.assertFalse(conan_api.mock_calls)
+
+        metadata, _ = self._metadata("""import conans
+class LibConan(conans.ConanFile):
+    settings = "os"
+""")
+        self.assertEqual(metadata, RecipeMetadata(None, None, None, None))
+
+    def test_dynamic(self):
+        for recipe in ("""from conans import ConanFile
+class LibConan(ConanFile):
+    name = "lib"
+    def set_version(self):
+        self.version = "1.0"
+""", """from conans import ConanFile
+VERSION = "1.0"
+class LibConan(ConanFile):
+    name = "lib"
+    version = VERSION
+""", """class LibConan(ConanFile):
+    python_requires = "base/1.0"
+    python_requires_extend = "base.Base"
+""", """from conans import ConanFile
+from base import Base
+class LibConan(Base, ConanFile):
+    name = "lib"
+""", """from conans import ConanFile
+class LibConan(ConanFile):
+    options = {"shared": [True, False]}
+    if True:
+        options["fPIC"] = [True, False]
+""", """from conans import ConanFile
+class _Base(ConanFile):
+    settings = "os"
+class LibConan(_Base):
+    name = "lib"
+    version = "1.0"
+    options = {"shared": [True, False]}
+""", """from conans import ConanFile
+class LibConan(ConanFile):
+    name = "lib"
+LibConan.version = "1.0"
+""", "class LibConan(ConanFile:\n"):
+            metadata, conan_api = self._metadata(recipe)
+            self.assertIs(metadata, conan_api.app.loader.load_named.return_value)
+
+
+class PythonRequiresCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_folder = temp_folder()
+        self.cache_path = os.path.join(self.tmp_folder, "python_requires.json")
+        self.base_folder = os.path.join(self.tmp_folder, "base")
+        os.makedirs(self.base_folder)
+        self.base_ref = ConanFileReference.loads("base/1.0@user/channel#rev1")
+
+    def _app(self):
+        app = mock.Mock()
+        python_require = mock.Mock(ref=self.base_ref, path=self.base_folder)
+        app.loader.load_named.return_value.python_requires.all_items.return_value = \
+            [("base", python_require)]
+        return app
+
+    def _load(self, app, **kwargs):
+        PythonRequiresCache(self.cache_path, **kwargs).load("conanfile.py", "hash", app)
+        remotes = app.pyreq_loader.enable_remotes.call_args[1]["remotes"]
+        locked = app.loader.load_named.call_args[1].get("lock_python_requires")
+        return remotes, locked
+
+    def test_warm_cache(self):
+        app = self._app()
+        remotes, locked = self._load(app)
+        self.assertIs(remotes, app.cache.registry.load_remotes.return_value)
+        self.assertIsNone(locked)
+
+        # The python_requires are locked, without remotes
+        remotes, locked = self._load(self._app())
+        self.assertIsInstance(remotes, Remotes)
+        self.assertEqual(locked, [self.base_ref])
+
+        # Expired
+        app = self._app()
+        remotes, locked = self._load(app, ttl=0)
+        self.assertIs(remotes, app.cache.registry.load_remotes.return_value)
+        self.assertIsNone(locked)
+
+    def test_removed_from_local_cache(self):
+        self._load(self._app())
+        os.rmdir(self.base_folder)
+        app = self._app()
+        self.assertEqual(self._load(app)[1], None)
+        self.assertEqual(app.loader.load_named.call_count, 1)
+
+    def test_locked_load_fails(self):
+        self._load(self._app())
+        app = self._app()
+        app.loader.load_named.side_effect = [ConanException("not found"), mock.DEFAULT]
+        remotes, locked = self._load(app)
+        self.assertIs(remotes, app.cache.registry.load_remotes.return_value)
+        self.assertEqual(app.loader.load_named.call_count, 2)
+
+    def test_offline(self):
+        app = self._app()
+        remotes, _ = self._load(app, offline=True)
+        self.assertIsInstance(remotes, Remotes)
+        self.assertFalse(app.cache.registry.load_remotes.called)
+
+        # Expired entries are used in offline mode
+        remotes, locked = self._load(self._app(), ttl=0, offline=True)
+        self.assertEqual(locked, [self.base_ref])
+
+        app = self._app()
+        app.loader.load_named.side_effect = ConanException("not found")
+        with self.assertRaisesRegexp(ConanException, "not found"):
+            self._load(app, offline=True)
+
+    def test_packager_opt_in(self):
+        def packager(**kwargs):
+            return ConanMultiPackager(username="lasote", channel="mychannel",
+                                      runner=MockRunner(), conan_api=MockConanAPI(),
+                                      reference="lib/1.0", ci_manager=MockCIManager(),
+                                      out=lambda x: None, **kwargs)
+
+        with tools.environment_append({"CPT_PYTHON_REQUIRES_CACHE": None,
+                                       "CPT_PYTHON_REQUIRES_OFFLINE": None}):
+            self.assertIsNone(packager().python_requires_cache)
+            self.assertIsInstance(packager(python_requires_offline=True).python_requires_cache,
+                                  PythonRequiresCache)
+        path = os.path.join(temp_folder(), "python_requires.json")
+        with tools.environment_append({"CPT_PYTHON_REQUIRES_CACHE": path}):
+            self.assertIsInstance(packager().python_requires_cache, PythonRequiresCache)
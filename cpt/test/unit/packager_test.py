@@ -93,6 +93,44 @@ class AppTest(unittest.TestCase):
             else:
                 self.assertEqual(options, {"foo:bar": True})
 
+    def test_update_build_if_reference(self):
+        self.packager.add({"os": "Windows"})
+        self.packager.add({"os": "Linux"})
+        self.packager.update_build_if(lambda build: build.settings["os"] == "Windows",
+                                      new_reference=ConanFileReference.loads("lib/2.0@user/channel"))
+        self.assertEqual([str(build.reference) for build in self.packager.items],
+                         ["lib/2.0@user/channel", "lib/1.0@lasote/mychannel"])
+
+    def test_immutable_hashable_builds(self):
+        self.packager.add({"os": "Windows"}, {"lib:shared": True}, {}, {"*": ["7zip/19.00"]})
+        self.packager.add({"os": "Linux"}, {"lib:shared": True})
+        self.packager.add({"os": "Windows"}, {"lib:shared": True}, {}, {"*": ["7zip/19.00"]})
+        windows, linux, windows2 = self.packager.items
+
+        self.assertIs(windows.options, linux.options)
+        self.assertEqual(hash(windows), hash(windows2))
+        self.assertEqual(len(set(self.packager.items)), 2)
+        with self.assertRaisesRegexp(TypeError, "immutable"):
+            windows.settings["os"] = "Macos"
+        with self.assertRaisesRegexp(TypeError, "immutable"):
+            windows.options.update({"lib:shared": False})
+
+        self.packager.remove_duplicated_builds()
+        self.assertEqual(self.packager.items, [windows, linux])
+
+    def test_shared_maps_keep_the_types(self):
+        self.packager.add({"os": "Windows"}, {"lib:opt": True})
+        self.packager.add({"os": "Linux"}, {"lib:opt": 1})
+        self.packager.add({"os": "Macos"}, {"lib:opt": 9.0}, {}, {"*": [9]})
+        self.packager.add({"os": "Macos"}, {"lib:opt": 9}, {}, {"*": [9.0]})
+        true, one, float_nine, nine = self.packager.items
+        self.assertIs(true.options["lib:opt"], True)
+        self.assertEqual(type(one.options["lib:opt"]), int)
+        self.assertEqual(type(float_nine.options["lib:opt"]), float)
+        self.assertEqual(type(nine.options["lib:opt"]), int)
+        self.assertEqual(type(float_nine.build_requires["*"][0]), int)
+        self.assertEqual(type(nine.build_requires["*"][0]), float)
+
     def test_full_profile(self):
         self.packager.add({"os": "Windows", "compiler": "gcc"},
                           {"option1": "One"},
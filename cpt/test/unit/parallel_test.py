@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import unittest
+
+import mock
+
+from conans import tools
+from conans.model.ref import ConanFileReference
+
+from cpt.packager import ConanMultiPackager
+from cpt.parallel import get_container_resources, get_parallel_jobs, run_in_pool
+from cpt.printer import Printer
+from cpt.runner import SubprocessCreateRunner
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+from cpt.test.utils.test_files import temp_folder
+
+
+class FakeOutputRunner(object):
+    calls = []
+    lock = threading.Lock()
+
+    def __init__(self, prefix, output=None, env=None, cwd=None):
+        self.prefix = prefix
+        self.env = env
+
+    def __call__(self, command):
+        with self.lock:
+            FakeOutputRunner.calls.append((self.prefix, self.env))
+        if "os=Fail" in self.env["CPT_PROFILE"]:
+            return 1
+        with open(self.env["CPT_RESULTS_FILE"], "w") as results_file:
+            json.dump({"prefix": self.prefix}, results_file)
+        return 0
+
+
+class ParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeOutputRunner.calls = []
+
+    def test_parallel_jobs_value(self):
+        self.assertEqual(get_parallel_jobs(None), 1)
+        self.assertEqual(get_parallel_jobs(""), 1)
+        self.assertEqual(get_parallel_jobs("0"), 1)
+        self.assertEqual(get_parallel_jobs("4"), 4)
+        self.assertEqual(get_parallel_jobs(3), 3)
+        self.assertGreaterEqual(get_parallel_jobs("auto"), 1)
+        with self.assertRaisesRegexp(Exception, "Invalid number of parallel jobs"):
+            get_parallel_jobs("many")
+
+    def test_run_in_pool_keeps_order_and_errors(self):
+        def square(value):
+            if value == 3:
+                raise Exception("three")
+            return value * value
+
+        outcomes = run_in_pool(square, range(6), 3)
+        self.assertEqual([result for result, _ in outcomes], [0, 1, 4, None, 16, 25])
+        self.assertEqual(str(outcomes[3][1]), "three")
+        self.assertEqual(run_in_pool(square, [], 3), [])
+
+    def test_subprocess_runner(self):
+        seed = temp_folder()
+        tools.save(os.path.join(seed, "profiles", "default"), "[settings]\n")
+        tools.save(os.path.join(seed, "remotes.json"), "{}")
+        tools.save(os.path.join(seed, "conan.conf"), "[general]\nrevisions_enabled = 1\n")
+        tools.save(os.path.join(seed, "hooks", "my_hook.py"), "")
+        conan_home = os.path.join(temp_folder(), "worker0")
+        runner = SubprocessCreateRunner("[settings]\nos=Linux", "", "default",
+                                        ConanFileReference.loads("lib/1.0@user/channel"),
+                                        seed_conan_folder=seed, download_cache="/cache",
+                                        prefix="1/1", printer=Printer(lambda x: None),
+                                        output_runner_factory=FakeOutputRunner)
+        runner.run(conan_home)
+
+        self.assertEqual(runner.results, {"prefix": "1/1"})
+        self.assertTrue(os.path.exists(os.path.join(conan_home, ".conan", "profiles", "default")))
+        self.assertTrue(os.path.exists(os.path.join(conan_home, ".conan", "remotes.json")))
+        # The Conan settings of the main cache reach the worker
+        self.assertIn("revisions_enabled = 1",
+                      tools.load(os.path.join(conan_home, ".conan", "conan.conf")))
+        self.assertTrue(os.path.exists(os.path.join(conan_home, ".conan", "hooks", "my_hook.py")))
+        _, env = FakeOutputRunner.calls[0]
+        self.assertEqual(env["CONAN_USER_HOME"], conan_home)
+        self.assertEqual(env["CPT_DOWNLOAD_CACHE"], "/cache")
+        self.assertEqual(env["CONAN_REFERENCE"], "lib/1.0@user/channel")
+        self.assertIn("os=Linux", env["CPT_PROFILE"])
+
+    def test_packager_parallel_builds(self):
+        packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                      runner=MockRunner(), conan_api=MockConanAPI(),
+                                      reference="lib/1.0", ci_manager=MockCIManager(),
+                                      parallel_jobs=2, out=lambda x: None)
+        for index in range(5):
+            packager.add({"os": "os%s" % index})
+
+        with mock.patch("cpt.runner.PrefixedOutputRunner", FakeOutputRunner):
+            packager.run_builds(1, 1)
+
+        self.assertEqual(len(FakeOutputRunner.calls), 5)
+        homes = set(env["CONAN_USER_HOME"] for _, env in FakeOutputRunner.calls)
+        self.assertEqual(len(homes), 2)
+        self.assertEqual([summary["package"]["prefix"] for summary in packager.packages_summary],
+                         ["1/5", "2/5", "3/5", "4/5", "5/5"])
+        self.assertEqual([summary["configuration"].settings["os"]
+                          for summary in packager.packages_summary],
+                         ["os0", "os1", "os2", "os3", "os4"])
+
+    def test_packager_parallel_failures_collected(self):
+        with tools.environment_append({"CPT_PARALLEL_JOBS": "3"}):
+            packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                          runner=MockRunner(), conan_api=MockConanAPI(),
+                                          reference="lib/1.0", ci_manager=MockCIManager(),
+                                          out=lambda x: None)
+        self.assertEqual(packager.parallel_jobs, 3)
+        packager.add({"os": "Linux"})
+        packager.add({"os": "Fail"})
+        packager.add({"os": "Macos"})
+
+        with mock.patch("cpt.runner.PrefixedOutputRunner", FakeOutputRunner):
+            with self.assertRaisesRegexp(Exception, "1 of 3 parallel builds failed"):
+                packager.run_builds(1, 1)
+
+        self.assertEqual(len(FakeOutputRunner.calls), 3)
+        self.assertEqual([summary["configuration"].settings["os"]
+                          for summary in packager.packages_summary], ["Linux", "Macos"])
+
+    def test_container_resources(self):
+        options = get_container_resources(2)
+        self.assertIn("--cpus=", options)
+        self.assertNotIn("--cpus=", get_container_resources(2, "--cpus=3 --network=host"))
+        with mock.patch("cpt.parallel.get_host_memory", return_value=8 * 1024 * 1024 * 1024):
+            self.assertIn("--memory=2048m", get_container_resources(4))
+            self.assertNotIn("--memory", get_container_resources(4, "--memory=1g"))
+
+    def test_packager_parallel_docker_builds(self):
+        class FailingRunner(MockRunner):
+            def __call__(self, command):
+                super(FailingRunner, self).__call__(command)
+                return 1 if "docker run --rm" in command and "os=os2" in command else 0
+
+        runner = FailingRunner()
+        packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                      runner=runner, conan_api=MockConanAPI(),
+                                      reference="lib/1.0", ci_manager=MockCIManager(),
+                                      gcc_versions=["5"], clang_versions=["3.9"],
+                                      use_docker=True, parallel_jobs=2, out=lambda x: None)
+        packager.add({"os": "os1", "compiler": "gcc", "compiler.version": "5"})
+        packager.add({"os": "os2", "compiler": "clang", "compiler.version": "3.9"})
+        packager.add({"os": "os3", "compiler": "gcc", "compiler.version": "5"})
+        packager.add({"os": "os4", "compiler": "clang", "compiler.version": "3.9"})
+
+        with self.assertRaisesRegexp(Exception, "1 of 4 parallel builds failed"):
+            packager.run_builds(1, 1)
+
+        pulls = [call for call in runner.calls if "docker pull" in call]
+        self.assertEqual(len(pulls), 2)
+        self.assertIn("conanio/gcc5", pulls[0])
+        self.assertIn("conanio/clang39", pulls[1])
+        builds = [call for call in runner.calls if "docker run --rm" in call]
+        self.assertEqual(len(builds), 4)
+        for call in builds:
+            self.assertIn("--cpus=", call)
+        # All images are ready before the first build starts
+        self.assertGreater(runner.calls.index(builds[0]), runner.calls.index(pulls[1]))
@@ -0,0 +1,122 @@
+import json
+import os
+import unittest
+
+from conans import tools
+from conans.model.ref import ConanFileReference
+from conans.test.utils.test_files import temp_folder
+
+from cpt.builds_generator import BuildConf
+from cpt.plan import BuildPlan
+from cpt.packager import ConanMultiPackager
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+
+
+class BuildPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_folder = temp_folder()
+        self.plan_path = os.path.join(self.tmp_folder, "plan.json")
+
+    def _packager(self, **kwargs):
+        return ConanMultiPackager(username="lasote", channel="mychannel", runner=MockRunner(),
+                                  conan_api=MockConanAPI(), reference="lib/1.0",
+                                  ci_manager=MockCIManager(), gcc_versions=["6", "7"],
+                                  archs=["x86", "x86_64"], platform_info=_linux(),
+                                  cwd=self.tmp_folder, out=lambda x: None, **kwargs)
+
+    def test_save_load(self):
+        mingw = ConanFileReference.loads("mingw-w64/8.1")
+        builds = [BuildConf({"arch": "x86", "build_type": "Release"}, {"lib:shared": True}, {},
+                            {"*": [mingw]}, "lib/1.0@user/channel"),
+                  BuildConf({"arch": "x86", "build_type": "Debug"}, {"lib:shared": True}, {},
+                            {}, None)]
+        plan = BuildPlan(2, "hash")
+        plan.add(builds[0], 1, [(builds[1], "pid")])
+        plan.add(builds[1], 2)
+        plan.save(self.plan_path)
+
+        loaded = BuildPlan.load(self.plan_path)
+        self.assertEqual(loaded.total_pages, 2)
+        self.assertEqual(loaded.recipe_hash, "hash")
+        self.assertEqual(loaded.pages, [1, 2])
+        page_builds, duplicates = loaded.page(1)
+        self.assertEqual(page_builds[0].content_hash(), builds[0].content_hash())
+        self.assertEqual(page_builds[0].reference, builds[0].reference)
+        self.assertEqual(duplicates, [{"configuration": builds[1], "package": None,
+                                       "status": "duplicate", "package_id": "pid",
+                                       "duplicate_of": page_builds[0]}])
+        self.assertEqual(loaded.page(2), ([builds[1]], []))
+        # Equal options are stored once
+        with open(self.plan_path) as plan_file:
+            self.assertEqual(len(json.load(plan_file)["tables"]["options"]), 1)
+
+    def test_values_of_different_types(self):
+        builds = [BuildConf({"arch": "x86"}, {"lib:shared": True}, {}, {}, None),
+                  BuildConf({"arch": "x86"}, {"lib:shared": 1}, {}, {}, None)]
+        plan = BuildPlan(1)
+        for build in builds:
+            plan.add(build, 1)
+        plan.save(self.plan_path)
+
+        page_builds, _ = BuildPlan.load(self.plan_path).page(1)
+        self.assertEqual([build.content_hash() for build in page_builds],
+                         [build.content_hash() for build in builds])
+        self.assertIs(page_builds[0].options["lib:shared"], True)
+        self.assertEqual(type(page_builds[1].options["lib:shared"]), int)
+
+    def test_corrupted(self):
+        plan = BuildPlan(1)
+        plan.add(BuildConf({"arch": "x86"}, {}, {}, {}, None), 1)
+        plan.save(self.plan_path)
+        with open(self.plan_path) as plan_file:
+            contents = json.load(plan_file)
+        contents["tables"]["settings"][0]["arch"] = "armv8"
+        with open(self.plan_path, "w") as plan_file:
+            json.dump(contents, plan_file)
+        with self.assertRaisesRegexp(Exception, "The build plan is corrupted"):
+            BuildPlan.load(self.plan_path).page(1)
+
+    def test_pages_from_plan(self):
+        expected = []
+        for page in (1, 2, 3):
+            packager = self._packager()
+            packager.add_common_builds(pure_c=False)
+            packager.run_builds(page, 3)
+            expected.append(packager.builds_in_current_page)
+
+        with tools.environment_append({"CPT_BUILD_PLAN": self.plan_path,
+                                       "CPT_PLAN_ONLY": "1", "CONAN_TOTAL_PAGES": "3"}):
+            packager = self._packager()
+            packager.add_common_builds(pure_c=False)
+            packager.run()
+        self.assertEqual(packager.builds_in_current_page, [])
+
+        for page in (1, 2, 3):
+            packager = self._packager(build_plan=self.plan_path)
+            packager.add_common_builds(pure_c=False)
+            self.assertEqual(packager.items, [])
+            packager.run_builds(page, 3)
+            self.assertEqual(packager.builds_in_current_page, expected[page - 1])
+
+        packager = self._packager(build_plan=self.plan_path)
+        with self.assertRaisesRegexp(Exception, "has 3 pages, not 2"):
+            packager.run_builds(1, 2)
+
+    def test_stale_plan(self):
+        conanfile = os.path.join(self.tmp_folder, "conanfile.py")
+        tools.save(conanfile, "# recipe")
+        packager = self._packager()
+        packager.add({"arch": "x86"})
+        packager.save_build_plan(self.plan_path, total_pages=1)
+        tools.save(conanfile, "# changed recipe")
+        packager = self._packager(build_plan=self.plan_path)
+        with self.assertRaisesRegexp(Exception, "generated for a different recipe"):
+            packager.run_builds(1, 1)
+
+
+def _linux():
+    class PlatformInfoMock(object):
+        def system(self):
+            return "Linux"
+    return PlatformInfoMock()
@@ -0,0 +1,74 @@
+import unittest
+from itertools import combinations
+
+from conans import tools
+
+from cpt.builds_generator import get_linux_gcc_builds
+from cpt.packager import ConanMultiPackager
+from cpt.sampling import covering_sample, get_sampling_strength
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+
+
+def _values(build):
+    values = dict(build.settings)
+    values.update(build.options)
+    return values
+
+
+def _combinations(builds, strength):
+    result = set()
+    for build in builds:
+        values = sorted((name, str(value)) for name, value in _values(build).items())
+        result.update(combinations(values, strength))
+    return result
+
+
+class SamplingTest(unittest.TestCase):
+
+    def _builds(self):
+        return get_linux_gcc_builds(["5", "7", "9", "11"], ["x86", "x86_64", "armv8"],
+                                    "lib:shared", False, ["Release", "Debug"], ["14", "17"], {})
+
+    def test_pairwise_covers_all_pairs(self):
+        builds = self._builds()
+        sample = covering_sample(builds, 2)
+        self.assertLess(len(sample), len(builds) / 5)
+        self.assertEqual(_combinations(sample, 2), _combinations(builds, 2))
+        # Deterministic, and in the order of the matrix
+        self.assertEqual(sample, covering_sample(builds, 2))
+        self.assertEqual(sample, [build for build in builds if build in sample])
+
+        sample_3 = covering_sample(builds, 3)
+        self.assertGreater(len(sample_3), len(sample))
+        self.assertEqual(_combinations(sample_3, 3), _combinations(builds, 3))
+
+    def test_strength(self):
+        self.assertIsNone(get_sampling_strength(None))
+        self.assertIsNone(get_sampling_strength("all"))
+        self.assertEqual(get_sampling_strength("pairwise"), 2)
+        self.assertEqual(get_sampling_strength("3-wise"), 3)
+        self.assertEqual(get_sampling_strength(4), 4)
+        with self.assertRaisesRegexp(Exception, "Invalid matrix sampling"):
+            get_sampling_strength("random")
+        builds = self._builds()[:2]
+        self.assertEqual(covering_sample(builds, 5), builds)
+        self.assertEqual(covering_sample(builds[:1] * 3, 2), builds[:1])
+        self.assertEqual(covering_sample([], 2), [])
+
+    def test_pages_agree_on_sample(self):
+        expected = covering_sample(self._builds(), 2)
+        pages = []
+        for page in (1, 2):
+            with tools.environment_append({"CPT_MATRIX_SAMPLING": "pairwise"}):
+                packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                              runner=MockRunner(), conan_api=MockConanAPI(),
+                                              reference="lib/1.0", ci_manager=MockCIManager(),
+                                              out=lambda x: None)
+            for build in self._builds():
+                packager.add(dict(build.settings), dict(build.options))
+            packager.run_builds(page, 2)
+            pages.append([(build.settings, build.options)
+                          for build in packager.builds_in_current_page])
+        self.assertEqual(len(pages[0]) + len(pages[1]), len(expected))
+        self.assertEqual(sorted(pages[0] + pages[1], key=str),
+                         sorted([(build.settings, build.options) for build in expected], key=str))
@@ -0,0 +1,74 @@
+import json
+import os
+import unittest
+
+from conans import tools
+
+from cpt.builds_generator import BuildConf
+from cpt.packager import ConanMultiPackager
+from cpt.scheduler import assign_pages, estimate_duration, get_build_durations, \
+    load_recorded_durations
+from cpt.test.unit.utils import MockConanAPI, MockRunner, MockCIManager
+from cpt.test.utils.test_files import temp_folder
+
+
+def _build(build_type="Release", compiler="gcc", version="9"):
+    return BuildConf({"build_type": build_type, "compiler": compiler,
+                      "compiler.version": version}, {}, {}, {}, "lib/1.0@user/channel")
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_uniform_durations_match_sequential(self):
+        self.assertEqual(assign_pages([1.0] * 7, 3), [1, 2, 3, 1, 2, 3, 1])
+
+    def test_longest_first(self):
+        pages = assign_pages([90, 5, 5, 5, 40, 40, 5], 2)
+        self.assertEqual(pages, [1, 2, 2, 1, 2, 2, 2])
+        loads = [sum(d for d, p in zip([90, 5, 5, 5, 40, 40, 5], pages) if p == page)
+                 for page in (1, 2)]
+        self.assertEqual(loads, [95, 95])
+
+    def test_deterministic(self):
+        durations = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5]
+        self.assertEqual(assign_pages(durations, 4), assign_pages(list(durations), 4))
+        self.assertEqual(sorted(set(assign_pages(durations, 4))), [1, 2, 3, 4])
+
+    def test_content_hash(self):
+        self.assertEqual(_build().content_hash(), _build().content_hash())
+        self.assertNotEqual(_build().content_hash(), _build("Debug").content_hash())
+
+    def test_durations(self):
+        release, debug = _build(), _build("Debug")
+        self.assertGreater(estimate_duration(debug), estimate_duration(release))
+        # Estimations are scaled to the recorded data
+        durations = get_build_durations([release, debug], {release.content_hash(): 100})
+        self.assertEqual(durations, [100, 150])
+
+        folder = temp_folder()
+        path = os.path.join(folder, "durations.json")
+        tools.save(path, json.dumps({debug.content_hash(): 30}))
+        self.assertEqual(load_recorded_durations(path), {debug.content_hash(): 30.0})
+        self.assertEqual(load_recorded_durations(os.path.join(folder, "missing")), {})
+
+    def test_packager_duration_pagination(self):
+        builds = [_build(version="5"), _build(version="6"), _build(version="7"),
+                  _build("Debug", "clang", "13")]
+        recorded = {builds[3].content_hash(): 600, builds[0].content_hash(): 60,
+                    builds[1].content_hash(): 60, builds[2].content_hash(): 60}
+        conan_api = MockConanAPI()
+        with tools.environment_append({"CPT_PAGINATION": "duration"}):
+            packager = ConanMultiPackager(username="lasote", channel="mychannel",
+                                          runner=MockRunner(), conan_api=conan_api,
+                                          reference="lib/1.0", ci_manager=MockCIManager(),
+                                          build_durations=recorded, out=lambda x: None)
+        packager.items = builds
+        packager.run_builds(1, 2)
+        self.assertEqual(packager.builds_in_current_page, [builds[3]])
+        packager.run_builds(2, 2)
+        self.assertEqual(packager.builds_in_current_page, builds[:3])
+
+        with self.assertRaisesRegexp(Exception, "Invalid pagination"):
+            ConanMultiPackager(username="lasote", channel="mychannel", runner=MockRunner(),
+                               conan_api=conan_api, reference="lib/1.0",
+                               ci_manager=MockCIManager(), pagination="random")
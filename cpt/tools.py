@@ -28,3 +28,36 @@ def transform_list_options_to_dict(list_options):
         option_obj = option.split('=')
         dict_options[option_obj[0]] = option_obj[1]
     return dict_options
+
+
+def autodetect_docker_base_image(compiler_name, compiler_version):
+    if compiler_name not in ["clang", "gcc"]:
+        raise Exception("Docker image cannot be autodetected for "
+                        "the compiler %s" % compiler_name)
+
+    from conans.model.version import Version  # Imports the Conan API, only when needed
+    if compiler_name == "gcc" and Version(compiler_version) > Version("5"):
+        compiler_version = Version(compiler_version).major(fill=False)
+
+    return "conanio/%s%s" % (compiler_name, compiler_version.replace(".", ""))
+
+
+def get_docker_image(build, docker_image=None, docker_32_images=False):
+    """ Docker image building the configuration, 'docker_image' or the conanio image of the
+    compiler, with the suffix of the architecture"""
+    if not docker_image:
+        compiler_name = build.settings.get("compiler", "")
+        compiler_version = build.settings.get("compiler.version", "")
+        docker_image = autodetect_docker_base_image(compiler_name, compiler_version)
+
+    arch = build.settings.get("arch", "") or build.settings.get("arch_build", "")
+    if docker_32_images and arch == "x86":
+        docker_arch_suffix = "x86"
+    elif arch != "x86" and arch != "x86_64":
+        docker_arch_suffix = arch
+    else:
+        docker_arch_suffix = None
+    if docker_arch_suffix and "-" not in docker_image:
+        docker_image = "%s-%s" % (docker_image, docker_arch_suffix)
+
+    return docker_image
@@ -1,7 +1,4 @@
-from conans.model.version import Version
-from conans.client.cmd.uploader import UPLOAD_POLICY_FORCE
-
-from cpt import get_client_version
+from cpt.compat import get_compat
 
 
 class Uploader(object):
@@ -23,7 +20,6 @@ class Uploader(object):
         self._upload_artifacts(reference, upload, package_id)
 
     def _upload_artifacts(self, reference, upload, package_id=None):
-        client_version = get_client_version()
         remote_name = self.remote_manager.upload_remote_name
         if not remote_name:
             self.printer.print_message("Upload skipped, not upload remote available")
@@ -37,23 +33,5 @@ class Uploader(object):
             self.printer.print_message("Uploading packages for '%s'" % str(reference))
             self.auth_manager.login(remote_name)
 
-            if client_version < Version("1.7.0"):
-                self.conan_api.upload(str(reference),
-                                      package=package_id,
-                                      remote=remote_name,
-                                      force=self._force,
-                                      retry=int(self._upload_retry))
-            elif client_version < Version("1.8.0"):
-                self.conan_api.upload(str(reference),
-                                      package=package_id,
-                                      remote_name=remote_name,
-                                      force=self._force,
-                                      retry=int(self._upload_retry))
-            else:
-                all_packages = package_id != None
-                policy = UPLOAD_POLICY_FORCE if self._force else None
-                self.conan_api.upload(str(reference),
-                                      all_packages=all_packages,
-                                      remote_name=remote_name,
-                                      policy=policy,
-                                      retry=int(self._upload_retry))
+            get_compat().upload(self.conan_api, reference, package_id, remote_name,
+                                self._force, int(self._upload_retry))
@@ -108,6 +108,7 @@ setup(
     entry_points={
         'console_scripts': [
             'run_create_in_docker=cpt.run_in_docker:run',
+            'cpt-matrix=cpt.inspect_matrix:run',
         ],
     },
 )